@@ -0,0 +1,116 @@
+import argparse
+import logging
+import multiprocessing
+import time
+import torch
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.train.model.atom_attention_encoder import AtomAttentionEncoder
+from nanofold.train.model.atom_transformer import AtomTransformer
+
+MODULES = ["atom_transformer", "atom_attention_encoder"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-L", "--num-residues", help="Crop sizes to benchmark", type=int, action="append"
+    )
+    parser.add_argument(
+        "--module", help="Atom module to benchmark", choices=MODULES, action="append"
+    )
+    parser.add_argument("-b", "--diffusion-batch-size", type=int, default=4)
+    parser.add_argument("--atom-embedding-size", type=int, default=128)
+    parser.add_argument("--atom-pair-embedding-size", type=int, default=16)
+    parser.add_argument("--token-embedding-size", type=int, default=768)
+    parser.add_argument("--single-embedding-size", type=int, default=384)
+    parser.add_argument("--pair-embedding-size", type=int, default=128)
+    parser.add_argument("--num-blocks", type=int, default=3)
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--num-queries", type=int, default=32)
+    parser.add_argument("--num-keys", type=int, default=128)
+    parser.add_argument("--backward", help="Include the backward pass", action="store_true")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def build_inputs(args, name, model, num_residues):
+    num_atoms = 3 * num_residues
+    if name == "atom_transformer":
+        q = torch.rand(
+            args.diffusion_batch_size, num_atoms, args.atom_embedding_size, device=args.device
+        )
+        c = torch.rand(1, num_atoms, args.atom_embedding_size, device=args.device)
+        query_index, key_index, _ = model.windows(num_atoms, args.device)
+        pair_rep = torch.rand(
+            1,
+            *query_index.shape,
+            key_index.size(-1),
+            args.atom_pair_embedding_size,
+            device=args.device,
+        )
+        return q.requires_grad_(args.backward), c, pair_rep
+    ref_pos = torch.rand(num_atoms, 3, device=args.device)
+    ref_space_uid = torch.arange(num_atoms, device=args.device) // 3
+    r = torch.rand(args.diffusion_batch_size, num_atoms, 3, device=args.device)
+    s = torch.rand(num_residues, args.single_embedding_size, device=args.device)
+    z = torch.rand(num_residues, num_residues, 2 * args.pair_embedding_size, device=args.device)
+    return ref_pos, ref_space_uid, r.requires_grad_(args.backward), s, z
+
+
+def build_module(args, name):
+    if name == "atom_transformer":
+        return AtomTransformer(
+            args.atom_embedding_size,
+            args.atom_embedding_size,
+            args.atom_pair_embedding_size,
+            args.num_blocks,
+            args.num_heads,
+            args.num_queries,
+            args.num_keys,
+        )
+    return AtomAttentionEncoder(
+        args.atom_embedding_size,
+        args.atom_pair_embedding_size,
+        args.token_embedding_size,
+        args.single_embedding_size,
+        2 * args.pair_embedding_size,
+        args.num_blocks,
+        args.num_heads,
+        args.num_queries,
+        args.num_keys,
+    )
+
+
+def run(args, name, num_residues):
+    torch.manual_seed(0)
+    model = build_module(args, name).to(args.device)
+    inputs = build_inputs(args, name, model, num_residues)
+    baseline = reset_peak_memory(args.device)
+    start = time.perf_counter()
+    with torch.set_grad_enabled(args.backward):
+        out = model(*inputs)
+        if args.backward:
+            (out if name == "atom_transformer" else out[0]).sum().backward()
+    peak = get_peak_memory(args.device) - baseline
+    return time.perf_counter() - start, peak / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in args.module or MODULES:
+            for num_residues in args.num_residues or [128, 256, 384, 768]:
+                elapsed, peak = pool.apply(run, (args, name, num_residues))
+                logging.info(
+                    f"{name}, L {num_residues}, {3 * num_residues} atoms: "
+                    f"{1000 * elapsed:.0f} ms, peak {peak:.0f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
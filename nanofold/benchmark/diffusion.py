@@ -0,0 +1,83 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.common.residue_definitions import RESIDUE_INDEX
+from nanofold.predict.features import featurize
+from nanofold.predict.features import get_single_sequence_msa_features
+from nanofold.train.model import Nanofold
+from nanofold.train.trainer import load_batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file of the model", type=Path)
+    parser.add_argument(
+        "-L", "--num-residues", help="Chain lengths to benchmark", type=int, action="append"
+    )
+    parser.add_argument("--steps", help="Override the number of diffusion steps", type=int)
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def run(params, num_residues, cache_step_invariant):
+    device = params["device"]
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sequence = "".join(np.random.choice(list(RESIDUE_INDEX.keys()), num_residues))
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), params["num_msa"])
+    features = load_batch(features, device)
+    model = Nanofold(**Nanofold.get_args(params), inference=True).to(device)
+    model.eval()
+    model.diffusion_model.cache_step_invariant = cache_step_invariant
+    with torch.no_grad(), torch.autocast(
+        device, enabled=params["use_amp"] and device == "cuda", dtype=torch.bfloat16
+    ):
+        input, single_rep, pair_rep = model.run_trunk(features)
+        baseline = reset_peak_memory(device)
+        torch.manual_seed(1)
+        start = time.perf_counter()
+        coords = model.diffusion_model(features, input, single_rep, pair_rep)
+        if device == "cuda":
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+    peak = get_peak_memory(device) - baseline
+    return elapsed, peak / 1024**2, coords.float().cpu().numpy()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    if args.steps is not None:
+        params["diffusion_steps"] = args.steps
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for num_residues in args.num_residues or [64, 128, 256]:
+            results = {
+                cache_step_invariant: pool.apply(run, (params, num_residues, cache_step_invariant))
+                for cache_step_invariant in [False, True]
+            }
+            max_diff = np.abs(results[False][2] - results[True][2]).max()
+            for cache_step_invariant, (elapsed, peak, _) in results.items():
+                logging.info(
+                    f"L {num_residues}, cache_step_invariant {cache_step_invariant}: "
+                    f"{1000 * elapsed / params['diffusion_steps']:.1f} ms/step, "
+                    f"peak {peak:.0f} MB"
+                )
+            logging.info(f"L {num_residues}: max coordinate difference {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.common.residue_definitions import RESIDUE_INDEX
+from nanofold.predict.features import featurize
+from nanofold.predict.features import get_single_sequence_msa_features
+from nanofold.train.model import Nanofold
+from nanofold.train.trainer import load_batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file of the model", type=Path)
+    parser.add_argument(
+        "-L", "--num-residues", help="Crop sizes to benchmark", type=int, action="append"
+    )
+    parser.add_argument(
+        "-m", "--micro-batch-size", help="Micro batch sizes to compare", type=int, action="append"
+    )
+    parser.add_argument(
+        "-b", "--diffusion-batch-size", help="Override the diffusion batch size", type=int
+    )
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def run(params, num_residues, micro_batch_size):
+    device = params["device"]
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sequence = "".join(np.random.choice(list(RESIDUE_INDEX.keys()), num_residues))
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), params["num_msa"])
+    features["coords_truth"] = 10 * torch.randn(3 * num_residues, 3)
+    features = load_batch(features, device)
+    model = Nanofold.from_config(params | {"diffusion_micro_batch_size": micro_batch_size})
+    model = model.to(device)
+    with torch.no_grad():
+        trunk_out = [x.requires_grad_() for x in model.run_trunk(features)]
+    baseline = reset_peak_memory(device)
+    start = time.perf_counter()
+    with torch.autocast(
+        device, enabled=params["use_amp"] and device == "cuda", dtype=torch.bfloat16
+    ):
+        losses = model.diffusion_model(features, *trunk_out)
+    losses["diffusion_loss"].backward()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    peak = get_peak_memory(device) - baseline
+    return elapsed, peak / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    if args.diffusion_batch_size is not None:
+        params["diffusion_batch_size"] = args.diffusion_batch_size
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for num_residues in args.num_residues or [64, 128]:
+            for micro_batch_size in [None] + (args.micro_batch_size or [16, 4]):
+                elapsed, peak = pool.apply(run, (params, num_residues, micro_batch_size))
+                logging.info(
+                    f"L {num_residues}, diffusion batch size {params['diffusion_batch_size']}, "
+                    f"micro batch size {micro_batch_size}: "
+                    f"{1000 * elapsed:.0f} ms, peak {peak:.0f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
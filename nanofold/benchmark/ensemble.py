@@ -0,0 +1,83 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.common.residue_definitions import RESIDUE_INDEX
+from nanofold.predict.features import featurize
+from nanofold.predict.features import get_single_sequence_msa_features
+from nanofold.train.model import Nanofold
+from nanofold.train.trainer import load_batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file of the model", type=Path)
+    parser.add_argument(
+        "-L", "--num-residues", help="Chain lengths to benchmark", type=int, action="append"
+    )
+    parser.add_argument(
+        "-k", "--num-samples", help="Ensemble sizes to benchmark", type=int, action="append"
+    )
+    parser.add_argument("--steps", help="Override the number of diffusion steps", type=int)
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def run(params, num_residues, num_samples, batched):
+    device = params["device"]
+    np.random.seed(0)
+    torch.manual_seed(0)
+    sequence = "".join(np.random.choice(list(RESIDUE_INDEX.keys()), num_residues))
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), params["num_msa"])
+    features = load_batch(features, device)
+    model = Nanofold(**Nanofold.get_args(params), inference=True).to(device)
+    model.eval()
+    baseline = reset_peak_memory(device)
+    start = time.perf_counter()
+    with torch.no_grad(), torch.autocast(
+        device, enabled=params["use_amp"] and device == "cuda", dtype=torch.bfloat16
+    ):
+        if batched:
+            model.diffusion_model(features, *model.run_trunk(features), num_samples)
+        else:
+            for _ in range(num_samples):
+                model.diffusion_model(features, *model.run_trunk(features))
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    peak = get_peak_memory(device) - baseline
+    return elapsed, peak / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    if args.steps is not None:
+        params["diffusion_steps"] = args.steps
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for num_residues in args.num_residues or [64, 128]:
+            for num_samples in args.num_samples or [1, 5, 10]:
+                for batched in [False, True]:
+                    elapsed, peak = pool.apply(run, (params, num_residues, num_samples, batched))
+                    logging.info(
+                        f"L {num_residues}, {num_samples} samples, batched {batched}: "
+                        f"{elapsed:.2f} s, {num_samples / elapsed:.2f} samples/sec, "
+                        f"peak {peak:.0f} MB"
+                    )
+
+
+if __name__ == "__main__":
+    main()
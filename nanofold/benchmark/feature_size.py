@@ -0,0 +1,44 @@
+import argparse
+import logging
+import pyarrow as pa
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Input chain training data in Arrow IPC file format",
+        type=Path,
+        action="append",
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def get_column_sizes(features_file):
+    with pa.memory_map(str(features_file)) as source:
+        with pa.ipc.open_file(source) as reader:
+            table = reader.read_all()
+    return {name: table.column(name).nbytes for name in table.column_names}
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    for features_file in args.input:
+        sizes = get_column_sizes(features_file)
+        msa_size = sum(
+            size
+            for name, size in sizes.items()
+            if name.startswith(("msa", "has_deletion", "deletion_value", "deletion_count"))
+        )
+        for name, size in sizes.items():
+            logging.info(f"{features_file.name} {name}: {size / 1024**2:.2f} MB")
+        logging.info(f"{features_file.name} MSA columns: {msa_size / 1024**2:.2f} MB")
+        logging.info(f"{features_file.name} total: {sum(sizes.values()) / 1024**2:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
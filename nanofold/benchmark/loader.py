@@ -0,0 +1,96 @@
+import argparse
+import logging
+import numpy as np
+import os
+import time
+import torch
+from pathlib import Path
+
+from nanofold.train.chain_dataset import ChainDataset
+
+MODES = {
+    "list": {"zero_copy": False},
+    "zero_copy": {"zero_copy": True},
+    "lazy": {"zero_copy": True, "lazy": True},
+}
+RSS_FIELDS = ["VmRSS", "RssAnon", "RssFile"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--input", help="Input chain training data in Arrow IPC file format", type=Path
+    )
+    parser.add_argument(
+        "-n", "--num-samples", help="Number of samples to draw per mode", type=int, default=100
+    )
+    parser.add_argument("--crop-size", help="Residue crop size", type=int, default=384)
+    parser.add_argument("--num-msa", help="Number of MSA sequences", type=int, default=16384)
+    parser.add_argument(
+        "--mode", help="Sampling mode to benchmark", choices=MODES.keys(), action="append"
+    )
+    parser.add_argument(
+        "--workers", help="Report per worker RSS with this many DataLoader workers", type=int
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def samples_per_second(dataset, num_samples):
+    np.random.seed(0)
+    torch.manual_seed(0)
+    samples = iter(dataset)
+    next(samples)
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        next(samples)
+    return num_samples / (time.perf_counter() - start)
+
+
+def get_worker_rss():
+    rss = []
+    for status_file in Path("/proc").glob("[0-9]*/status"):
+        try:
+            lines = status_file.read_text().splitlines()
+        except OSError:
+            continue
+        status = dict(line.split(":", 1) for line in lines if ":" in line)
+        if int(status["PPid"]) == os.getpid():
+            rss.append([int(status[field].split()[0]) / 1024 for field in RSS_FIELDS])
+    return np.array(rss).mean(axis=0)
+
+
+def worker_rss(dataset, num_workers, num_samples):
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=num_workers)
+    samples = iter(loader)
+    next(samples)
+    before = get_worker_rss()
+    for _ in range(num_samples):
+        next(samples)
+    after = get_worker_rss()
+    del samples
+    return before, after
+
+
+def format_rss(rss):
+    return ", ".join(f"{field} {value:.0f} MB" for field, value in zip(RSS_FIELDS, rss))
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    for mode in args.mode or MODES.keys():
+        np.random.seed(0)
+        dataset, _ = ChainDataset.construct_datasets(
+            args.input, 1.0, args.crop_size, args.num_msa, **MODES[mode]
+        )
+        rate = samples_per_second(dataset, args.num_samples)
+        logging.info(f"{mode}: {rate:.2f} samples/sec")
+        if args.workers is not None:
+            before, after = worker_rss(dataset, args.workers, args.num_samples)
+            logging.info(f"{mode}: worker RSS before sampling {format_rss(before)}")
+            logging.info(f"{mode}: worker RSS after sampling {format_rss(after)}")
+
+
+if __name__ == "__main__":
+    main()
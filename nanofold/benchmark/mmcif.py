@@ -0,0 +1,45 @@
+import argparse
+import logging
+import time
+from pathlib import Path
+
+from nanofold.preprocess.mmcif_processor import MMCIF_PARSERS
+from nanofold.preprocess.mmcif_processor import list_available_mmcif
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--mmcif", help="Directory containing mmcif files", type=Path)
+    parser.add_argument(
+        "-r", "--repeats", help="Number of passes over the directory", type=int, default=5
+    )
+    parser.add_argument(
+        "-p", "--parser", help="Parsers to benchmark", choices=MMCIF_PARSERS.keys(), action="append"
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def run(parse_fn, files, repeats):
+    num_chains = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for f in files:
+            num_chains += len(parse_fn(f, capture_errors=True))
+    return time.perf_counter() - start, num_chains // repeats
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    files = list_available_mmcif(args.mmcif)
+    for name in args.parser or MMCIF_PARSERS.keys():
+        elapsed, num_chains = run(MMCIF_PARSERS[name], files, args.repeats)
+        logging.info(
+            f"{name}: {len(files)} files, {num_chains} chains, "
+            f"{args.repeats * len(files) / elapsed:.1f} files/sec"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import multiprocessing
+import time
+import torch
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.train.model.msa_averaging import MSAPairWeightedAveraging
+from nanofold.train.model.outer_product_mean import OuterProductMean
+
+MODULES = ["outer_product_mean", "msa_pair_weighted_averaging"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-S", "--num-msa", help="MSA depths to benchmark", type=int, action="append"
+    )
+    parser.add_argument("-L", "--num-residues", help="Crop size", type=int, default=96)
+    parser.add_argument(
+        "--module", help="MSA module to benchmark", choices=MODULES, action="append"
+    )
+    parser.add_argument(
+        "--chunk-size", help="MSA chunk sizes to compare", type=int, action="append"
+    )
+    parser.add_argument("--pair-embedding-size", type=int, default=64)
+    parser.add_argument("--msa-embedding-size", type=int, default=32)
+    parser.add_argument("--msa-averaging-embedding-size", type=int, default=16)
+    parser.add_argument("--product-embedding-size", type=int, default=16)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def build_module(args, name, chunk_size):
+    if name == "outer_product_mean":
+        return OuterProductMean(
+            args.pair_embedding_size,
+            args.msa_embedding_size,
+            args.product_embedding_size,
+            chunk_size,
+        )
+    return MSAPairWeightedAveraging(
+        args.msa_embedding_size,
+        args.msa_averaging_embedding_size,
+        args.pair_embedding_size,
+        args.num_heads,
+        chunk_size,
+    )
+
+
+def run(args, name, num_msa, chunk_size):
+    torch.manual_seed(0)
+    module = build_module(args, name, chunk_size).to(args.device)
+    L = args.num_residues
+    msa_rep = torch.rand(num_msa, L, args.msa_embedding_size, device=args.device)
+    pair_rep = torch.rand(L, L, args.pair_embedding_size, device=args.device)
+    inputs = (msa_rep,) if name == "outer_product_mean" else (msa_rep, pair_rep)
+    baseline = reset_peak_memory(args.device)
+    start = time.perf_counter()
+    with torch.no_grad():
+        module(*inputs)
+    peak = get_peak_memory(args.device) - baseline
+    return time.perf_counter() - start, peak / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in args.module or MODULES:
+            for num_msa in args.num_msa or [256, 1024, 4096]:
+                for chunk_size in [None] + (args.chunk_size or [64]):
+                    elapsed, peak = pool.apply(run, (args, name, num_msa, chunk_size))
+                    logging.info(
+                        f"{name}, S {num_msa}, chunk size {chunk_size}: "
+                        f"{num_msa / elapsed:.0f} sequences/sec, peak {peak:.0f} MB"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import logging
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.model import Nanofold
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file for training", type=Path)
+    parser.add_argument(
+        "-i", "--input", help="Input chain training data in Arrow IPC file format", type=Path
+    )
+    parser.add_argument("-n", "--num-steps", help="Number of steps to time", type=int, default=10)
+    parser.add_argument(
+        "--num-recycle", help="Recycling iterations to compare", type=int, action="append"
+    )
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument(
+        "--no-grad-checkpoint", help="Disable gradient checkpointing", action="store_true"
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+class SavedTensorCounter:
+    def __init__(self):
+        self.bytes = 0
+
+    def pack(self, tensor):
+        self.bytes += tensor.numel() * tensor.element_size()
+        return tensor
+
+    def unpack(self, tensor):
+        return tensor
+
+
+def benchmark(model, batches):
+    counter = SavedTensorCounter()
+    saved_bytes = []
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    for batch in batches:
+        counter.bytes = 0
+        with torch.autograd.graph.saved_tensors_hooks(counter.pack, counter.unpack):
+            out = model(batch)
+        out["total_loss"].backward()
+        model.zero_grad(set_to_none=True)
+        saved_bytes.append(counter.bytes)
+    elapsed = (time.perf_counter() - start) / len(batches)
+    return elapsed, max(saved_bytes) / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    if args.no_grad_checkpoint:
+        params["use_grad_checkpoint"] = False
+    np.random.seed(0)
+    dataset, _ = ChainDataset.construct_datasets(
+        args.input, 1.0, params["residue_crop_size"], params["num_msa"]
+    )
+    samples = iter(dataset)
+    batches = [
+        {k: v.to(params["device"]) for k, v in next(samples).items()} for _ in range(args.num_steps)
+    ]
+    for num_recycle in args.num_recycle or [1, 2, 3, 4]:
+        for detach_recycling in [False, True]:
+            torch.manual_seed(0)
+            model = Nanofold.from_config(
+                params | {"num_recycle": num_recycle, "detach_recycling": detach_recycling}
+            ).to(params["device"])
+            model.train()
+            elapsed, saved = benchmark(model, batches)
+            logging.info(
+                f"num_recycle {num_recycle}, detach_recycling {detach_recycling}: "
+                f"{1000 * elapsed:.0f} ms/step, {saved:.1f} MB saved for backward"
+            )
+
+
+if __name__ == "__main__":
+    main()
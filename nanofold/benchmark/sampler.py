@@ -0,0 +1,126 @@
+import argparse
+import json
+import logging
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.loss import compute_lddt_loss
+from nanofold.train.model import Nanofold
+from nanofold.train.trainer import load_batch
+from nanofold.train.util import rigid_align
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file of the model", type=Path)
+    parser.add_argument(
+        "-i", "--input", help="Input chain data in Arrow IPC file format", type=Path
+    )
+    parser.add_argument("--checkpoint", help="Checkpoint file to load", type=Path)
+    parser.add_argument(
+        "-n", "--num-chains", help="Number of held out chains to sample", type=int, default=8
+    )
+    parser.add_argument(
+        "--sampler",
+        help="Sampler and number of steps to compare, e.g. heun:20",
+        action="append",
+    )
+    parser.add_argument(
+        "--reference", help="Sampler and number of steps of the reference", default="edm:200"
+    )
+    parser.add_argument("--schedule", help="Override the configured noise schedule")
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def parse_sampler(value):
+    name, steps = value.split(":")
+    return name, int(steps)
+
+
+def rmsd(x, x_ref):
+    x = rigid_align(x, x_ref)
+    return torch.sqrt(((x - x_ref) ** 2).sum(dim=-1).mean()).item()
+
+
+def lddt(x, x_ref):
+    return 1 - compute_lddt_loss(x, x_ref).item()
+
+
+def sample(model, features, trunk_out, sampler, schedule, device):
+    name, steps = sampler
+    model.diffusion_model.configure_sampler(name, schedule, steps)
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    coords = model.diffusion_model(features, *trunk_out)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return coords.float(), time.perf_counter() - start
+
+
+@torch.no_grad()
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    device = params["device"]
+    schedule = args.schedule or params.get("diffusion_schedule", "karras")
+    reference = parse_sampler(args.reference)
+    samplers = [parse_sampler(s) for s in args.sampler or ["heun:10", "heun:20", "heun:50"]]
+
+    np.random.seed(0)
+    torch.manual_seed(0)
+    _, test_set = ChainDataset.construct_datasets(
+        args.input, params["train_split"], params["residue_crop_size"], params["num_msa"]
+    )
+    model = Nanofold(**Nanofold.get_args(params), inference=True)
+    if args.checkpoint is not None:
+        model.load_state_dict(torch.load(args.checkpoint, map_location="cpu")["model"])
+    else:
+        logging.warning("No checkpoint given, sampling with randomly initialised weights")
+    model = model.to(device)
+    model.eval()
+
+    results = {s: [] for s in [reference] + samplers}
+    chains = iter(test_set)
+    for _ in range(args.num_chains):
+        features = load_batch(next(chains), device)
+        coords_truth = features["coords_truth"].float()
+        with torch.autocast(
+            device, enabled=params["use_amp"] and device == "cuda", dtype=torch.bfloat16
+        ):
+            trunk_out = model.run_trunk(features)
+            x_ref, elapsed = sample(model, features, trunk_out, reference, schedule, device)
+            results[reference].append(
+                (elapsed, 0.0, 1.0, rmsd(x_ref, coords_truth), lddt(x_ref, coords_truth))
+            )
+            for sampler in samplers:
+                x, elapsed = sample(model, features, trunk_out, sampler, schedule, device)
+                results[sampler].append(
+                    (
+                        elapsed,
+                        rmsd(x, x_ref),
+                        lddt(x, x_ref),
+                        rmsd(x, coords_truth),
+                        lddt(x, coords_truth),
+                    )
+                )
+
+    for (name, steps), values in results.items():
+        elapsed, ref_rmsd, ref_lddt, truth_rmsd, truth_lddt = np.mean(values, axis=0)
+        logging.info(
+            f"{name}:{steps} ({schedule}): {elapsed:.2f} s/chain, "
+            f"vs reference RMSD {ref_rmsd:.2f} lDDT {ref_lddt:.3f}, "
+            f"vs truth RMSD {truth_rmsd:.2f} lDDT {truth_lddt:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
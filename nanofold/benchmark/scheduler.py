@@ -0,0 +1,75 @@
+import argparse
+import logging
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import batched
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from nanofold.preprocess.scheduler import TIMINGS_FILE
+from nanofold.preprocess.scheduler import RuntimeModel
+from nanofold.preprocess.scheduler import schedule
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num-chains", help="Number of chains", type=int, default=400)
+    parser.add_argument(
+        "-w", "--workers", help="Number of concurrent searches", type=int, default=8
+    )
+    parser.add_argument(
+        "-b", "--batch-size", help="Batch size of the batched baseline", type=int, default=50
+    )
+    parser.add_argument(
+        "--exponent", help="Exponent of the simulated runtime in length", type=float, default=1.5
+    )
+    parser.add_argument(
+        "--scale", help="Simulated seconds of a 100 residue search", type=float, default=0.01
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def run_batched(executor, search, chains, batch_size):
+    for batch in batched(chains, batch_size):
+        list(executor.map(search, batch))
+
+
+def run_scheduled(executor, search, chains, model, num_workers):
+    for _, future in schedule(executor, search, chains, model, num_workers):
+        future.result()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    np.random.seed(0)
+    lengths = np.clip(np.random.lognormal(np.log(250), 0.6, args.num_chains), 32, 2500)
+    chains = [{"_id": i, "sequence": "A" * int(length)} for i, length in enumerate(lengths)]
+    search = lambda c: time.sleep(args.scale * (len(c["sequence"]) / 100) ** args.exponent)
+    lower_bound = max(
+        sum(args.scale * (lengths / 100) ** args.exponent) / args.workers,
+        args.scale * (lengths.max() / 100) ** args.exponent,
+    )
+
+    with TemporaryDirectory() as cache_dir, ThreadPoolExecutor(args.workers) as executor:
+        model = RuntimeModel(Path(cache_dir) / TIMINGS_FILE)
+        for length in np.random.choice(lengths, 20):
+            model.record(int(length), args.scale * (length / 100) ** args.exponent, None)
+        start = time.perf_counter()
+        run_batched(executor, search, chains, args.batch_size)
+        batched_makespan = time.perf_counter() - start
+        start = time.perf_counter()
+        run_scheduled(executor, search, chains, model, args.workers)
+        scheduled_makespan = time.perf_counter() - start
+
+    logging.info(
+        f"{args.num_chains} chains, {args.workers} workers: lower bound {lower_bound:.2f} s, "
+        f"batches of {args.batch_size} {batched_makespan:.2f} s, "
+        f"longest first {scheduled_makespan:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
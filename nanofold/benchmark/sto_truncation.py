@@ -0,0 +1,103 @@
+import argparse
+import logging
+import numpy as np
+import os
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from nanofold.preprocess.msa_runner import MSARunner
+
+COPY_ALIGNMENT = """#!{python}
+import shutil
+import sys
+with open("{alignment}") as src, open(sys.argv[sys.argv.index("-A") + 1], "w") as dst:
+    shutil.copyfileobj(src, dst)
+shutil.copyfile("/proc/self/io", "{alignment}.io")
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n",
+        "--num-sequences",
+        help="Sequences in the jackhmmer alignment",
+        type=int,
+        default=20000,
+    )
+    parser.add_argument("-L", "--num-columns", help="Alignment columns", type=int, default=1600)
+    parser.add_argument(
+        "-m", "--max-sequences", help="Sequences kept after truncation", type=int, default=5000
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def write_alignment(path, num_sequences, num_columns, block_width=200):
+    residues = np.array(list("ACDEFGHIKLMNPQRSTVWY-"))
+    names = [f"hit_{i}/1-{num_columns}" for i in range(num_sequences)]
+    with open(path, "w") as f:
+        f.write("# STOCKHOLM 1.0\n")
+        f.writelines(f"#=GS {n} DE [subseq from] {n}\n" for n in names)
+        for start in range(0, num_columns, block_width):
+            width = min(block_width, num_columns - start)
+            f.write("\n")
+            for n in names:
+                f.write(f"{n:40} {''.join(np.random.choice(residues, width))}\n")
+                f.write(f"#=GR {n:35} PP {'9' * width}\n")
+            f.write(f"#=GC RF{' ' * 34}{'x' * width}\n")
+        f.write("//\n")
+
+
+def read_io_counters(path="/proc/self/io"):
+    with open(path) as f:
+        counters = dict(line.split(": ") for line in f.read().splitlines())
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+def run(jackhmmer_bin, alignment, cache_dir, max_sequences, stream_output):
+    cache_dir.mkdir()
+    fasta = cache_dir / "query.fasta"
+    fasta.write_text(">query\nMKTAYIAKQR\n")
+    runner = MSARunner(jackhmmer_bin, "small_bfd", cache_dir, 1, max_sequences, stream_output)
+    rchar, wchar = read_io_counters()
+    start = time.perf_counter()
+    runner.run(fasta, "query")
+    elapsed = time.perf_counter() - start
+    end_rchar, end_wchar = read_io_counters()
+    jackhmmer_rchar, jackhmmer_wchar = read_io_counters(f"{alignment}.io")
+    return elapsed, end_rchar - rchar - jackhmmer_rchar, end_wchar - wchar - jackhmmer_wchar
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    np.random.seed(0)
+    with TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        alignment = tmp_dir / "alignment.sto"
+        write_alignment(alignment, args.num_sequences, args.num_columns)
+        jackhmmer_bin = tmp_dir / "jackhmmer"
+        jackhmmer_bin.write_text(COPY_ALIGNMENT.format(python=sys.executable, alignment=alignment))
+        jackhmmer_bin.chmod(0o755)
+        size = os.path.getsize(alignment) / 1024**2
+        logging.info(f"Alignment of {args.num_sequences} sequences, {size:.0f} MB")
+        for stream_output in [False, True]:
+            cache_dir = tmp_dir / f"stream_{stream_output}"
+            elapsed, read, written = run(
+                jackhmmer_bin, alignment, cache_dir, args.max_sequences, stream_output
+            )
+            alignment_written = 0 if stream_output else size
+            read -= os.path.getsize(alignment) if stream_output else 0
+            logging.info(
+                f"stream_output {stream_output}: {elapsed:.2f} s, "
+                f"truncation and caching read {read / 1024**2:.1f} MB from disk, "
+                f"wrote {written / 1024**2:.1f} MB, "
+                f"jackhmmer wrote {alignment_written:.0f} MB to disk"
+            )
+
+
+if __name__ == "__main__":
+    main()
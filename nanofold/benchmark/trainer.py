@@ -0,0 +1,50 @@
+import argparse
+import json
+import logging
+import numpy as np
+import time
+import torch
+from pathlib import Path
+
+from nanofold.train.__main__ import get_dataloaders
+from nanofold.train.trainer import Trainer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="Configuration file for training", type=Path)
+    parser.add_argument(
+        "-i", "--input", help="Input chain training data in Arrow IPC file format", type=Path
+    )
+    parser.add_argument("-n", "--num-steps", help="Number of steps to time", type=int, default=20)
+    parser.add_argument("--warmup", help="Number of untimed steps", type=int, default=2)
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument(
+        "--grad-accumulation-steps", help="Override the configured accumulation steps", type=int
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    with open(args.config) as f:
+        params = json.load(f)
+    if args.device is not None:
+        params["device"] = args.device
+    if args.grad_accumulation_steps is not None:
+        params["grad_accumulation_steps"] = args.grad_accumulation_steps
+    np.random.seed(0)
+    torch.manual_seed(0)
+    train_loader, _ = get_dataloaders(args, params)
+    trainer = Trainer(params, loggers=[], checkpoint_save_freq=1)
+    trainer.fit(train_loader, None, max_epoch=args.warmup)
+    start = time.perf_counter()
+    trainer.fit(train_loader, None, max_epoch=args.warmup + args.num_steps)
+    rate = args.num_steps / (time.perf_counter() - start)
+    logging.info(f"{rate:.2f} steps/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import logging
+import multiprocessing
+import time
+import torch
+
+from nanofold.benchmark.memory import get_peak_memory
+from nanofold.benchmark.memory import reset_peak_memory
+from nanofold.train.model.triangular_attention import TriangleAttentionEndingNode
+from nanofold.train.model.triangular_attention import TriangleAttentionStartingNode
+from nanofold.train.model.triangular_update import TriangleMultiplicationIncoming
+from nanofold.train.model.triangular_update import TriangleMultiplicationOutgoing
+
+MODULES = {
+    "multiplication_outgoing": TriangleMultiplicationOutgoing,
+    "multiplication_incoming": TriangleMultiplicationIncoming,
+    "attention_starting": TriangleAttentionStartingNode,
+    "attention_ending": TriangleAttentionEndingNode,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-L", "--num-residues", help="Crop sizes to benchmark", type=int, action="append"
+    )
+    parser.add_argument(
+        "--module", help="Triangle module to benchmark", choices=MODULES.keys(), action="append"
+    )
+    parser.add_argument(
+        "--chunk-size", help="Triangle chunk sizes to compare", type=int, action="append"
+    )
+    parser.add_argument("--pair-embedding-size", type=int, default=128)
+    parser.add_argument("--num-update-channels", type=int, default=128)
+    parser.add_argument("--num-attention-channels", type=int, default=32)
+    parser.add_argument("--num-attention-heads", type=int, default=4)
+    parser.add_argument("--backward", help="Include the backward pass", action="store_true")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def build_module(args, name, chunk_size):
+    if name.startswith("multiplication"):
+        return MODULES[name](args.pair_embedding_size, args.num_update_channels, chunk_size)
+    return MODULES[name](
+        args.pair_embedding_size, args.num_attention_heads, args.num_attention_channels, chunk_size
+    )
+
+
+def run(args, name, num_residues, chunk_size):
+    torch.manual_seed(0)
+    module = build_module(args, name, chunk_size).to(args.device)
+    pair_rep = torch.rand(
+        num_residues, num_residues, args.pair_embedding_size, device=args.device
+    ).requires_grad_(args.backward)
+    baseline = reset_peak_memory(args.device)
+    start = time.perf_counter()
+    with torch.set_grad_enabled(args.backward):
+        out = module(pair_rep)
+        if args.backward:
+            out.sum().backward()
+    peak = get_peak_memory(args.device) - baseline
+    return time.perf_counter() - start, peak / 1024**2
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.logging.upper()))
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for name in args.module or MODULES.keys():
+            for num_residues in args.num_residues or [64, 128, 256, 384]:
+                for chunk_size in [None] + (args.chunk_size or [32]):
+                    elapsed, peak = pool.apply(run, (args, name, num_residues, chunk_size))
+                    logging.info(
+                        f"{name}, L {num_residues}, chunk size {chunk_size}: "
+                        f"{1000 * elapsed:.0f} ms, peak {peak:.0f} MB"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+LAYOUT_KEY = b"layout"
+TENSOR_LAYOUT = b"tensor"
+
+
+def get_layout(schema):
+    return (schema.metadata or {}).get(LAYOUT_KEY)
@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import json
+import logging
+import os
+import time
+import torch
+from pathlib import Path
+
+from nanofold.predict.features import featurize
+from nanofold.predict.features import get_single_sequence_msa_features
+from nanofold.predict.features import load_msa_features
+from nanofold.predict.features import read_fasta
+from nanofold.predict.structure import build_structure
+from nanofold.predict.structure import write_structure
+from nanofold.train.checkpoint_loader import CheckpointLoader
+from nanofold.train.model import Nanofold
+from nanofold.train.model.diffusion_sampler import SAMPLERS
+from nanofold.train.model.diffusion_sampler import SCHEDULES
+from nanofold.train.trainer import load_batch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    config = parser.add_mutually_exclusive_group(required=True)
+    config.add_argument("-c", "--config", help="Configuration file of the model")
+    config.add_argument("-r", "--runid", help="Load the model checkpoint of an MLFlow run ID")
+    parser.add_argument(
+        "-e", "--epoch", help="Optional epoch of the checkpoint to load. Use with --runid", type=int
+    )
+    parser.add_argument(
+        "--checkpoint", help="Checkpoint file to load. Use with --config", type=Path
+    )
+    parser.add_argument(
+        "-f", "--fasta", help="FASTA file of chains to predict", type=Path, required=True
+    )
+    parser.add_argument(
+        "-m",
+        "--msa",
+        help="Directory of cached MSA features, looked up by FASTA identifier",
+        type=Path,
+    )
+    parser.add_argument(
+        "-o", "--output", help="Output directory for predicted structures", type=Path, required=True
+    )
+    parser.add_argument(
+        "-n", "--num-samples", help="Number of structures to sample", type=int, default=1
+    )
+    parser.add_argument(
+        "--format", help="Output file format", choices=["cif", "pdb"], default="cif"
+    )
+    parser.add_argument("--device", help="Override the configured device")
+    parser.add_argument(
+        "--sampler", help="Override the configured diffusion sampler", choices=SAMPLERS.keys()
+    )
+    parser.add_argument(
+        "--schedule", help="Override the configured noise schedule", choices=SCHEDULES.keys()
+    )
+    parser.add_argument("--steps", help="Override the number of diffusion steps", type=int)
+    parser.add_argument("--timings", help="Append per chain stage timings as JSON lines", type=Path)
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def load_model(args):
+    if args.runid:
+        checkpoint_loader = CheckpointLoader(os.getenv("MLFLOW_SERVER_URI"), run_id=args.runid)
+        params = checkpoint_loader.get_params()
+        checkpoint = checkpoint_loader.get_checkpoint(epoch=args.epoch)
+    else:
+        with open(args.config) as f:
+            params = json.load(f)
+        checkpoint = (
+            torch.load(args.checkpoint, map_location="cpu") if args.checkpoint is not None else None
+        )
+    if args.device is not None:
+        params["device"] = args.device
+    if args.sampler is not None:
+        params["diffusion_sampler"] = args.sampler
+    if args.schedule is not None:
+        params["diffusion_schedule"] = args.schedule
+    if args.steps is not None:
+        params["diffusion_steps"] = args.steps
+    if params["device"] == "cuda" and not torch.cuda.is_available():
+        raise RuntimeError("CUDA is not available")
+
+    model = Nanofold(**Nanofold.get_args(params), inference=True)
+    if checkpoint is not None:
+        model.load_state_dict(checkpoint["model"])
+    else:
+        logging.warning("No checkpoint given, predicting with randomly initialised weights")
+    model = model.to(params["device"])
+    model.eval()
+    return model, params
+
+
+@contextlib.contextmanager
+def timed(timings, stage, device):
+    start = time.perf_counter()
+    yield
+    if device == "cuda":
+        torch.cuda.synchronize()
+    timings[stage] = time.perf_counter() - start
+
+
+@torch.no_grad()
+def predict_chain(model, params, id, sequence, args):
+    device = params["device"]
+    timings = {}
+    with timed(timings, "featurize", device):
+        msa_features = load_msa_features(args.msa, id) if args.msa is not None else None
+        if msa_features is None:
+            logging.warning(f"No cached MSA features found for {id}, using single sequence MSA")
+            msa_features = get_single_sequence_msa_features(sequence)
+        features = load_batch(featurize(sequence, msa_features, params["num_msa"]), device)
+    with torch.autocast(
+        device, enabled=params["use_amp"] and device == "cuda", dtype=torch.bfloat16
+    ):
+        with timed(timings, "trunk", device):
+            input, single_rep, pair_rep = model.run_trunk(features)
+        with timed(timings, "diffusion", device):
+            samples = model.diffusion_model(features, input, single_rep, pair_rep, args.num_samples)
+    with timed(timings, "write", device):
+        for i, coords in enumerate(samples):
+            structure = build_structure(id, sequence, coords.float().cpu().numpy())
+            write_structure(structure, args.output / f"{id}_sample_{i}.{args.format}")
+    return timings
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s: %(message)s",
+        level=getattr(logging, args.logging.upper()),
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    model, params = load_model(args)
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    for id, sequence in read_fasta(args.fasta):
+        timings = predict_chain(model, params, id, sequence, args)
+        timings_str = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+        logging.info(
+            f"Predicted {args.num_samples} structures for {id}, length {len(sequence)}: {timings_str}"
+        )
+        if args.timings is not None:
+            with open(args.timings, "a") as f:
+                record = {"id": id, "length": len(sequence), "num_samples": args.num_samples}
+                f.write(json.dumps(record | timings) + "\n")
+
+
+if __name__ == "__main__":
+    main()
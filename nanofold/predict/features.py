@@ -0,0 +1,95 @@
+import gzip
+import numpy as np
+import pickle
+import pyarrow as pa
+from pathlib import Path
+
+from nanofold.common.msa_metadata import COMPRESSED_MSA_FIELDS
+from nanofold.common.residue_definitions import RESIDUE_INDEX
+from nanofold.common.residue_definitions import RESIDUE_INDEX_MSA
+from nanofold.common.residue_definitions import UNKNOWN_RESIDUE
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.chain_dataset import get_lengths
+
+
+def normalize_sequence(sequence):
+    return "".join(r if r in RESIDUE_INDEX else UNKNOWN_RESIDUE[0] for r in sequence)
+
+
+def read_fasta(filepath):
+    records = []
+    with open(filepath) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                records.append((line[1:].split()[0], []))
+            elif line and records:
+                records[-1][1].append(line.upper())
+    return [(id, normalize_sequence("".join(lines))) for id, lines in records]
+
+
+def load_msa_features(msa_dir, id):
+    msa_file = Path(msa_dir) / f"{id}.pkl.gz"
+    if not msa_file.exists():
+        return None
+    with gzip.open(msa_file, "rb") as f:
+        return pickle.load(f)
+
+
+def get_single_sequence_msa_features(sequence):
+    num_residues = len(sequence)
+    index = [RESIDUE_INDEX_MSA.get(r, RESIDUE_INDEX_MSA[UNKNOWN_RESIDUE[0]]) for r in sequence]
+    profile = np.eye(len(RESIDUE_INDEX_MSA))[index]
+    features = {"profile": profile, "deletion_mean": np.zeros(num_residues)}
+    for name, meta in COMPRESSED_MSA_FIELDS.items():
+        features[f"{name}_shape"] = (num_residues, meta.feat_size)
+        features[f"{name}_data"] = []
+        features[f"{name}_coords"] = [[], []]
+    features["msa_data"] = [True] * num_residues
+    features["msa_coords"] = [list(range(num_residues)), index]
+    return features
+
+
+def float_list(depth):
+    return pa.list_(float_list(depth - 1)) if depth > 1 else pa.list_(pa.float32())
+
+
+def build_table(sequence, msa_features):
+    num_residues = len(sequence)
+    if msa_features["msa_shape"][0] != num_residues:
+        raise ValueError(
+            f"MSA features have {msa_features['msa_shape'][0]} residues, expected {num_residues}"
+        )
+    columns = {
+        "sequence": pa.array([sequence]),
+        "positions": pa.array([list(range(num_residues))], type=pa.list_(pa.int16())),
+        "rotations": pa.array([np.tile(np.eye(3), (num_residues, 1, 1)).tolist()], float_list(3)),
+        "translations": pa.array([np.zeros((num_residues, 3)).tolist()], float_list(2)),
+        "template_mask": pa.array([[]], pa.list_(pa.list_(pa.bool_()))),
+        "template_sequence": pa.array([[]], pa.list_(pa.string())),
+        "template_translations": pa.array([[]], float_list(3)),
+        "template_rotations": pa.array([[]], float_list(4)),
+        "profile": pa.array([np.asarray(msa_features["profile"]).tolist()], float_list(2)),
+        "deletion_mean": pa.array(
+            [np.asarray(msa_features["deletion_mean"]).tolist()], float_list(1)
+        ),
+    }
+    for name, meta in COMPRESSED_MSA_FIELDS.items():
+        columns[f"{name}_shape"] = pa.array(
+            [list(msa_features[f"{name}_shape"])], pa.list_(pa.int32())
+        )
+        columns[f"{name}_data"] = pa.array([list(msa_features[f"{name}_data"])]).cast(
+            pa.list_(meta.pa_type())
+        )
+        columns[f"{name}_coords"] = pa.array(
+            [[list(c) for c in msa_features[f"{name}_coords"]]], pa.list_(pa.list_(pa.int32()))
+        )
+    return pa.table(columns)
+
+
+def featurize(sequence, msa_features, num_msa):
+    sequence = normalize_sequence(sequence)
+    table = build_table(sequence, msa_features)
+    dataset = ChainDataset(table, np.arange(1), get_lengths(table), len(sequence), num_msa)
+    features = next(iter(dataset))
+    return {k: v for k, v in features.items() if k not in ["coords_truth", "translations"]}
@@ -0,0 +1,29 @@
+from Bio.PDB import MMCIFIO
+from Bio.PDB import PDBIO
+from Bio.PDB.StructureBuilder import StructureBuilder
+from pathlib import Path
+
+from nanofold.common.residue_definitions import BACKBONE_ATOMS
+from nanofold.common.residue_definitions import get_3l_res_name
+
+WRITERS = {".cif": MMCIFIO, ".pdb": PDBIO}
+
+
+def build_structure(id, sequence, coords):
+    builder = StructureBuilder()
+    builder.init_structure(id)
+    builder.init_model(0)
+    builder.init_chain("A")
+    builder.init_seg("    ")
+    coords = coords.reshape(len(sequence), len(BACKBONE_ATOMS), 3)
+    for i, (residue, residue_coords) in enumerate(zip(sequence, coords)):
+        builder.init_residue(get_3l_res_name(residue), " ", i + 1, " ")
+        for atom, position in zip(BACKBONE_ATOMS, residue_coords):
+            builder.init_atom(atom, position, 0.0, 1.0, " ", f" {atom:<3}", element=atom[0])
+    return builder.get_structure()
+
+
+def write_structure(structure, filepath):
+    writer = WRITERS[Path(filepath).suffix]()
+    writer.set_structure(structure)
+    writer.save(str(filepath))
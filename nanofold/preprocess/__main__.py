@@ -9,10 +9,13 @@ from pathlib import Path
 from nanofold.preprocess.db import DBManager
 from nanofold.preprocess.hhblits import HHblitsRunner
 from nanofold.preprocess.ipc import dump_to_ipc
+from nanofold.preprocess.mmcif_processor import MMCIF_PARSERS
 from nanofold.preprocess.mmcif_processor import process_mmcif_files
 from nanofold.preprocess.msa_builder import prefetch_msa
 from nanofold.preprocess.msa_builder import build_msa
 from nanofold.preprocess.msa_runner import MSARunner
+from nanofold.preprocess.pipeline import run_pipeline
+from nanofold.preprocess.scheduler import get_total_memory
 from nanofold.preprocess.template import build_template
 
 
@@ -27,7 +30,46 @@ def parse_args():
     parser.add_argument("-s", "--small_bfd", help="Small BFD file", type=Path)
     parser.add_argument("-p", "--pdb70", help="PDB70 database", type=Path)
     parser.add_argument("-u", "--uniclust30", help="Uniclust30 database", type=Path)
+    parser.add_argument(
+        "--mmcif-parser",
+        help="Backend used to parse mmCIF files",
+        choices=MMCIF_PARSERS.keys(),
+        default="native",
+    )
     parser.add_argument("--dump-only", help="Dump IPC file only", action="store_true")
+    parser.add_argument(
+        "--stream-sto",
+        help="Truncate jackhmmer alignments while streaming them into the compressed cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="Stream each chain through the preprocessing stages instead of running them in sequence",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cpus",
+        help="CPU budget of the pipelined mode and number of small BFD searches run at once",
+        default=os.cpu_count(),
+        type=int,
+    )
+    parser.add_argument(
+        "--memory-limit",
+        help="Memory budget in MB used to admit MSA searches and MSA feature building",
+        default=get_total_memory(),
+        type=float,
+    )
+    parser.add_argument(
+        "--queue-size", help="Capacity of the queues between pipeline stages", default=100, type=int
+    )
+    parser.add_argument(
+        "--tensor-layout", help="Dump IPC file in fixed width tensor layout", action="store_true"
+    )
+    parser.add_argument(
+        "--compact-msa",
+        help="Dump tensor layout with uint8 MSA residue indices and deletion counts",
+        action="store_true",
+    )
     parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
     return parser.parse_args()
 
@@ -55,6 +97,7 @@ def main():
         jackhmmer_results_path,
         num_cpus=1,
         max_sequences=5000,
+        stream_output=args.stream_sto,
     )
     uniclust30_msa_search = HHblitsRunner(
         shutil.which("hhblits"),
@@ -71,17 +114,44 @@ def main():
         num_iterations=1,
     )
 
-    if not args.dump_only:
+    if not args.dump_only and args.pipeline:
+        run_pipeline(
+            db_manager,
+            args.mmcif,
+            small_bfd_msa_search,
+            uniclust30_msa_search,
+            pdb70_template_search,
+            shutil.which("reformat.pl"),
+            msa_output_dir,
+            args.cpus,
+            args.queue_size,
+            args.mmcif_parser,
+        )
+    elif not args.dump_only:
         with ProcessPoolExecutor() as executor:
-            process_mmcif_files(db_manager, executor, args.mmcif, args.batch)
+            process_mmcif_files(db_manager, executor, args.mmcif, args.batch, args.mmcif_parser)
 
-        with ThreadPoolExecutor() as executor:
+        with ThreadPoolExecutor(max_workers=args.cpus) as executor:
             logging.info("Prefetching MSA from small BFD")
-            prefetch_msa(small_bfd_msa_search, db_manager, executor, jackhmmer_results_path)
+            prefetch_msa(
+                small_bfd_msa_search,
+                db_manager,
+                executor,
+                jackhmmer_results_path,
+                num_workers=args.cpus,
+                memory_limit=args.memory_limit,
+            )
 
         with ThreadPoolExecutor(max_workers=2) as executor:
             logging.info("Prefetching MSA from Uniclust30")
-            prefetch_msa(uniclust30_msa_search, db_manager, executor, uniclust30_cache_dir)
+            prefetch_msa(
+                uniclust30_msa_search,
+                db_manager,
+                executor,
+                uniclust30_cache_dir,
+                num_workers=2,
+                memory_limit=args.memory_limit,
+            )
 
         with ProcessPoolExecutor(max_workers=3) as executor:
             build_msa(
@@ -91,10 +161,12 @@ def main():
                 executor,
                 msa_output_dir,
                 include_dirs=[jackhmmer_results_path, uniclust30_cache_dir],
+                num_workers=3,
+                memory_limit=args.memory_limit,
             )
 
     with ThreadPoolExecutor() as executor:
-        if not args.dump_only:
+        if not args.dump_only and not args.pipeline:
             build_template(
                 pdb70_template_search,
                 shutil.which("reformat.pl"),
@@ -103,7 +175,14 @@ def main():
                 executor,
                 msa_output_dir,
             )
-        dump_to_ipc(db_manager, msa_output_dir, args.output, executor)
+        dump_to_ipc(
+            db_manager,
+            msa_output_dir,
+            args.output,
+            executor,
+            tensor_layout=args.tensor_layout,
+            compact_msa=args.compact_msa,
+        )
 
 
 if __name__ == "__main__":
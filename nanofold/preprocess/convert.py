@@ -0,0 +1,32 @@
+import argparse
+import logging
+from pathlib import Path
+
+from nanofold.preprocess.ipc import convert_to_tensor_layout
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="Input features Arrow file", type=Path)
+    parser.add_argument("-o", "--output", help="Output features Arrow file", type=Path)
+    parser.add_argument(
+        "--compact-msa",
+        help="Store MSA as uint8 residue indices and deletion counts",
+        action="store_true",
+    )
+    parser.add_argument("-l", "--logging", help="Logging level", default="INFO")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s: %(message)s",
+        level=getattr(logging, args.logging.upper()),
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    convert_to_tensor_layout(args.input, args.output, args.compact_msa)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,13 @@ import os
 import subprocess
 from pathlib import Path
 
+from nanofold.preprocess.scheduler import TIMINGS_FILE
+from nanofold.preprocess.scheduler import RuntimeModel
+from nanofold.preprocess.scheduler import get_query_length
+from nanofold.preprocess.scheduler import run_with_usage
+from nanofold.preprocess.search_cache import get_shared_output
+from nanofold.preprocess.search_cache import link_shared_result
+
 
 class HHblitsRunner:
     def __init__(
@@ -15,6 +22,7 @@ class HHblitsRunner:
         self.num_cpu = num_cpu
         self.output_format = output_format
         self.kwargs = kwargs
+        self.runtime_model = RuntimeModel(cache_dir / TIMINGS_FILE)
 
     def build_cmd(self, a2m_file, output):
         cmd = [
@@ -58,13 +66,30 @@ class HHblitsRunner:
             return lambda: content
         return None
 
+    def search_params(self):
+        return [
+            "hhblits",
+            self.db,
+            self.num_iterations,
+            self.output_format,
+            sorted(self.kwargs.items()),
+        ]
+
     def run(self, a2m_file, id):
         output = self.cache_dir / f"{id}.{self.output_format}"
         cached_result = self.cached_result(output)
         if cached_result is not None:
             return cached_result
 
-        cmd = self.build_cmd(a2m_file, output)
-        subprocess.run(cmd, check=True, text=True)
-
+        shared_output = get_shared_output(
+            self.cache_dir, a2m_file, self.search_params(), f".{self.output_format}"
+        )
+        if self.cached_result(shared_output) is None:
+            cmd = self.build_cmd(a2m_file, shared_output)
+            returncode, seconds, memory = run_with_usage(cmd)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, cmd)
+            self.runtime_model.record(get_query_length(a2m_file), seconds, memory)
+            self.cached_result(shared_output)
+        link_shared_result(shared_output, output)
         return self.cached_result(output)
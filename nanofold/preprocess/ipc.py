@@ -1,14 +1,20 @@
 import glob
 import gzip
 import logging
+import numpy as np
 import os
 import pickle
 import pyarrow as pa
+import pyarrow.compute as pc
 from functools import partial
 from itertools import batched
 from pathlib import Path
 
+from nanofold.common.feature_layout import LAYOUT_KEY
+from nanofold.common.feature_layout import TENSOR_LAYOUT
 from nanofold.common.msa_metadata import COMPRESSED_MSA_FIELDS
+from nanofold.common.residue_definitions import RESIDUE_INDEX_MSA
+from nanofold.preprocess.msa_builder import add_row_pointers
 
 
 def get_msa_schema_fields(name, pa_type):
@@ -16,9 +22,16 @@ def get_msa_schema_fields(name, pa_type):
         pa.field(f"{name}_shape", pa.list_(pa.int32())),
         pa.field(f"{name}_data", pa.list_(pa_type())),
         pa.field(f"{name}_coords", pa.list_(pa.list_(pa.int32()))),
+        pa.field(f"{name}_indptr", pa.list_(pa.int32())),
     ]
 
 
+MSA_SCHEMA_FIELDS = [
+    field
+    for name, meta in COMPRESSED_MSA_FIELDS.items()
+    for field in get_msa_schema_fields(name, meta.pa_type)
+]
+
 SCHEMA = pa.schema(
     [
         pa.field("structure_id", pa.string()),
@@ -34,14 +47,137 @@ SCHEMA = pa.schema(
         pa.field("profile", pa.list_(pa.list_(pa.float32()))),
         pa.field("deletion_mean", pa.list_(pa.float32())),
     ]
-    + [
-        field
-        for name, meta in COMPRESSED_MSA_FIELDS.items()
-        for field in get_msa_schema_fields(name, meta.pa_type)
-    ]
+    + MSA_SCHEMA_FIELDS
+)
+
+COMPACT_MSA_SCHEMA_FIELDS = [
+    pa.field("msa_index", pa.list_(pa.uint8())),
+    pa.field("deletion_count", pa.list_(pa.uint8())),
+]
+
+TENSOR_SCHEMA_FIELDS = [
+    pa.field("structure_id", pa.string()),
+    pa.field("chain_id", pa.string()),
+    pa.field("length", pa.int32()),
+    pa.field("num_templates", pa.int32()),
+    pa.field("rotations", pa.list_(pa.list_(pa.float32(), 9))),
+    pa.field("translations", pa.list_(pa.list_(pa.float32(), 3))),
+    pa.field("sequence", pa.string()),
+    pa.field("positions", pa.list_(pa.int16())),
+    pa.field("template_mask", pa.list_(pa.bool_())),
+    pa.field("template_sequence", pa.string()),
+    pa.field("template_translations", pa.list_(pa.list_(pa.float32(), 3))),
+    pa.field("template_rotations", pa.list_(pa.list_(pa.float32(), 9))),
+    pa.field("profile", pa.list_(pa.list_(pa.float32(), len(RESIDUE_INDEX_MSA)))),
+    pa.field("deletion_mean", pa.list_(pa.float32())),
+]
+
+TENSOR_SCHEMA = pa.schema(
+    TENSOR_SCHEMA_FIELDS + MSA_SCHEMA_FIELDS,
+    metadata={LAYOUT_KEY: TENSOR_LAYOUT},
+)
+
+COMPACT_TENSOR_SCHEMA = pa.schema(
+    TENSOR_SCHEMA_FIELDS + COMPACT_MSA_SCHEMA_FIELDS,
+    metadata={LAYOUT_KEY: TENSOR_LAYOUT},
 )
 
 
+def flatten_nested_list(array, depth):
+    num_rows = len(array)
+    parents = np.arange(num_rows)
+    for _ in range(depth):
+        parents = parents[pc.list_parent_indices(array).to_numpy()]
+        array = array.flatten()
+    return array, np.bincount(parents, minlength=num_rows)
+
+
+def to_tensor_column(array, depth, size=None):
+    values, counts = flatten_nested_list(array, depth)
+    if size is not None:
+        values = pa.FixedSizeListArray.from_arrays(values, size)
+        counts = counts // size
+    offsets = pa.array(np.concatenate([[0], np.cumsum(counts)]), type=pa.int32())
+    return pa.ListArray.from_arrays(offsets, values)
+
+
+def get_sparse_msa(batch, name, index):
+    num_residues, num_cols = batch.column(f"{name}_shape")[index].values.to_numpy()
+    rows, cols = batch.column(f"{name}_coords")[index].values.flatten().to_numpy().reshape(2, -1)
+    data = batch.column(f"{name}_data")[index].values.to_numpy(zero_copy_only=False)
+    return num_residues, num_cols, rows, cols, data
+
+
+def to_compact_msa(batch):
+    msa_index = []
+    deletion_count = []
+    for i in range(batch.num_rows):
+        num_residues, num_cols, rows, cols, _ = get_sparse_msa(batch, "msa", i)
+        index = np.zeros((num_residues, num_cols // len(RESIDUE_INDEX_MSA)), dtype=np.uint8)
+        seq_index, feat_index = np.divmod(cols, len(RESIDUE_INDEX_MSA))
+        index[rows, seq_index] = feat_index
+        msa_index.append(index.ravel())
+
+        num_residues, num_seq, rows, cols, data = get_sparse_msa(batch, "deletion_value", i)
+        count = np.zeros((num_residues, num_seq), dtype=np.uint8)
+        count[rows, cols] = np.clip(
+            np.rint(3 * np.tan(np.pi / 2 * data.astype(np.float64))), 0, 255
+        )
+        deletion_count.append(count.ravel())
+    return [
+        pa.array(msa_index, type=pa.list_(pa.uint8())),
+        pa.array(deletion_count, type=pa.list_(pa.uint8())),
+    ]
+
+
+def get_sparse_msa_columns(batch):
+    if all(field.name in batch.schema.names for field in MSA_SCHEMA_FIELDS):
+        return [batch.column(field.name) for field in MSA_SCHEMA_FIELDS]
+    names = [field.name for field in MSA_SCHEMA_FIELDS if field.name in batch.schema.names]
+    features = [
+        add_row_pointers({n: batch.column(n)[i].as_py() for n in names})
+        for i in range(batch.num_rows)
+    ]
+    return [
+        pa.array([f[field.name] for f in features], type=field.type) for field in MSA_SCHEMA_FIELDS
+    ]
+
+
+def to_tensor_layout(batch, compact_msa=False):
+    return pa.RecordBatch.from_arrays(
+        [
+            batch.column("structure_id"),
+            batch.column("chain_id"),
+            pc.list_value_length(batch.column("positions")).cast(pa.int32()),
+            pc.list_value_length(batch.column("template_sequence")).cast(pa.int32()),
+            to_tensor_column(batch.column("rotations"), 3, 9),
+            to_tensor_column(batch.column("translations"), 2, 3),
+            batch.column("sequence"),
+            batch.column("positions"),
+            to_tensor_column(batch.column("template_mask"), 2),
+            pc.binary_join(batch.column("template_sequence"), ""),
+            to_tensor_column(batch.column("template_translations"), 3, 3),
+            to_tensor_column(batch.column("template_rotations"), 4, 9),
+            to_tensor_column(batch.column("profile"), 2, len(RESIDUE_INDEX_MSA)),
+            batch.column("deletion_mean"),
+        ]
+        + (to_compact_msa(batch) if compact_msa else get_sparse_msa_columns(batch)),
+        schema=COMPACT_TENSOR_SCHEMA if compact_msa else TENSOR_SCHEMA,
+    )
+
+
+def convert_to_tensor_layout(input, output, compact_msa=False):
+    logging.info(f"Converting {input} to tensor layout at {output}")
+    schema = COMPACT_TENSOR_SCHEMA if compact_msa else TENSOR_SCHEMA
+    with pa.memory_map(str(input)) as source:
+        with pa.ipc.open_file(source) as reader:
+            with pa.OSFile(str(output), mode="w") as f:
+                with pa.ipc.new_file(f, schema) as writer:
+                    for i in range(reader.num_record_batches):
+                        writer.write_batch(to_tensor_layout(reader.get_batch(i), compact_msa))
+    logging.info(f"Finished converting {reader.num_record_batches} record batches to {output}")
+
+
 def get_ready_chains(db_manager, msa_output_dir):
     chains = db_manager.chains().find({"templates": {"$exists": True}})
     search_glob = os.path.join(msa_output_dir, "*.pkl.gz")
@@ -58,7 +194,7 @@ def get_msa_features(msa_output_dir, chain):
             msa_output_dir / f"{chain['_id']['structure_id']}_{chain['_id']['chain_id']}.pkl.gz",
             "rb",
         ) as f:
-            return pickle.load(f)
+            return add_row_pointers(pickle.load(f))
     except Exception as e:
         logging.error(f"Error loading MSA features for {chain['_id']}: {e}")
         return None
@@ -87,24 +223,36 @@ def get_record_batch(executor, msa_feat_getter, chain_batch):
     ] + [
         pa.array([m[f"{field}_{app}"] for _, m in batch])
         for field in COMPRESSED_MSA_FIELDS.keys()
-        for app in ["shape", "data", "coords"]
+        for app in ["shape", "data", "coords", "indptr"]
     ]
 
 
-def dump_to_ipc(db_manager, msa_output_dir, output, executor, batch_size=5):
+def dump_to_ipc(
+    db_manager,
+    msa_output_dir,
+    output,
+    executor,
+    batch_size=5,
+    tensor_layout=False,
+    compact_msa=False,
+):
     logging.info(f"Writing features to {output}")
+    tensor_layout = tensor_layout or compact_msa
+    if compact_msa:
+        schema = COMPACT_TENSOR_SCHEMA
+    else:
+        schema = TENSOR_SCHEMA if tensor_layout else SCHEMA
     chains = get_ready_chains(db_manager, msa_output_dir)
     msa_feat_getter = partial(get_msa_features, msa_output_dir)
 
     num_chains = 0
     with pa.OSFile(str(output), mode="w") as f:
-        with pa.ipc.new_file(f, SCHEMA) as writer:
+        with pa.ipc.new_file(f, schema) as writer:
             for chain_batch in batched(chains, batch_size):
-                writer.write_batch(
-                    pa.RecordBatch.from_arrays(
-                        get_record_batch(executor, msa_feat_getter, chain_batch), schema=SCHEMA
-                    )
+                batch = pa.RecordBatch.from_arrays(
+                    get_record_batch(executor, msa_feat_getter, chain_batch), schema=SCHEMA
                 )
+                writer.write_batch(to_tensor_layout(batch, compact_msa) if tensor_layout else batch)
                 num_chains += len(chain_batch)
                 logging.info(f"Wrote {num_chains} chains to IPC file")
     logging.info(f"Finished writing {num_chains} chains to {output}")
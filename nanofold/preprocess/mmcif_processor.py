@@ -4,8 +4,14 @@ import logging
 from functools import partial
 from itertools import batched
 
+from nanofold.preprocess import mmcif_parser
+from nanofold.preprocess import mmcif_reader
 from nanofold.preprocess.mmcif_parser import get_model_id
-from nanofold.preprocess.mmcif_parser import parse_mmcif_file
+
+MMCIF_PARSERS = {
+    "native": mmcif_reader.parse_mmcif_file,
+    "biopython": mmcif_parser.parse_mmcif_file,
+}
 
 
 def list_available_mmcif(mmcif_dir):
@@ -38,16 +44,22 @@ def to_chains_document(chains):
     ]
 
 
-def process_batch(db_manager, batch, executor):
-    parser = partial(parse_mmcif_file, capture_errors=True)
+def insert_chains(db_manager, filepath, chains):
+    if len(chains) > 0:
+        db_manager.chains().insert_many(to_chains_document(chains))
+    db_manager.processed_mmcif_files().insert_one({"_id": get_model_id(filepath)})
+
+
+def process_batch(db_manager, batch, executor, parse_fn):
+    parser = partial(parse_fn, capture_errors=True)
     result = [c for chains in executor.map(parser, batch) for c in chains]
     db_manager.chains().insert_many(to_chains_document(result))
     db_manager.processed_mmcif_files().insert_many([{"_id": get_model_id(f)} for f in batch])
 
 
-def process_mmcif_files(db_manager, executor, mmcif_dir, batch_size):
+def process_mmcif_files(db_manager, executor, mmcif_dir, batch_size, parser="native"):
     files = get_files_to_process(db_manager, mmcif_dir)
 
     for i, batch in enumerate(batched(files, batch_size)):
-        process_batch(db_manager, batch, executor)
+        process_batch(db_manager, batch, executor, MMCIF_PARSERS[parser])
         logging.info(f"Parsed {i * batch_size + len(batch)}/{len(files)} files")
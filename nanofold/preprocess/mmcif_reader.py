@@ -0,0 +1,172 @@
+import logging
+import numpy as np
+import re
+
+from nanofold.common.residue_definitions import get_1l_res_code
+from nanofold.common.residue_definitions import BACKBONE_ATOMS
+from nanofold.preprocess.mmcif_parser import get_model_id
+from nanofold.preprocess.residue import compute_residue_frames
+
+UNASSIGNED = {".", "?"}
+QUOTED_TOKEN = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+
+
+def tokenize(line):
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [t[1:-1] if t[0] in "'\"" else t for t in QUOTED_TOKEN.findall(line)]
+
+
+def read_atom_site(filepath):
+    columns = []
+    tokens = []
+    with open(filepath) as f:
+        lines = iter(f)
+        for line in lines:
+            if line.startswith("_atom_site."):
+                columns.append(line.strip())
+                break
+        for line in lines:
+            if not line.startswith("_atom_site."):
+                break
+            columns.append(line.strip())
+        else:
+            line = ""
+        while line and not line.startswith(("#", "loop_", "_", "data_")):
+            tokens.extend(tokenize(line))
+            line = next(lines, "")
+    if len(columns) == 0:
+        raise ValueError("No _atom_site loop found")
+    if len(tokens) % len(columns) != 0:
+        raise ValueError(f"Expected {len(columns)} values per _atom_site row, got {len(tokens)}")
+    return {name[len("_atom_site.") :]: tokens[i :: len(columns)] for i, name in enumerate(columns)}
+
+
+def count_models(atom_site):
+    serials = atom_site.get("pdbx_PDB_model_num")
+    if serials is None:
+        return 1
+    return 1 + sum(a != b for a, b in zip(serials[:-1], serials[1:]))
+
+
+def add_residue_atom(residue, name, row, altloc, occupancy):
+    atoms = residue["atoms"][residue["resname"]]
+    if name not in atoms:
+        atoms[name] = (row, occupancy, altloc != " ")
+        residue["has_blank_altloc"] |= altloc == " "
+        return
+    _, selected_occupancy, disordered = atoms[name]
+    if altloc == " ":
+        return
+    if occupancy > selected_occupancy or (not disordered and occupancy == selected_occupancy):
+        atoms[name] = (row, occupancy, True)
+    else:
+        atoms[name] = (*atoms[name][:2], True)
+
+
+def init_residue(chain, residue_id, resname):
+    residue = chain.get(residue_id)
+    if residue is None:
+        chain[residue_id] = {"resname": resname, "atoms": {resname: {}}, "has_blank_altloc": False}
+        return chain[residue_id]
+    if resname in residue["atoms"]:
+        residue["resname"] = resname
+        return residue
+    if residue["has_blank_altloc"]:
+        return None
+    residue["atoms"][resname] = {}
+    residue["resname"] = resname
+    return residue
+
+
+def build_chains(atom_site, seq_id_column):
+    chains = {}
+    current_chain_id = None
+    current_residue_id = None
+    current_resname = None
+    residue = None
+    rows = zip(
+        atom_site["group_PDB"],
+        atom_site["auth_asym_id"],
+        atom_site["label_comp_id"],
+        atom_site[seq_id_column],
+        atom_site["pdbx_PDB_ins_code"],
+        atom_site["label_atom_id"],
+        atom_site["label_alt_id"],
+        atom_site["occupancy"],
+    )
+    for row, (group, chain_id, resname, seq_id, icode, name, altloc, occupancy) in enumerate(rows):
+        if seq_id == ".":
+            continue
+        hetflag = ("W" if resname in ("HOH", "WAT") else "H") if group == "HETATM" else " "
+        residue_id = (hetflag, int(seq_id), " " if icode in UNASSIGNED else icode)
+        if current_chain_id != chain_id:
+            current_chain_id = chain_id
+            chain = chains.setdefault(chain_id, {})
+            current_residue_id = None
+            current_resname = None
+        if current_residue_id != residue_id or current_resname != resname:
+            current_residue_id = residue_id
+            current_resname = resname
+            residue = init_residue(chain, residue_id, resname)
+        if residue is not None:
+            altloc = " " if altloc in UNASSIGNED else altloc
+            add_residue_atom(residue, name, row, altloc, float(occupancy))
+    return chains
+
+
+def parse_chain(structure_id, chain_id, chain, label_chain, coords):
+    positions = []
+    label_positions = []
+    res_codes = []
+    backbone_rows = []
+    for (residue_id, residue), label_residue_id in zip(chain.items(), label_chain.keys()):
+        _, position, insert_code = residue_id
+        if insert_code != " ":
+            raise ValueError(f"Insert codes are not supported: {insert_code}")
+        atoms = residue["atoms"][residue["resname"]]
+        if any(a not in atoms for a in BACKBONE_ATOMS):
+            continue
+        backbone_rows.append([atoms[a][0] for a in BACKBONE_ATOMS])
+        positions.append(position)
+        res_codes.append(get_1l_res_code(residue["resname"]))
+        label_positions.append(label_residue_id[1])
+    rotations, translations = compute_residue_frames(
+        coords[np.array(backbone_rows, dtype=np.int64).reshape(-1, len(BACKBONE_ATOMS))]
+    )
+    return {
+        "structure_id": structure_id,
+        "chain_id": chain_id,
+        "sequence": "".join(res_codes),
+        "positions": positions,
+        "label_positions": label_positions,
+        "rotations": rotations,
+        "translations": translations,
+    }
+
+
+def parse_atom_site(structure_id, atom_site):
+    num_models = count_models(atom_site)
+    if num_models != 1:
+        raise ValueError(f"Multi model mmCIF files are not supported, got {num_models}")
+    coords = np.stack(
+        [np.array(atom_site[f"Cartn_{axis}"], dtype=np.float32) for axis in "xyz"], axis=-1
+    ).astype(np.float64)
+    auth_seq_id = "auth_seq_id" if "auth_seq_id" in atom_site else "label_seq_id"
+    chains = build_chains(atom_site, auth_seq_id)
+    label_chains = build_chains(atom_site, "label_seq_id")
+    result = [
+        parse_chain(structure_id, chain_id, chain, label_chain, coords)
+        for (chain_id, chain), label_chain in zip(chains.items(), label_chains.values())
+    ]
+    return [c for c in result if len(c["sequence"]) > 0]
+
+
+def parse_mmcif_file(filepath, capture_errors):
+    try:
+        return parse_atom_site(get_model_id(filepath), read_atom_site(filepath))
+    except Exception as e:
+        logging.warning(f"Caught exception for file={filepath}, error={e}")
+        if not capture_errors:
+            raise e
+        return []
@@ -1,6 +1,5 @@
 import glob
 import gzip
-import itertools
 import logging
 import math
 import numpy as np
@@ -8,15 +7,23 @@ import os
 import pickle
 from functools import partial
 from io import StringIO
-from itertools import batched
 from pathlib import Path
 from scipy.sparse import coo_array
 from tempfile import NamedTemporaryFile
 
+from nanofold.common.msa_metadata import COMPRESSED_MSA_FIELDS
 from nanofold.common.residue_definitions import RESIDUE_INDEX_MSA
 from nanofold.common.residue_definitions import UNKNOWN_RESIDUE
 from nanofold.preprocess import a3m_parser
 from nanofold.preprocess import sto_parser
+from nanofold.preprocess.scheduler import TIMINGS_FILE
+from nanofold.preprocess.scheduler import RuntimeModel
+from nanofold.preprocess.scheduler import call_with_usage
+from nanofold.preprocess.scheduler import schedule
+from nanofold.preprocess.search_cache import count_avoided_searches
+from nanofold.preprocess.search_cache import split_by_sequence
+
+MIN_CHAIN_LENGTH = 32
 
 
 def get_chains_to_process(db_manager, exclude_dir=None, include_dirs=None, max_chains=None):
@@ -42,7 +49,7 @@ def get_chains_to_process(db_manager, exclude_dir=None, include_dirs=None, max_c
                 include_ids is None
                 or f"{c['_id']['structure_id']}_{c['_id']['chain_id']}" in include_ids
             )
-            and len(c["sequence"]) >= 32
+            and len(c["sequence"]) >= MIN_CHAIN_LENGTH
         ):
             yield c
             if max_chains is not None:
@@ -102,7 +109,30 @@ def to_sparse_features(msa_feat):
         result[f"{k}_shape"] = square_arr.shape
         result[f"{k}_data"] = sparse_arr.data.tolist()
         result[f"{k}_coords"] = [c.tolist() for c in sparse_arr.coords]
-    return result
+    return add_row_pointers(result)
+
+
+def add_row_pointers(sparse_feat):
+    for k in COMPRESSED_MSA_FIELDS.keys():
+        if f"{k}_indptr" in sparse_feat:
+            continue
+        rows, cols = np.array(sparse_feat[f"{k}_coords"], dtype=np.int32).reshape(2, -1)
+        order = np.lexsort((cols, rows))
+        sparse_feat[f"{k}_data"] = np.asarray(sparse_feat[f"{k}_data"])[order].tolist()
+        sparse_feat[f"{k}_coords"] = [rows[order].tolist(), cols[order].tolist()]
+        sparse_feat[f"{k}_indptr"] = np.searchsorted(
+            rows[order], np.arange(sparse_feat[f"{k}_shape"][0] + 1)
+        ).tolist()
+    return sparse_feat
+
+
+def get_msa_output(msa_output_dir, chain):
+    return msa_output_dir / f"{chain['_id']['structure_id']}_{chain['_id']['chain_id']}.pkl.gz"
+
+
+def write_msa(msa_output_dir, chain, features):
+    with gzip.open(get_msa_output(msa_output_dir, chain), "wb") as f:
+        pickle.dump(features, f)
 
 
 def get_msa(uniclust30_msa_search, small_bfd_msa_search, chain, num_seq=4096):
@@ -143,19 +173,25 @@ def get_msa(uniclust30_msa_search, small_bfd_msa_search, chain, num_seq=4096):
     return {**to_sparse_features(msa_features), **profile_features}
 
 
-def prefetch_msa(msa_runner, db_manager, executor, output_dir, batch_size=50):
-    chains = get_chains_to_process(db_manager, output_dir)
+def prefetch_msa(msa_runner, db_manager, executor, output_dir, num_workers, memory_limit=None):
+    chains = list(get_chains_to_process(db_manager, output_dir))
     prefetch = partial(execute_msa_search, msa_runner)
+    avoided_searches = count_avoided_searches(msa_runner.cache_dir)
 
-    for j, chain_batch in enumerate(batched(chains, batch_size)):
-        result = executor.map(prefetch, chain_batch)
-        for i, c in enumerate(chain_batch):
+    i = 0
+    for chain_batch in split_by_sequence(chains):
+        for c, future in schedule(
+            executor, prefetch, chain_batch, msa_runner.runtime_model, num_workers, memory_limit
+        ):
             try:
-                next(result)
+                future.result()
             except Exception as e:
                 logging.error(f"Failure while prefetching MSA for chain {c['_id']}: {repr(e)}")
                 continue
-            logging.info(f"Prefetched raw MSA for {j * batch_size + i} chains")
+            i += 1
+            logging.info(f"Prefetched raw MSA for {i}/{len(chains)} chains")
+    avoided_searches = count_avoided_searches(msa_runner.cache_dir) - avoided_searches
+    logging.info(f"Avoided {avoided_searches} searches of chains with an already searched sequence")
 
 
 def build_msa(
@@ -165,38 +201,27 @@ def build_msa(
     executor,
     msa_output_dir,
     include_dirs,
-    batch_size=50,
+    num_workers,
+    memory_limit=None,
 ):
-    chains = get_chains_to_process(
-        db_manager, exclude_dir=msa_output_dir, include_dirs=include_dirs
+    chains = list(
+        get_chains_to_process(db_manager, exclude_dir=msa_output_dir, include_dirs=include_dirs)
+    )
+    runtime_model = RuntimeModel(msa_output_dir / TIMINGS_FILE)
+    get_msa_func = partial(
+        call_with_usage, partial(get_msa, uniclust30_msa_search, small_bfd_msa_search)
     )
 
-    get_msa_func = partial(get_msa, uniclust30_msa_search, small_bfd_msa_search)
-
-    for j, chain_batch in enumerate(batched(chains, batch_size)):
-        chain_batch_small = [c for c in chain_batch if len(c["sequence"]) < 600]
-        chain_batch_large = [c for c in chain_batch if c not in chain_batch_small]
-        chain_batch = itertools.chain(chain_batch_small, chain_batch_large)
-        result = itertools.chain(
-            executor.map(get_msa_func, chain_batch_small),
-            (get_msa_func(c) for c in chain_batch_large),
-        )
-        i = 0
-        while True:
-            try:
-                c = next(chain_batch)
-                features = next(result)
-                with gzip.open(
-                    msa_output_dir / f"{c['_id']['structure_id']}_{c['_id']['chain_id']}.pkl.gz",
-                    "wb",
-                ) as f:
-                    pickle.dump(features, f)
-            except StopIteration:
-                break
-            except Exception as e:
-                logging.error(
-                    f"Failure fetching alignment contents for chain {c['_id']}: {repr(e)}"
-                )
-                continue
-            logging.info(f"Fetched MSA alignments for {j * batch_size + i} chains")
-            i += 1
+    i = 0
+    for c, future in schedule(
+        executor, get_msa_func, chains, runtime_model, num_workers, memory_limit
+    ):
+        try:
+            features, seconds, memory = future.result()
+            write_msa(msa_output_dir, c, features)
+        except Exception as e:
+            logging.error(f"Failure fetching alignment contents for chain {c['_id']}: {repr(e)}")
+            continue
+        runtime_model.record(len(c["sequence"]), seconds, memory)
+        i += 1
+        logging.info(f"Fetched MSA alignments for {i}/{len(chains)} chains")
@@ -1,19 +1,37 @@
+import fcntl
 import gzip
 import logging
 import os
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from pathlib import Path
+from tempfile import TemporaryFile
 
+from nanofold.preprocess.scheduler import TIMINGS_FILE
+from nanofold.preprocess.scheduler import RuntimeModel
+from nanofold.preprocess.scheduler import get_query_length
+from nanofold.preprocess.scheduler import run_with_usage
+from nanofold.preprocess.search_cache import get_shared_output
+from nanofold.preprocess.search_cache import link_shared_result
+from nanofold.preprocess.sto_parser import stream_truncate_sto
 from nanofold.preprocess.sto_parser import truncate_sto
 
+PIPE_SIZE = 1024**2
+
 
 class MSARunner:
-    def __init__(self, jackhmmer_bin, small_bfd, cache_dir, num_cpus, max_sequences):
+    def __init__(
+        self, jackhmmer_bin, small_bfd, cache_dir, num_cpus, max_sequences, stream_output=False
+    ):
         self.jackhmmer_bin = jackhmmer_bin
         self.small_bfd = small_bfd
         self.cache_dir = cache_dir
         self.num_cpus = num_cpus
         self.max_sequences = max_sequences
+        self.stream_output = stream_output
+        self.runtime_model = RuntimeModel(cache_dir / TIMINGS_FILE)
 
     def build_jackhmmer_cmd(self, input, output):
         return [
@@ -67,6 +85,64 @@ class MSARunner:
                 f.write(contents)
                 f.truncate()
 
+    def run_jackhmmer(self, fasta_input, output):
+        cmd = self.build_jackhmmer_cmd(fasta_input, output)
+        with TemporaryFile() as stderr:
+            returncode, seconds, memory = run_with_usage(
+                cmd, stdout=subprocess.DEVNULL, stderr=stderr
+            )
+            if returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().decode("utf-8")
+                logging.error(message)
+                raise subprocess.CalledProcessError(returncode, cmd, stderr=message)
+        return seconds, memory
+
+    def search(self, fasta_input, tmp_output, shared_output):
+        usage = self.run_jackhmmer(fasta_input, tmp_output)
+        self.truncate_sto(tmp_output)
+        os.rename(tmp_output, shared_output)
+        self.cached_result(shared_output)
+        return usage
+
+    def write_truncated(self, fifo, output):
+        with open(fifo) as f, gzip.open(output, "wt") as gz_f:
+            set_pipe_size = getattr(fcntl, "F_SETPIPE_SZ", None)
+            if set_pipe_size is not None:
+                with suppress(OSError):
+                    fcntl.fcntl(f, set_pipe_size, PIPE_SIZE)
+            if self.max_sequences is None:
+                shutil.copyfileobj(f, gz_f)
+            else:
+                stream_truncate_sto(f, gz_f, self.max_sequences)
+
+    def search_streamed(self, fasta_input, tmp_output, shared_output):
+        tmp_zip_output = Path(f"{tmp_output}.gz")
+        if os.path.lexists(tmp_output):
+            os.remove(tmp_output)
+        os.mkfifo(tmp_output)
+        try:
+            with ThreadPoolExecutor(1) as reader:
+                written = reader.submit(self.write_truncated, tmp_output, tmp_zip_output)
+                try:
+                    usage = self.run_jackhmmer(fasta_input, tmp_output)
+                finally:
+                    # Unblocks the reader if jackhmmer exited without opening the alignment output
+                    try:
+                        os.close(os.open(tmp_output, os.O_WRONLY | os.O_NONBLOCK))
+                    except OSError:
+                        pass
+                written.result()
+            os.rename(tmp_zip_output, f"{shared_output}.gz")
+            return usage
+        finally:
+            os.remove(tmp_output)
+            if tmp_zip_output.exists():
+                os.remove(tmp_zip_output)
+
+    def search_params(self):
+        return ["jackhmmer", self.small_bfd, self.max_sequences]
+
     def run(self, fasta_input, id):
         output = self.cache_dir / f"{id}.sto"
         tmp_output = self.cache_dir / f"{id}.sto.tmp"
@@ -74,13 +150,12 @@ class MSARunner:
         cached_result = self.cached_result(output)
         if cached_result is not None:
             return cached_result
-        cmd = self.build_jackhmmer_cmd(fasta_input, tmp_output)
-        try:
-            subprocess.run(cmd, capture_output=True, check=True)
-        except subprocess.CalledProcessError as e:
-            logging.error(e.stderr.decode("utf-8"))
-            raise e
-
-        self.truncate_sto(tmp_output)
-        os.rename(tmp_output, output)
+        shared_output = get_shared_output(self.cache_dir, fasta_input, self.search_params(), ".sto")
+        if self.cached_result(shared_output) is None:
+            if self.stream_output:
+                seconds, memory = self.search_streamed(fasta_input, tmp_output, shared_output)
+            else:
+                seconds, memory = self.search(fasta_input, tmp_output, shared_output)
+            self.runtime_model.record(get_query_length(fasta_input), seconds, memory)
+        link_shared_result(shared_output, output)
         return self.cached_result(output)
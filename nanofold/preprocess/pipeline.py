@@ -0,0 +1,246 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from nanofold.preprocess.mmcif_processor import MMCIF_PARSERS
+from nanofold.preprocess.mmcif_processor import get_files_to_process
+from nanofold.preprocess.mmcif_processor import insert_chains
+from nanofold.preprocess.msa_builder import MIN_CHAIN_LENGTH
+from nanofold.preprocess.msa_builder import execute_msa_search
+from nanofold.preprocess.msa_builder import get_msa
+from nanofold.preprocess.msa_builder import get_msa_output
+from nanofold.preprocess.msa_builder import write_msa
+from nanofold.preprocess.template import get_hhr
+from nanofold.preprocess.template import update_template_features
+
+STAGE_CPU_SHARES = {
+    "mmcif": 0.1,
+    "small_bfd": 0.4,
+    "uniclust30": 0.3,
+    "msa": 0.1,
+    "templates": 0.1,
+}
+STOP = object()
+
+
+def allocate_workers(num_cpus, cpus_per_job):
+    return {
+        stage: max(1, int(num_cpus * share) // cpus_per_job.get(stage, 1))
+        for stage, share in STAGE_CPU_SHARES.items()
+    }
+
+
+def describe(item):
+    return item["_id"] if isinstance(item, dict) else item
+
+
+class Stage:
+    def __init__(self, name, fn, num_workers, queue_size, next_stage=None):
+        self.name = name
+        self.fn = fn
+        self.next_stage = next_stage
+        self.input = queue.Queue(queue_size)
+        self.num_processed = 0
+        self.num_failed = 0
+        self.lock = threading.Lock()
+        self.workers = [threading.Thread(target=self.work) for _ in range(num_workers)]
+
+    def start(self):
+        for w in self.workers:
+            w.start()
+        return self
+
+    def put(self, item):
+        self.input.put(item)
+
+    def close(self):
+        for _ in self.workers:
+            self.input.put(STOP)
+
+    def join(self):
+        for w in self.workers:
+            w.join()
+        logging.info(
+            f"Stage {self.name} finished {self.num_processed} items, {self.num_failed} failed"
+        )
+
+    def work(self):
+        while (item := self.input.get()) is not STOP:
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                logging.error(f"Failure in stage {self.name} for {describe(item)}: {repr(e)}")
+                with self.lock:
+                    self.num_failed += 1
+                continue
+            with self.lock:
+                self.num_processed += 1
+            logging.debug(f"Stage {self.name} finished {describe(item)}")
+            if self.next_stage is not None:
+                for r in result:
+                    self.next_stage.put(r)
+
+
+class SequenceLocks:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def __call__(self, sequence):
+        with self.lock:
+            return self.locks.setdefault(sequence, threading.Lock())
+
+
+def to_pipeline_chain(chain):
+    return {
+        "_id": {"structure_id": chain["structure_id"], "chain_id": chain["chain_id"]},
+        "sequence": chain["sequence"],
+    }
+
+
+def parse_file(executor, parse_fn, db_manager, filepath):
+    chains = executor.submit(parse_fn, filepath, capture_errors=True).result()
+    insert_chains(db_manager, filepath, chains)
+    return [to_pipeline_chain(c) for c in chains if len(c["sequence"]) >= MIN_CHAIN_LENGTH]
+
+
+def search(msa_runner, locks, chain):
+    with locks(chain["sequence"]):
+        execute_msa_search(msa_runner, chain)
+    return [chain]
+
+
+def build_msa_features(executor, get_msa_func, msa_output_dir, chain):
+    if not get_msa_output(msa_output_dir, chain).exists():
+        write_msa(msa_output_dir, chain, executor.submit(get_msa_func, chain).result())
+    return [chain]
+
+
+def build_templates(
+    hhblits_runner,
+    reformat_bin,
+    msa_runner,
+    db_manager,
+    max_templates,
+    locks,
+    parsed,
+    deferred,
+    chain,
+):
+    with locks(chain["sequence"]):
+        hhr_output = get_hhr(hhblits_runner, reformat_bin, msa_runner, chain)
+    if not parsed.is_set():
+        deferred.append((chain, hhr_output))
+        return []
+    update_template_features(db_manager, chain, hhr_output, max_templates)
+    return []
+
+
+def get_seed_chains(db_manager):
+    chains = db_manager.chains().find({"templates": {"$exists": 0}}, {"_id": 1, "sequence": 1})
+    return [c for c in chains if len(c["sequence"]) >= MIN_CHAIN_LENGTH]
+
+
+def run_pipeline(
+    db_manager,
+    mmcif_dir,
+    small_bfd_msa_search,
+    uniclust30_msa_search,
+    pdb70_template_search,
+    reformat_bin,
+    msa_output_dir,
+    num_cpus,
+    queue_size=100,
+    mmcif_parser="native",
+    max_templates=20,
+):
+    workers = allocate_workers(
+        num_cpus,
+        {
+            "small_bfd": small_bfd_msa_search.num_cpus,
+            "uniclust30": uniclust30_msa_search.num_cpu,
+            "templates": pdb70_template_search.num_cpu,
+        },
+    )
+    logging.info(f"Running preprocessing pipeline with {num_cpus} CPUs, workers {workers}")
+    seeds = get_seed_chains(db_manager)
+    files = get_files_to_process(db_manager, mmcif_dir)
+    parsed = threading.Event()
+    deferred = []
+
+    with ProcessPoolExecutor(workers["mmcif"]) as mmcif_executor, ProcessPoolExecutor(
+        workers["msa"]
+    ) as msa_executor:
+        templates = Stage(
+            "templates",
+            partial(
+                build_templates,
+                pdb70_template_search,
+                reformat_bin,
+                small_bfd_msa_search,
+                db_manager,
+                max_templates,
+                SequenceLocks(),
+                parsed,
+                deferred,
+            ),
+            workers["templates"],
+            queue_size,
+        )
+        msa = Stage(
+            "msa",
+            partial(
+                build_msa_features,
+                msa_executor,
+                partial(get_msa, uniclust30_msa_search, small_bfd_msa_search),
+                msa_output_dir,
+            ),
+            workers["msa"],
+            queue_size,
+            templates,
+        )
+        uniclust30 = Stage(
+            "uniclust30",
+            partial(search, uniclust30_msa_search, SequenceLocks()),
+            workers["uniclust30"],
+            queue_size,
+            msa,
+        )
+        # Unbounded so that parsing, which gates template features, is never throttled by searches
+        small_bfd = Stage(
+            "small_bfd",
+            partial(search, small_bfd_msa_search, SequenceLocks()),
+            workers["small_bfd"],
+            0,
+            uniclust30,
+        )
+        mmcif = Stage(
+            "mmcif",
+            partial(parse_file, mmcif_executor, MMCIF_PARSERS[mmcif_parser], db_manager),
+            workers["mmcif"],
+            queue_size,
+            small_bfd,
+        )
+        stages = [mmcif, small_bfd, uniclust30, msa, templates]
+        for stage in stages:
+            stage.start()
+
+        for f in files:
+            mmcif.put(f)
+        mmcif.close()
+        for c in seeds:
+            small_bfd.put(c)
+        mmcif.join()
+        parsed.set()
+        for stage in stages[1:]:
+            stage.close()
+            stage.join()
+
+    logging.info(f"Building {len(deferred)} template features deferred until parsing finished")
+    for chain, hhr_output in deferred:
+        try:
+            update_template_features(db_manager, chain, hhr_output, max_templates)
+        except Exception as e:
+            logging.error(f"Failed to build template features for chain {chain['_id']}: {e}")
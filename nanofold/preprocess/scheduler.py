@@ -0,0 +1,122 @@
+import json
+import numpy as np
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+TIMINGS_FILE = "timings.jsonl"
+MIN_OBSERVATIONS = 5
+
+
+def get_total_memory():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**2
+
+
+def get_query_length(input):
+    length = 0
+    with open(input) as f:
+        next(f)
+        for line in f:
+            if line.startswith(">"):
+                break
+            length += sum(c not in "-." for c in line.strip())
+    return length
+
+
+def fit_power_law(points, upper_bound=False):
+    points = [(x, y) for x, y in points if x > 0 and y is not None and y > 0]
+    if len(points) < MIN_OBSERVATIONS or len(set(x for x, _ in points)) < 2:
+        return None
+    log_x, log_y = np.log(np.array(points, dtype=np.float64)).T
+    slope, intercept = np.polyfit(log_x, log_y, 1)
+    if upper_bound:
+        intercept += np.max(log_y - (slope * log_x + intercept))
+    return slope, intercept
+
+
+def evaluate_power_law(fit, x):
+    slope, intercept = fit
+    return float(np.exp(intercept) * x**slope)
+
+
+class RuntimeModel:
+    def __init__(self, path):
+        self.path = path
+        self.fit()
+
+    def observations(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def record(self, length, seconds, memory):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"length": length, "seconds": seconds, "memory": memory}) + "\n")
+
+    def fit(self):
+        observations = self.observations()
+        self.seconds = fit_power_law([(o["length"], o["seconds"]) for o in observations])
+        self.memory = fit_power_law(
+            [(o["length"], o["memory"]) for o in observations], upper_bound=True
+        )
+
+    def predict(self, length):
+        seconds = evaluate_power_law(self.seconds, length) if self.seconds else float(length)
+        memory = evaluate_power_law(self.memory, length) if self.memory else None
+        return seconds, memory
+
+
+def run_with_usage(cmd, **kwargs):
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, **kwargs)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, time.perf_counter() - start, usage.ru_maxrss / 1024
+
+
+def read_memory_status():
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return int(status["VmRSS"].split()[0]) / 1024, int(status["VmHWM"].split()[0]) / 1024
+
+
+def reset_peak_memory():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return read_memory_status()[0]
+    except OSError:
+        return None
+
+
+def call_with_usage(fn, *args):
+    start = time.perf_counter()
+    memory = reset_peak_memory()
+    result = fn(*args)
+    if memory is not None:
+        memory = read_memory_status()[1] - memory
+    return result, time.perf_counter() - start, memory if memory and memory > 0 else None
+
+
+def schedule(executor, fn, chains, model, num_workers, memory_limit=None):
+    model.fit()
+    predictions = [model.predict(len(c["sequence"])) for c in chains]
+    order = sorted(range(len(chains)), key=lambda i: predictions[i][0])
+    running = {}
+    used_memory = 0
+    while order or running:
+        while order and len(running) < num_workers:
+            memory = predictions[order[-1]][1] or 0
+            if running and memory_limit is not None and used_memory + memory > memory_limit:
+                break
+            chain = chains[order.pop()]
+            running[executor.submit(fn, chain)] = (chain, memory)
+            used_memory += memory
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            chain, memory = running.pop(future)
+            used_memory -= memory
+            yield chain, future
@@ -0,0 +1,41 @@
+import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+
+SHARED_DIR = "shared"
+
+
+def get_search_key(input, params):
+    key = hashlib.sha256(json.dumps([str(p) for p in params]).encode())
+    with open(input) as f:
+        for line in f:
+            key.update(b">" if line.startswith(">") else line.strip().encode())
+    return key.hexdigest()
+
+
+def get_shared_output(cache_dir, input, params, suffix):
+    shared_dir = Path(cache_dir) / SHARED_DIR
+    shared_dir.mkdir(exist_ok=True)
+    return shared_dir / f"{get_search_key(input, params)}{suffix}"
+
+
+def link_shared_result(shared_output, output):
+    link = Path(f"{output}.gz")
+    if not os.path.lexists(link):
+        os.symlink(Path(SHARED_DIR) / f"{shared_output.name}.gz", link)
+
+
+def count_avoided_searches(cache_dir):
+    links = [f for f in glob.glob(os.path.join(cache_dir, "*.gz")) if os.path.islink(f)]
+    shared = glob.glob(os.path.join(cache_dir, SHARED_DIR, "*.gz"))
+    return len(links) - len(shared)
+
+
+def split_by_sequence(chains):
+    unique = {}
+    for c in chains:
+        unique.setdefault(c["sequence"], c)
+    first = set(id(c) for c in unique.values())
+    return list(unique.values()), [c for c in chains if id(c) not in first]
@@ -54,19 +54,17 @@ def extract_alignments(input):
     return compress_alignment_gaps(alignments), deletion_matrix
 
 
+def keep_sto_line(line, sequences):
+    if line.startswith("#"):
+        if line.startswith("#=GS"):
+            return line.split(maxsplit=2)[1] in sequences
+        return line.startswith(("# STOCKHOLM", "#=GC RF"))
+    return line.isspace() or line.strip() == "//" or line.split(maxsplit=1)[0] in sequences
+
+
 def filter_sto_by_sequences(input, sequences):
     input.seek(0)
-    keep_line = lambda line: any(
-        [
-            line.isspace(),
-            line.strip() == "//",
-            line.startswith("# STOCKHOLM"),
-            line.startswith("#=GC RF"),
-            line.startswith("#=GS") and line.split()[1] in sequences,
-            not (line.startswith("#") or line.isspace()) and line.split()[0] in sequences,
-        ]
-    )
-    return "".join([line for line in input if keep_line(line)])
+    return "".join([line for line in input if keep_sto_line(line, sequences)])
 
 
 def truncate_sto(input, max_sequences):
@@ -74,6 +72,26 @@ def truncate_sto(input, max_sequences):
     return filter_sto_by_sequences(input, sequences)
 
 
+def stream_truncate_sto(input, output, max_sequences):
+    sequences = set()
+    buffer = []
+    for line in input:
+        if line.startswith("#") and not line.startswith(("# STOCKHOLM", "#=GC RF", "#=GS")):
+            continue
+        if buffer is None:
+            if keep_sto_line(line, sequences):
+                output.write(line)
+            continue
+        if is_alignment_line(line) and len(sequences) < max_sequences:
+            sequences.add(line.split()[0])
+        buffer.append(line)
+        if len(sequences) >= max_sequences:
+            output.writelines(line for line in buffer if keep_sto_line(line, sequences))
+            buffer = None
+    if buffer is not None:
+        output.writelines(line for line in buffer if keep_sto_line(line, sequences))
+
+
 def convert_to_a2m(reformat_bin, msa_sto, a2m_file):
     with NamedTemporaryFile(mode="w") as tmp:
         for s in msa_sto:
@@ -9,6 +9,8 @@ from tempfile import NamedTemporaryFile
 from nanofold.common.residue_definitions import UNKNOWN_RESIDUE
 from nanofold.common.residue_definitions import MSA_GAP
 from nanofold.preprocess.msa_builder import execute_msa_search
+from nanofold.preprocess.search_cache import count_avoided_searches
+from nanofold.preprocess.search_cache import split_by_sequence
 from nanofold.preprocess.sto_parser import convert_to_a2m
 from nanofold.preprocess.hhr_parser import parse_hhr
 
@@ -140,18 +142,30 @@ def get_hhr(hhblits_runner, reformat_bin, msa_runner, chain):
         return hhblits_runner.run(a2m_file.name, id)
 
 
+def update_template_features(db_manager, chain, hhr_output, max_templates):
+    templates = parse_hhr(hhr_output())
+    features = extract_template_features(
+        templates, db_manager, len(chain["sequence"]), max_templates
+    )
+    db_manager.chains().update_one(
+        {"_id": chain["_id"]},
+        {"$set": {"templates": features}},
+    )
+
+
 def get_hhr_contents(hhblits_runner, reformat_bin, msa_runner, executor, chains, batch_size=50):
     get_result = partial(get_hhr, hhblits_runner, reformat_bin, msa_runner)
     for i, batch in enumerate(batched(chains, batch_size)):
-        result = executor.map(get_result, batch)
-        for chain in batch:
-            try:
-                yield chain, next(result)
-            except Exception as e:
-                logging.error(
-                    f"Failure while searching for templates for chain {chain['_id']}: {e}"
-                )
-                continue
+        for chain_batch in split_by_sequence(batch):
+            futures = [(c, executor.submit(get_result, c)) for c in chain_batch]
+            for chain, future in futures:
+                try:
+                    yield chain, future.result()
+                except Exception as e:
+                    logging.error(
+                        f"Failure while searching for templates for chain {chain['_id']}: {e}"
+                    )
+                    continue
         logging.info(f"Constructed template features for {i * batch_size + len(batch)} chains")
 
 
@@ -166,18 +180,16 @@ def build_template(
 ):
     chains = get_chains_to_process(db_manager, msa_output_dir)
     logging.info("Building template features")
+    avoided_searches = count_avoided_searches(hhblits_runner.cache_dir)
     for chain, hhr_output in get_hhr_contents(
         hhblits_runner, reformat_bin, msa_runner, executor, chains
     ):
         try:
-            templates = parse_hhr(hhr_output())
-            features = extract_template_features(
-                templates, db_manager, len(chain["sequence"]), max_templates
-            )
-            db_manager.chains().update_one(
-                {"_id": chain["_id"]},
-                {"$set": {"templates": features}},
-            )
+            update_template_features(db_manager, chain, hhr_output, max_templates)
             logging.info("Built template features for chain %s", chain["_id"])
         except Exception as e:
             logging.error(f"Failed to build template features for chain {chain['_id']}: {e}")
+    avoided_searches = count_avoided_searches(hhblits_runner.cache_dir) - avoided_searches
+    logging.info(
+        f"Avoided {avoided_searches} template searches of chains with an already searched MSA"
+    )
@@ -5,6 +5,7 @@ import torch
 from pathlib import Path
 
 from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.chain_dataset import collate_features
 from nanofold.train.trainer import Trainer
 
 
@@ -54,8 +55,18 @@ def main():
         1.0,
         params["residue_crop_size"],
         params["num_msa"],
+        zero_copy=params.get("zero_copy_sampling", False),
+        lazy=params.get("lazy_load_features", False),
+        num_length_buckets=params.get("num_length_buckets", 0),
+        bucket_run_length=params.get("length_bucket_run_length", 1),
+    )
+    batch_size = params.get("batch_size")
+    data_loader = torch.utils.data.DataLoader(
+        dataset,
+        batch_size=batch_size,
+        collate_fn=collate_features if batch_size is not None else None,
+        pin_memory=True,
     )
-    data_loader = torch.utils.data.DataLoader(dataset, batch_size=None, pin_memory=True)
 
     if "time" in args.mode:
         with torch.profiler.profile(
@@ -68,11 +79,13 @@ def main():
             trainer = ProfiledTrainer(prof, params, loggers=[], checkpoint_save_freq=1)
             trainer.fit(data_loader, None, max_epoch=6)
     if "memory" in args.mode:
+        batches = iter(data_loader)
         for _ in range(50):
-            batch = next(iter(data_loader))
+            batch = next(batches)
+            num_msa = batch["msa_index"].size(-2) if "msa_index" in batch else batch["msa"].size(-3)
             if (
-                len(batch["msa"]) == params["num_msa"]
-                and len(batch["restype"]) == params["residue_crop_size"]
+                num_msa == params["num_msa"]
+                and batch["restype"].size(-2) == params["residue_crop_size"]
             ):
                 break
         torch.cuda.memory._record_memory_history(max_entries=100000)
@@ -1,12 +1,19 @@
 import argparse
 import json
 import logging
+import numpy as np
 import os
 import torch
 from pathlib import Path
 
 from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.chain_dataset import collate_features
 from nanofold.train.checkpoint_loader import CheckpointLoader
+from nanofold.train.distributed import broadcast_object
+from nanofold.train.distributed import destroy_distributed
+from nanofold.train.distributed import get_rank
+from nanofold.train.distributed import get_world_size
+from nanofold.train.distributed import init_distributed
 from nanofold.train.logging import Logger
 from nanofold.train.logging import MLFlowLogger
 from nanofold.train.trainer import Trainer
@@ -55,19 +62,34 @@ def get_dataloaders(args, params):
         params["train_split"],
         params["residue_crop_size"],
         params["num_msa"],
+        zero_copy=params.get("zero_copy_sampling", False),
+        lazy=params.get("lazy_load_features", False),
+        num_length_buckets=params.get("num_length_buckets", 0),
+        bucket_run_length=params.get("length_bucket_run_length", 1),
+        rank=get_rank(),
+        world_size=get_world_size(),
     )
+    batch_size = params.get("batch_size")
+    collate_fn = collate_features if batch_size is not None else None
+    prefetch_factor = params.get("prefetch_factor", 2)
     return (
         torch.utils.data.DataLoader(
             train_data,
-            batch_size=None,
+            batch_size=batch_size,
+            collate_fn=collate_fn,
             pin_memory=True,
             num_workers=4,
+            persistent_workers=True,
+            prefetch_factor=prefetch_factor,
         ),
         torch.utils.data.DataLoader(
             test_data,
-            batch_size=None,
+            batch_size=batch_size,
+            collate_fn=collate_fn,
             pin_memory=True,
             num_workers=1,
+            persistent_workers=True,
+            prefetch_factor=prefetch_factor,
         ),
     )
 
@@ -91,18 +113,26 @@ def main():
         checkpoint = None
         run_id = None
 
-    loggers = [Logger(log_every_n_epoch=args.log_freq)]
-    if args.mlflow:
-        loggers.append(
-            MLFlowLogger(
-                uri=mlflow_uri,
-                pip_requirements="requirements/requirements.train.txt",
-                log_every_n_epoch=args.mlflow_log_freq,
-                run_id=run_id,
+    init_distributed(params["device"])
+    seed = broadcast_object(np.random.randint(2**31))
+    np.random.seed(seed)
+    train_loader, test_loader = get_dataloaders(args, params)
+    np.random.seed(seed + get_rank())
+    torch.manual_seed(seed + get_rank())
+
+    loggers = []
+    if get_rank() == 0:
+        loggers.append(Logger(log_every_n_epoch=args.log_freq))
+        if args.mlflow:
+            loggers.append(
+                MLFlowLogger(
+                    uri=mlflow_uri,
+                    pip_requirements="requirements/requirements.train.txt",
+                    log_every_n_epoch=args.mlflow_log_freq,
+                    run_id=run_id,
+                )
             )
-        )
 
-    train_loader, test_loader = get_dataloaders(args, params)
     trainer = Trainer(
         params,
         loggers,
@@ -110,6 +140,7 @@ def main():
         checkpoint=checkpoint,
     )
     trainer.fit(train_loader, test_loader, args.max_epoch)
+    destroy_distributed()
 
 
 if __name__ == "__main__":
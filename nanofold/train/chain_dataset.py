@@ -1,11 +1,15 @@
 import logging
 import numpy as np
+import os
 import pyarrow as pa
 import pyarrow.compute as pc
 import torch
 import torch.nn.functional as F
+import warnings
 from torch.utils.data import IterableDataset
 
+from nanofold.common.feature_layout import get_layout
+from nanofold.common.feature_layout import TENSOR_LAYOUT
 from nanofold.common.msa_metadata import COMPRESSED_MSA_FIELDS
 from nanofold.common.residue_definitions import get_atom_positions
 from nanofold.common.residue_definitions import MSA_GAP
@@ -15,105 +19,383 @@ from nanofold.train.frame import Frame
 from nanofold.train.util import uniform_random_rotation
 
 
-def accept_chain(length):
-    return np.random.rand() < max(min(length, 512), 256) / 512
+def acceptance_weights(lengths):
+    return np.clip(lengths, 256, 512) / 512
 
 
-def encode_one_hot(seq):
-    indices = torch.tensor([RESIDUE_INDEX[residue] for residue in seq])
-    return F.one_hot(indices, num_classes=len(RESIDUE_INDEX)).float()
+def weighted_choice(values, cumulative_weights):
+    u = np.random.rand() * cumulative_weights[-1]
+    index = np.searchsorted(cumulative_weights, u, side="right")
+    return values[min(index, len(values) - 1)]
+
+
+def build_residue_lookup(residue_index):
+    lookup = np.full(256, -1, dtype=np.int64)
+    for residue, i in residue_index.items():
+        lookup[ord(residue)] = i
+    return lookup
+
+
+RESIDUE_LOOKUP = build_residue_lookup(RESIDUE_INDEX)
+RESIDUE_LOOKUP_MSA = build_residue_lookup(RESIDUE_INDEX_MSA)
+BACKBONE_COORDS = torch.tensor(
+    [[p[1] for p in get_atom_positions(residue)] for residue in RESIDUE_INDEX.keys()]
+)
+
+
+def encode_residues(seq, lookup):
+    if isinstance(seq, str):
+        seq = np.frombuffer(seq.encode(), dtype=np.uint8)
+    elif isinstance(seq, list):
+        seq = np.stack([np.frombuffer(s.encode(), dtype=np.uint8) for s in seq])
+    return torch.from_numpy(lookup[seq])
+
+
+def to_tensor(array):
+    with warnings.catch_warnings():
+        # Buffers of a memory mapped IPC file are read only, cropped features are never written to
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(array)
+
+
+def is_list(array):
+    return pa.types.is_list(array.type) or pa.types.is_fixed_size_list(array.type)
+
+
+def flatten_list(array):
+    while is_list(array):
+        array = array.flatten()
+    return array.to_numpy(zero_copy_only=False)
+
+
+def crop_list(array, start, length, shape=()):
+    values = flatten_list(array.flatten().slice(start, length))
+    return to_tensor(values.reshape(length, *shape))
+
+
+def crop_nested_list(array, start, length, num_residues, shape=()):
+    values = flatten_list(array).reshape(-1, num_residues, *shape)
+    return to_tensor(values[:, start : start + length])
+
+
+def crop_residue_major(array, start, length, num_residues):
+    values = array.flatten()
+    width = len(values) // num_residues
+    values = values.slice(start * width, length * width).to_numpy()
+    return to_tensor(values.reshape(length, width).T)
+
+
+def get_string_codes(array):
+    while is_list(array):
+        array = array.flatten()
+    _, offsets, data = array.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int32)[array.offset : array.offset + len(array) + 1]
+    if data is None:
+        return np.empty(0, dtype=np.uint8)
+    return np.frombuffer(data, dtype=np.uint8)[offsets[0] : offsets[-1]]
+
+
+def scatter_msa_crop(rows, cols, values, shape, length, feat_size):
+    num_seq = flatten_list(shape)[1] // feat_size
+    dense = np.zeros((num_seq, length, feat_size), dtype=values.dtype)
+    seq_index, feat_index = np.divmod(cols, feat_size)
+    dense[seq_index, rows, feat_index] = values
+    return torch.from_numpy(dense)
+
+
+def decode_sparse_crop(coords, data, shape, start, length, feat_size):
+    rows, cols = flatten_list(coords).reshape(2, -1)
+    values = flatten_list(data)
+    mask = (rows >= start) & (rows < start + length)
+    return scatter_msa_crop(rows[mask] - start, cols[mask], values[mask], shape, length, feat_size)
+
+
+def decode_row_sorted_crop(indptr, coords, data, shape, start, length, feat_size):
+    indptr = indptr.flatten().slice(start, length + 1).to_numpy()
+    begin, count = indptr[0], indptr[-1] - indptr[0]
+    rows = np.repeat(np.arange(length), np.diff(indptr))
+    cols = coords.flatten()[1].values.slice(begin, count).to_numpy()
+    values = data.flatten().slice(begin, count).to_numpy(zero_copy_only=False)
+    return scatter_msa_crop(rows, cols, values, shape, length, feat_size)
+
+
+def pad_to_shape(tensor, shape):
+    padding = []
+    for size, max_size in zip(reversed(tensor.shape), reversed(shape)):
+        padding += [0, max_size - size]
+    return F.pad(tensor, padding)
+
+
+def get_length_mask(lengths):
+    return torch.arange(max(lengths)) < torch.tensor(lengths).unsqueeze(-1)
+
+
+def collate_features(batch):
+    features = {}
+    for k in batch[0].keys():
+        shape = [max(s) for s in zip(*[f[k].shape for f in batch])]
+        features[k] = torch.stack([pad_to_shape(f[k], shape) for f in batch])
+    msa_key = "msa_index" if "msa_index" in batch[0] else "msa"
+    return features | {
+        "residue_mask": get_length_mask([f["residue_index"].size(-1) for f in batch]),
+        "atom_mask": get_length_mask([f["ref_pos"].size(-2) for f in batch]),
+        "msa_mask": get_length_mask([f[msa_key].size(0) for f in batch]),
+        "template_mask": get_length_mask([f["template_restype"].size(-3) for f in batch]),
+    }
+
+
+def get_lengths(table):
+    if get_layout(table.schema) == TENSOR_LAYOUT:
+        return table.column("length").to_numpy()
+    return pc.list_value_length(table.column("positions")).to_numpy()
+
+
+class MemoryMappedTable:
+    def __init__(self, features_file):
+        self.features_file = features_file
+        self.open()
+        num_rows = [self.get_batch(i).num_rows for i in range(self.reader.num_record_batches)]
+        self.batch_offsets = np.cumsum([0] + num_rows)
+
+    def __getstate__(self):
+        return {"features_file": self.features_file, "batch_offsets": self.batch_offsets}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pid = None
+
+    def open(self):
+        self.pid = os.getpid()
+        self.source = pa.memory_map(str(self.features_file))
+        self.reader = pa.ipc.open_file(self.source)
+        self.batches = {}
+
+    def ensure_open(self):
+        if self.pid != os.getpid():
+            self.open()
+
+    @property
+    def schema(self):
+        self.ensure_open()
+        return self.reader.schema
+
+    @property
+    def num_rows(self):
+        return int(self.batch_offsets[-1])
+
+    def get_batch(self, batch_index):
+        self.ensure_open()
+        if batch_index not in self.batches:
+            self.batches[batch_index] = self.reader.get_batch(batch_index)
+        return self.batches[batch_index]
+
+    def get_lengths(self):
+        return np.concatenate(
+            [get_lengths(self.get_batch(i)) for i in range(len(self.batch_offsets) - 1)]
+        )
+
+    def get_row(self, col_name, index):
+        batch_index = np.searchsorted(self.batch_offsets, index, side="right") - 1
+        row_index = index - self.batch_offsets[batch_index]
+        return self.get_batch(batch_index).column(col_name).slice(row_index, 1)
 
 
 class ChainDataset(IterableDataset):
-    def __init__(self, table, indices, residue_crop_size, num_msa):
+    def __init__(
+        self,
+        table,
+        indices,
+        lengths,
+        residue_crop_size,
+        num_msa,
+        zero_copy=False,
+        num_length_buckets=0,
+        bucket_run_length=1,
+    ):
         super().__init__()
         self.residue_crop_size = residue_crop_size
         self.num_msa = num_msa
+        self.zero_copy = zero_copy
         self.table = table
         self.indices = indices
+        self.lengths = lengths
+        self.cumulative_weights = np.cumsum(acceptance_weights(lengths[indices]))
+        self.bucket_run_length = bucket_run_length
+        self.bucket_remaining = 0
+        self.buckets = []
+        if num_length_buckets > 0:
+            crop_lengths = np.minimum(lengths[indices], residue_crop_size)
+            order = np.argsort(crop_lengths, kind="stable")
+            for bucket in np.array_split(order, num_length_buckets):
+                if len(bucket) > 0:
+                    weights = acceptance_weights(lengths[indices[bucket]])
+                    self.buckets.append((indices[bucket], np.cumsum(weights)))
+            self.bucket_weights = np.cumsum([w[-1] for _, w in self.buckets])
+        self.compact_msa = "msa_index" in table.schema.names
+        self.row_sorted_msa = all(
+            f"{col_name}_indptr" in table.schema.names for col_name in COMPRESSED_MSA_FIELDS.keys()
+        )
         self.distogram_max = 50.75
         self.distogram_bins = torch.arange(3.875, self.distogram_max, 1.25)
 
     @classmethod
-    def construct_datasets(cls, features_file, train_split, *args, **kwargs):
-        with pa.memory_map(str(features_file)) as source:
-            with pa.ipc.open_file(source) as reader:
-                table = reader.read_all()
-        table_size = table.get_total_buffer_size() / (1024**3)
-        logging.info(f"Features table loaded, size {table_size:.2f} GB")
+    def construct_datasets(
+        cls, features_file, train_split, *args, lazy=False, rank=0, world_size=1, **kwargs
+    ):
+        if lazy:
+            table = MemoryMappedTable(features_file)
+            lengths = table.get_lengths()
+            file_size = os.path.getsize(features_file) / (1024**3)
+            logging.info(f"Features file memory mapped, size {file_size:.2f} GB")
+        else:
+            with pa.memory_map(str(features_file)) as source:
+                with pa.ipc.open_file(source) as reader:
+                    table = reader.read_all()
+            lengths = get_lengths(table)
+            table_size = table.get_total_buffer_size() / (1024**3)
+            logging.info(f"Features table loaded, size {table_size:.2f} GB")
         train_size = int(train_split * table.num_rows)
         if train_size <= 0 or train_size > table.num_rows:
             raise ValueError(f"train_size must be between 0 and {table.num_rows}, got {train_size}")
+        if train_size < world_size:
+            raise ValueError(f"train_size must be at least the world size {world_size}")
+        test_size = table.num_rows - train_size
+        if 0 < test_size < world_size:
+            raise ValueError(f"test_size must be 0 or at least the world size {world_size}")
         indices = np.arange(table.num_rows)
         np.random.shuffle(indices)
-        table = table.append_column(
-            "length",
-            pc.list_value_length(table["positions"]),
-        )
-        return cls(table, indices[:train_size], *args, **kwargs), cls(
-            table, indices[train_size:], *args, **kwargs
+        if get_layout(table.schema) == TENSOR_LAYOUT:
+            kwargs["zero_copy"] = True
+        train_indices = indices[:train_size][rank::world_size]
+        test_indices = indices[train_size:][rank::world_size]
+        return cls(table, train_indices, lengths, *args, **kwargs), cls(
+            table, test_indices, lengths, *args, **kwargs
         )
 
     def extract_and_slice_msa(self, col_name, start, index, length):
-        sparse_matrix = torch.sparse_coo_tensor(
-            self.table.column(f"{col_name}_coords")[index].as_py(),
-            self.table.column(f"{col_name}_data")[index].as_py(),
-            self.table.column(f"{col_name}_shape")[index].as_py(),
+        if self.row_sorted_msa:
+            return decode_row_sorted_crop(
+                self.get_row(f"{col_name}_indptr", index),
+                self.get_row(f"{col_name}_coords", index),
+                self.get_row(f"{col_name}_data", index),
+                self.get_row(f"{col_name}_shape", index),
+                start,
+                length,
+                COMPRESSED_MSA_FIELDS[col_name].feat_size,
+            )
+        return decode_sparse_crop(
+            self.get_row(f"{col_name}_coords", index),
+            self.get_row(f"{col_name}_data", index),
+            self.get_row(f"{col_name}_shape", index),
+            start,
+            length,
+            COMPRESSED_MSA_FIELDS[col_name].feat_size,
+        )
+
+    def slice_compact_msa(self, sampled_index, start, length):
+        num_residues = int(self.lengths[sampled_index])
+        return {
+            col_name: crop_residue_major(
+                self.get_row(col_name, sampled_index), start, length, num_residues
+            )
+            for col_name in ["msa_index", "deletion_count"]
+        }
+
+    def get_row(self, col_name, index):
+        if isinstance(self.table, MemoryMappedTable):
+            return self.table.get_row(col_name, index)
+        return self.table.column(col_name).slice(index, 1).chunk(0)
+
+    def sample_index(self):
+        if len(self.buckets) == 0:
+            return weighted_choice(self.indices, self.cumulative_weights)
+        if self.bucket_remaining == 0:
+            self.bucket = self.buckets[
+                weighted_choice(np.arange(len(self.buckets)), self.bucket_weights)
+            ]
+            self.bucket_remaining = self.bucket_run_length
+        self.bucket_remaining -= 1
+        return weighted_choice(*self.bucket)
+
+    def sample_crop(self):
+        sampled_index = self.sample_index()
+        length = int(self.lengths[sampled_index])
+        start = np.random.randint(max(1, length - self.residue_crop_size + 1))
+        return sampled_index, start, min(length, self.residue_crop_size)
+
+    def slice_row(self, sampled_index, start, length):
+        slice_column_list = lambda col_name: pa.compute.list_slice(
+            self.get_row(col_name, sampled_index)[0], start, start + length
+        ).as_py()
+        slice_column_str = lambda col_name: pa.compute.utf8_slice_codeunits(
+            self.get_row(col_name, sampled_index)[0], start, start + length
+        ).as_py()
+        slice_column_nested_str = lambda col_name: [
+            pa.compute.utf8_slice_codeunits(x, start, start + length).as_py()
+            for x in self.get_row(col_name, sampled_index)[0]
+        ]
+        slice_column_nested_list = lambda col_name, max_sequences=None: [
+            pa.compute.list_slice(x, start, start + length).as_py()
+            for x in (
+                pa.compute.list_slice(self.get_row(col_name, sampled_index)[0], 0, max_sequences)
+                if max_sequences is not None
+                else self.get_row(col_name, sampled_index)[0]
+            )
+        ]
+
+        return {
+            "positions": slice_column_list("positions"),
+            "translations": slice_column_list("translations"),
+            "rotations": slice_column_list("rotations"),
+            "sequence": slice_column_str("sequence"),
+            "template_mask": slice_column_nested_list("template_mask"),
+            "template_sequence": slice_column_nested_str("template_sequence"),
+            "template_translations": slice_column_nested_list("template_translations"),
+            "template_rotations": slice_column_nested_list("template_rotations"),
+            "profile": slice_column_list("profile"),
+            "deletion_mean": slice_column_list("deletion_mean"),
+        }
+
+    def slice_row_zero_copy(self, sampled_index, start, length):
+        num_residues = int(self.lengths[sampled_index])
+        crop = lambda col_name, shape=(): crop_list(
+            self.get_row(col_name, sampled_index), start, length, shape
         )
-        dense_matrix = (
-            torch.stack([sparse_matrix[i] for i in range(start, start + length)])
-            .to_dense()
-            .reshape(length, -1, COMPRESSED_MSA_FIELDS[col_name].feat_size)
-            .transpose(0, 1)
+        crop_nested = lambda col_name, shape=(): crop_nested_list(
+            self.get_row(col_name, sampled_index), start, length, num_residues, shape
         )
-        return dense_matrix
+        sequence = get_string_codes(self.get_row("sequence", sampled_index))
+        template_sequence = get_string_codes(
+            self.get_row("template_sequence", sampled_index)
+        ).reshape(-1, num_residues)
+
+        return {
+            "positions": crop("positions").long(),
+            "translations": crop("translations", (3,)),
+            "rotations": crop("rotations", (3, 3)),
+            "sequence": sequence[start : start + length],
+            "template_mask": crop_nested("template_mask"),
+            "template_sequence": template_sequence[:, start : start + length],
+            "template_translations": crop_nested("template_translations", (3,)),
+            "template_rotations": crop_nested("template_rotations", (3, 3)),
+            "profile": crop("profile", (len(RESIDUE_INDEX_MSA),)),
+            "deletion_mean": crop("deletion_mean"),
+        }
 
     def __iter__(self):
         while True:
-            sampled_index = np.random.choice(self.indices)
-            length = self.table.column("length")[sampled_index].as_py()
-            if not accept_chain(length):
-                continue
-
-            start = np.random.randint(max(1, length - self.residue_crop_size + 1))
-            length = min(length, self.residue_crop_size)
-
-            slice_column_list = lambda col_name: pa.compute.list_slice(
-                self.table.column(col_name)[sampled_index], start, start + length
-            ).as_py()
-            slice_column_str = lambda col_name: pa.compute.utf8_slice_codeunits(
-                self.table.column(col_name)[sampled_index], start, start + length
-            ).as_py()
-            slice_column_nested_str = lambda col_name: [
-                pa.compute.utf8_slice_codeunits(x, start, start + length).as_py()
-                for x in self.table.column(col_name)[sampled_index]
-            ]
-            slice_column_nested_list = lambda col_name, max_sequences=None: [
-                pa.compute.list_slice(x, start, start + length).as_py()
-                for x in (
-                    pa.compute.list_slice(
-                        self.table.column(col_name)[sampled_index], 0, max_sequences
-                    )
-                    if max_sequences is not None
-                    else self.table.column(col_name)[sampled_index]
-                )
-            ]
-
-            row = {
-                "positions": slice_column_list("positions"),
-                "translations": slice_column_list("translations"),
-                "rotations": slice_column_list("rotations"),
-                "sequence": slice_column_str("sequence"),
-                "template_mask": slice_column_nested_list("template_mask"),
-                "template_sequence": slice_column_nested_str("template_sequence"),
-                "template_translations": slice_column_nested_list("template_translations"),
-                "template_rotations": slice_column_nested_list("template_rotations"),
-                "profile": slice_column_list("profile"),
-                "deletion_mean": slice_column_list("deletion_mean"),
-            } | {
-                msa_field: self.extract_and_slice_msa(msa_field, start, sampled_index, length)
-                for msa_field in COMPRESSED_MSA_FIELDS.keys()
-            }
+            sampled_index, start, length = self.sample_crop()
+            if self.zero_copy:
+                row = self.slice_row_zero_copy(sampled_index, start, length)
+            else:
+                row = self.slice_row(sampled_index, start, length)
+            if self.compact_msa:
+                row = row | self.slice_compact_msa(sampled_index, start, length)
+            else:
+                row = row | {
+                    msa_field: self.extract_and_slice_msa(msa_field, start, sampled_index, length)
+                    for msa_field in COMPRESSED_MSA_FIELDS.keys()
+                }
             yield self.parse_features(row, length)
 
     def parse_template_features(self, row, length):
@@ -123,15 +405,10 @@ class ChainDataset(IterableDataset):
             template_rotations = torch.empty(0, length, 3, 3, dtype=torch.float32)
             aatype_index = torch.empty(0, length, dtype=torch.long)
         else:
-            template_backbone_frame_mask = torch.tensor(row["template_mask"])
-            template_translations = torch.tensor(row["template_translations"])
-            template_rotations = torch.tensor(row["template_rotations"])
-            aatype_index = torch.tensor(
-                [
-                    [RESIDUE_INDEX_MSA[residue] for residue in seq]
-                    for seq in row["template_sequence"]
-                ]
-            )
+            template_backbone_frame_mask = torch.as_tensor(row["template_mask"])
+            template_translations = torch.as_tensor(row["template_translations"])
+            template_rotations = torch.as_tensor(row["template_rotations"])
+            aatype_index = encode_residues(row["template_sequence"], RESIDUE_LOOKUP_MSA)
         frames = Frame(template_rotations.unsqueeze(-3), template_translations.unsqueeze(-2))
         template_unit_vector = Frame.apply(
             Frame.inverse(frames), template_translations.unsqueeze(-3)
@@ -170,15 +447,27 @@ class ChainDataset(IterableDataset):
             "msa": msa[indices],
             "has_deletion": has_deletion[indices],
             "deletion_value": deletion_value[indices],
-            "profile": torch.tensor(row["profile"]),
-            "deletion_mean": torch.tensor(row["deletion_mean"]),
+            "profile": torch.as_tensor(row["profile"]),
+            "deletion_mean": torch.as_tensor(row["deletion_mean"]),
+        }
+
+    def parse_compact_msa_features(self, row):
+        msa_mask = torch.any(row["msa_index"] != RESIDUE_INDEX_MSA[MSA_GAP], dim=-1)
+        msa_index = row["msa_index"][msa_mask]
+        deletion_count = row["deletion_count"][msa_mask]
+        indices = torch.randperm(msa_index.size(0))[: self.num_msa]
+
+        return {
+            "msa_index": msa_index[indices],
+            "deletion_count": deletion_count[indices],
+            "profile": torch.as_tensor(row["profile"]),
+            "deletion_mean": torch.as_tensor(row["deletion_mean"]),
         }
 
     def parse_features(self, row, length):
-        local_coords = torch.tensor(
-            [[p[1] for p in get_atom_positions(r)] for r in row["sequence"]]
-        )
-        residue_index = torch.tensor(row["positions"])
+        restype_index = encode_residues(row["sequence"], RESIDUE_LOOKUP)
+        local_coords = BACKBONE_COORDS[restype_index]
+        residue_index = torch.as_tensor(row["positions"])
         random_rotations = uniform_random_rotation(local_coords.size(0))
         random_translations = torch.rand(local_coords.size(0), 3) * 100
         frames = Frame(random_rotations.unsqueeze(-3), random_translations.unsqueeze(-2))
@@ -188,8 +477,8 @@ class ChainDataset(IterableDataset):
             .expand(*residue_index.size(), local_coords.size(-1))
             .reshape(-1)
         )
-        rotations = torch.tensor(row["rotations"])
-        translations = torch.tensor(row["translations"])
+        rotations = torch.as_tensor(row["rotations"])
+        translations = torch.as_tensor(row["translations"])
         coords_truth = Frame.apply(
             Frame(rotations.unsqueeze(-3), translations.unsqueeze(-2)), local_coords
         ).flatten(start_dim=-3, end_dim=-2)
@@ -199,10 +488,14 @@ class ChainDataset(IterableDataset):
             "translations": translations,
             "local_coords": local_coords,
             "residue_index": residue_index,
-            "restype": encode_one_hot(row["sequence"]),
+            "restype": F.one_hot(restype_index, num_classes=len(RESIDUE_INDEX)).float(),
             "ref_pos": ref_pos,
             "ref_space_uid": ref_space_uid,
-            **self.parse_msa_features(row),
+            **(
+                self.parse_compact_msa_features(row)
+                if "msa_index" in row
+                else self.parse_msa_features(row)
+            ),
             **self.parse_template_features(row, length),
         }
         return features
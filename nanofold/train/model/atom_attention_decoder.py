@@ -31,7 +31,7 @@ class AtomAttentionDecoder(nn.Module):
             nn.LayerNorm(q_embedding_size), nn.Linear(q_embedding_size, 3)
         )
 
-    def forward(self, a, q, c, p):
+    def forward(self, a, q, c, p, atom_mask=None, biases=None):
         q = self.linear(torch.tile(a, (3, 1))) + q
-        q = self.atom_transformer(q, c, p)
+        q = self.atom_transformer(q, c, p, atom_mask, biases)
         return self.positions_update(q)
@@ -61,29 +61,43 @@ class AtomAttentionEncoder(nn.Module):
             nn.ReLU(),
         )
 
-    def forward(self, ref_pos, ref_space_uid, r, s, z):
+    def embed_pairs(self, ref_pos, ref_space_uid, s, z):
         c = self.linear_pos(ref_pos)
+        query_index, key_index, _ = self.atom_transformer.windows(ref_pos.size(-2), ref_pos.device)
+        query_index = query_index.unsqueeze(-1)
+        key_index = key_index.unsqueeze(-2)
 
-        distance = ref_pos.unsqueeze(-2) - ref_pos.unsqueeze(-3)
-        mask = (ref_space_uid.unsqueeze(-1) == ref_space_uid.unsqueeze(-2)).unsqueeze(-1)
+        distance = ref_pos[..., query_index, :] - ref_pos[..., key_index, :]
+        mask = (ref_space_uid[..., query_index] == ref_space_uid[..., key_index]).unsqueeze(-1)
         pair_rep = self.linear_pos_offset(distance) * mask
         squared_distance = (distance.unsqueeze(-2) @ distance.unsqueeze(-1)).squeeze(-1)
         pair_rep = pair_rep + self.linear_inv_sq_dist(1 / (1 + squared_distance)) * mask
         pair_rep = pair_rep + self.linear_mask(mask.float()) * mask
 
-        q = c
-        if r is not None:
+        if s is not None:
             c = c + self.single_embedder(torch.tile(s, (self.atoms_per_residue, 1)))
-            pair_rep = pair_rep + self.pair_embedder(
-                torch.tile(z, (self.atoms_per_residue, self.atoms_per_residue, 1))
+            num_tokens = z.size(-2)
+            pair_rep = (
+                pair_rep
+                + self.pair_embedder(z)[..., query_index % num_tokens, key_index % num_tokens, :]
             )
-            q = q + self.noisy_position_embedder(r)
+            c = c.unsqueeze(-3)
+            pair_rep = pair_rep.unsqueeze(-5)
         pair_rep = (
             pair_rep
-            + self.conditioning_transition_a(c.unsqueeze(-2))
-            + self.conditioning_transition_b(c.unsqueeze(-3))
+            + self.conditioning_transition_a(c)[..., query_index, :]
+            + self.conditioning_transition_b(c)[..., key_index, :]
         )
         pair_rep = pair_rep + self.pair_mlp(pair_rep)
-        q = self.projection(self.atom_transformer(q, c, pair_rep))
+        return c, pair_rep
+
+    def forward(self, ref_pos, ref_space_uid, r, s, z, atom_mask=None, pairs=None, biases=None):
+        c, pair_rep = self.embed_pairs(ref_pos, ref_space_uid, s, z) if pairs is None else pairs
+        q = self.linear_pos(ref_pos)
+        if r is not None:
+            q = q.unsqueeze(-3) + self.noisy_position_embedder(r)
+            if atom_mask is not None:
+                atom_mask = atom_mask.unsqueeze(-2)
+        q = self.projection(self.atom_transformer(q, c, pair_rep, atom_mask, biases))
         a = torch.mean(q.view(*q.shape[:-2], -1, self.atoms_per_residue, q.size(-1)), dim=-2)
         return a, q, c, pair_rep
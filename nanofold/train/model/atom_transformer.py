@@ -1,5 +1,7 @@
+import math
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from nanofold.train.model.diffusion_transformer import DiffusionTransformer
 
@@ -22,19 +24,33 @@ class AtomTransformer(nn.Module):
             q_embedding_size, c_embedding_size, p_embedding_size, num_block, num_head
         )
 
-    def forward(self, q, c, pair_rep):
-        device = pair_rep.device
-        centres = torch.arange(
-            (self.num_queries - 1) / 2, q.size(-2), self.num_queries, device=device
+    def windows(self, num_atoms, device):
+        num_blocks = math.ceil(num_atoms / self.num_queries)
+        starts = torch.arange(num_blocks, device=device) * self.num_queries
+        centres = starts + (self.num_queries - 1) / 2
+        key_index = (
+            torch.floor(centres - self.num_keys / 2).long().unsqueeze(-1)
+            + 1
+            + torch.arange(self.num_keys, device=device)
         )
-        row_mask = (
-            torch.abs(torch.arange(pair_rep.size(-3), device=device).unsqueeze(-1) - centres)
-            < self.num_queries / 2
+        valid = (
+            (torch.abs(key_index - centres.unsqueeze(-1)) < self.num_keys / 2)
+            & (key_index >= 0)
+            & (key_index < num_atoms)
         )
-        col_mask = (
-            torch.abs(torch.arange(pair_rep.size(-2), device=device).unsqueeze(-1) - centres)
-            < self.num_keys / 2
-        )
-        mask = torch.any(row_mask.unsqueeze(-2) & col_mask.unsqueeze(-3), dim=-1)
-        beta = -(10**10) * ~mask
-        return self.diffusion_transformer(q, c, pair_rep, beta)
+        query_index = starts.unsqueeze(-1) + torch.arange(self.num_queries, device=device)
+        beta = -(10**10) * ~valid.unsqueeze(-2)
+        return query_index.clamp(max=num_atoms - 1), key_index.clamp(0, num_atoms - 1), beta
+
+    def pair_biases(self, pair_rep, num_atoms, atom_mask=None):
+        _, key_index, beta = self.windows(num_atoms, pair_rep.device)
+        return self.diffusion_transformer.pair_biases(pair_rep, beta, atom_mask, key_index)
+
+    def forward(self, q, c, pair_rep, atom_mask=None, biases=None):
+        num_atoms = q.size(-2)
+        query_index, key_index, beta = self.windows(num_atoms, q.device)
+        padding = query_index.numel() - num_atoms
+        q = F.pad(q, (0, 0, 0, padding))
+        c = F.pad(c, (0, 0, 0, padding))
+        q = self.diffusion_transformer(q, c, pair_rep, beta, atom_mask, key_index, biases)
+        return q[..., :num_atoms, :]
@@ -3,6 +3,7 @@ import torch.nn.functional as F
 
 from nanofold.train.model.ada_ln import AdaLN
 from nanofold.train.model.util import LinearWithView
+from nanofold.train.model.util import mask_bias
 
 
 class AttentionPairBias(nn.Module):
@@ -32,7 +33,16 @@ class AttentionPairBias(nn.Module):
         )
         self.projection_out[0].bias.data.fill_(-2.0)
 
-    def forward(self, a, s, pair_rep, beta):
+    def pair_bias(self, pair_rep, beta, mask=None, key_index=None):
+        b = self.bias(pair_rep) + beta.unsqueeze(-1) if beta is not None else self.bias(pair_rep)
+        b = b.movedim(-1, -3)
+        if mask is not None:
+            if key_index is not None:
+                mask = mask[..., key_index]
+            b = b + mask_bias(mask).unsqueeze(-2).unsqueeze(-2)
+        return b
+
+    def forward(self, a, s, pair_rep, beta, mask=None, key_index=None, bias=None):
         if s is None:
             a = self.layer_norm_a(a)
         else:
@@ -41,16 +51,25 @@ class AttentionPairBias(nn.Module):
         q = self.query(a)
         k = self.key(a)
         v = self.value(a)
-        b = self.bias(pair_rep) + beta.unsqueeze(-1) if beta is not None else self.bias(pair_rep)
         g = self.gate(a)
+        if key_index is not None:
+            q = q.unflatten(-3, (key_index.size(0), -1))
+            g = g.unflatten(-3, (key_index.size(0), -1))
+            k = k[..., key_index, :, :]
+            v = v[..., key_index, :, :]
+        if bias is None:
+            bias = self.pair_bias(pair_rep, beta, mask, key_index)
 
         attention = F.scaled_dot_product_attention(
             q.transpose(-3, -2),
             k.transpose(-3, -2),
             v.transpose(-3, -2),
-            b.movedim(-1, -3),
+            bias,
         ) * g.transpose(-3, -2)
-        a = self.projection_a(attention.transpose(-3, -2).flatten(start_dim=-2))
+        attention = attention.transpose(-3, -2).flatten(start_dim=-2)
+        if key_index is not None:
+            attention = attention.flatten(start_dim=-3, end_dim=-2)
+        a = self.projection_a(attention)
 
         if s is not None:
             a = self.projection_out(s) * a
@@ -55,17 +55,23 @@ class DiffusionConditioning(nn.Module):
             nn.Linear(fourier_embedding_size, stacked_single_embedding_size, bias=False),
         )
 
-    def forward(self, t, features, input, trunk, pair_rep):
+    def condition_pair(self, features, pair_rep):
         pair_rep = torch.concat(
             [pair_rep, self.relative_position_encoding(features["residue_index"])], dim=-1
         )
         pair_rep = self.pair(pair_rep)
         for transition in self.pair_transition:
             pair_rep = pair_rep + transition(pair_rep)
+        return pair_rep
+
+    def condition_single(self, t, input, trunk):
         single = torch.concat([input, trunk], dim=-1)
         single = self.single(single)
         n = fourier_embedding(0.25 * torch.log(t / self.data_std_dev), self.fourier_embedding_size)
-        single = single + self.n_embedder(n)
+        single = single.unsqueeze(-3) + self.n_embedder(n)
         for transition in self.single_transition:
             single = single + transition(single)
-        return single, pair_rep
+        return single
+
+    def forward(self, t, features, input, trunk, pair_rep):
+        return self.condition_single(t, input, trunk), self.condition_pair(features, pair_rep)
@@ -1,11 +1,16 @@
 import torch
 import torch.nn as nn
+import torch.utils.checkpoint
 
 from nanofold.train.loss import compute_diffusion_loss
 from nanofold.train.model.atom_attention_decoder import AtomAttentionDecoder
 from nanofold.train.model.atom_attention_encoder import AtomAttentionEncoder
 from nanofold.train.model.diffusion_conditioning import DiffusionConditioning
+from nanofold.train.model.diffusion_sampler import SAMPLERS
+from nanofold.train.model.diffusion_sampler import get_schedule
 from nanofold.train.model.diffusion_transformer import DiffusionTransformer
+from nanofold.train.util import centre
+from nanofold.train.util import masked_mean
 from nanofold.train.util import uniform_random_rotation
 
 
@@ -29,6 +34,10 @@ class DiffusionModel(nn.Module):
         num_diffusion_transformer_heads,
         position_bins,
         inference=False,
+        cache_step_invariant=True,
+        sampler="edm",
+        schedule="karras",
+        micro_batch_size=None,
         gamma_0=0.8,
         gamma_min=1.0,
         noise_scale=1.003,
@@ -40,13 +49,18 @@ class DiffusionModel(nn.Module):
     ):
         super().__init__()
         self.inference = inference
+        self.cache_step_invariant = cache_step_invariant
         self.batch_size = batch_size
+        self.micro_batch_size = micro_batch_size
         self.normal = torch.distributions.MultivariateNormal(torch.zeros(3), torch.eye(3))
         self.gamma_0 = gamma_0
         self.gamma_min = gamma_min
         self.noise_scale = noise_scale
         self.step_scale = step_scale
         self.data_std_dev = data_std_dev
+        self.s_max = s_max
+        self.s_min = s_min
+        self.p = p
         stacked_single_embedding_size = input_embedding_size + single_embedding_size
         stacked_pair_embedding_size = 2 * pair_embedding_size
         self.diffusion_conditioning = DiffusionConditioning(
@@ -91,77 +105,158 @@ class DiffusionModel(nn.Module):
         )
         self.layer_norm = nn.LayerNorm(token_embedding_size)
         if inference:
-            steps = torch.arange(steps) / (steps - 1)
-            schedule = (
-                data_std_dev
-                * (s_max ** (1 / p) + steps * (s_min ** (1 / p) - s_max ** (1 / p))) ** p
-            )
-            self.register_buffer(
-                "schedule",
-                torch.cat([schedule, torch.zeros_like(schedule[:1])]),
+            self.configure_sampler(sampler, schedule, steps)
+
+    def configure_sampler(self, sampler, schedule, steps):
+        if sampler not in SAMPLERS:
+            raise ValueError(
+                f"Unknown diffusion sampler {sampler}, expected one of {list(SAMPLERS)}"
             )
+        self.sampler = SAMPLERS[sampler]
+        self.register_buffer(
+            "schedule",
+            get_schedule(schedule, steps, self.data_std_dev, self.s_max, self.s_min, self.p).to(
+                self.layer_norm.weight.device
+            ),
+            persistent=False,
+        )
 
-    def centre_random_augmentation(self, x):
+    def centre_random_augmentation(self, x, mask=None):
         batch_dims = x.shape[:-2]
-        x = x - x.mean(dim=-2, keepdim=True)
+        x = centre(x, mask)
         rotation = uniform_random_rotation(*batch_dims).to(x.device)
         translation = self.normal.sample(batch_dims).to(x.device)
         x = (rotation.unsqueeze(-3) @ x.unsqueeze(-1)).squeeze(-1) + translation.unsqueeze(-2)
         return x
 
-    def diffusion(self, x_noisy, t, features, input, trunk, pair_rep):
-        stacked_single, stacked_pair = self.diffusion_conditioning(
-            t, features, input, trunk, pair_rep
+    def step_invariant_cache(self, features, trunk, pair_rep):
+        stacked_pair = self.diffusion_conditioning.condition_pair(features, pair_rep)
+        c, p = self.atom_attention_encoder.embed_pairs(
+            features["ref_pos"], features["ref_space_uid"], trunk, stacked_pair
         )
+        mask = features.get("residue_mask")
+        atom_mask = features.get("atom_mask")
+        if mask is not None:
+            mask = mask.unsqueeze(-2)
+            atom_mask = atom_mask.unsqueeze(-2)
+        num_atoms = features["ref_pos"].size(-2)
+        return {
+            "stacked_pair": stacked_pair,
+            "atom_pairs": (c, p),
+            "encoder_biases": self.atom_attention_encoder.atom_transformer.pair_biases(
+                p, num_atoms, atom_mask
+            ),
+            "transformer_biases": self.diffusion_transformer.pair_biases(
+                stacked_pair.unsqueeze(-4), None, mask
+            ),
+            "decoder_biases": self.atom_attention_decoder.atom_transformer.pair_biases(
+                p, num_atoms, atom_mask
+            ),
+        }
+
+    def diffusion(self, x_noisy, t, features, input, trunk, pair_rep, cache=None):
+        cache = cache or {}
+        stacked_pair = cache.get("stacked_pair")
+        if stacked_pair is None:
+            stacked_pair = self.diffusion_conditioning.condition_pair(features, pair_rep)
+        stacked_single = self.diffusion_conditioning.condition_single(t, input, trunk)
         r = x_noisy / torch.sqrt(t**2 + self.data_std_dev**2)
+        mask = features.get("residue_mask")
+        atom_mask = features.get("atom_mask")
         a, q_skip, c_skip, p_skip = self.atom_attention_encoder(
-            features["ref_pos"], features["ref_space_uid"], r, trunk, stacked_pair
+            features["ref_pos"],
+            features["ref_space_uid"],
+            r,
+            trunk,
+            stacked_pair,
+            atom_mask,
+            cache.get("atom_pairs"),
+            cache.get("encoder_biases"),
         )
+        if mask is not None:
+            mask = mask.unsqueeze(-2)
+            atom_mask = atom_mask.unsqueeze(-2)
         a = a + self.single_embedder(stacked_single)
-        a = self.diffusion_transformer(a, stacked_single, stacked_pair, beta=None)
+        a = self.diffusion_transformer(
+            a,
+            stacked_single,
+            stacked_pair.unsqueeze(-4),
+            beta=None,
+            mask=mask,
+            biases=cache.get("transformer_biases"),
+        )
         a = self.layer_norm(a)
-        r_update = self.atom_attention_decoder(a, q_skip, c_skip, p_skip)
+        r_update = self.atom_attention_decoder(
+            a, q_skip, c_skip, p_skip, atom_mask, cache.get("decoder_biases")
+        )
         x_out = x_noisy * self.data_std_dev**2 / (
             self.data_std_dev**2 + t**2
         ) + r_update * self.data_std_dev * t / torch.sqrt(self.data_std_dev**2 + t**2)
         return x_out
 
     @torch.no_grad
-    def sample_diffusion(self, features, input, trunk, pair_rep):
-        x = self.schedule[0] * self.normal.sample(features["local_coords"].shape[:-1]).flatten(
-            start_dim=-3, end_dim=-2
-        ).to(trunk.device)
-
-        for c_prev, c in zip(self.schedule[:-1], self.schedule[1:]):
-            x = self.centre_random_augmentation(x)
-            gamma = self.gamma_0 if c > self.gamma_min else 0
-            t = c_prev * (gamma + 1)
-            noise = (
-                self.noise_scale
-                * ((t**2 - c_prev**2) ** 0.5)
-                * self.normal.sample(x.shape[:-1]).to(x.device)
-            )
-            x_noisy = x + noise
-            x_denoised = self.diffusion(x_noisy, t, features, input, trunk, pair_rep)
-            delta = (x - x_denoised) / t
-            dt = c - t
-            x = x_noisy + self.step_scale * delta * dt
+    def sample_diffusion(self, features, input, trunk, pair_rep, num_samples=None):
+        shape = features["local_coords"].shape[:-1]
+        if num_samples is not None:
+            shape = (*shape[:-2], num_samples, *shape[-2:])
+        x = self.schedule[0] * self.normal.sample(shape).flatten(start_dim=-3, end_dim=-2)
+        x = x.to(trunk.device)
+        if num_samples is None:
+            x = x.unsqueeze(-3)
+        mask = features.get("atom_mask")
+        if mask is not None:
+            mask = mask.unsqueeze(-2)
+        cache = (
+            self.step_invariant_cache(features, trunk, pair_rep)
+            if self.cache_step_invariant
+            else None
+        )
 
-        return x
+        denoise = lambda x_noisy, t: self.diffusion(
+            x_noisy, t, features, input, trunk, pair_rep, cache
+        )
+        x = self.sampler(self, denoise, x, self.schedule, mask)
+        return x if num_samples is not None else x.squeeze(-3)
 
     def train_diffusion(self, features, input, trunk, pair_rep):
         x_gt = torch.tile(features["coords_truth"].unsqueeze(-3), (self.batch_size, 1, 1))
-        x_gt = self.centre_random_augmentation(x_gt)
+        mask = features.get("atom_mask")
+        if mask is not None:
+            mask = mask.unsqueeze(-2)
+        x_gt = self.centre_random_augmentation(x_gt, mask)
         t = self.data_std_dev * torch.exp(-1.2 + 1.5 * torch.normal(0, 1, (self.batch_size, 1, 1)))
         t = t.to(x_gt.device)
         x_noisy = x_gt + (t * self.normal.sample(x_gt.shape[:-1]).to(x_gt.device))
 
-        x = self.diffusion(x_noisy, t, features, input, trunk, pair_rep)
+        if self.micro_batch_size is None:
+            x = self.diffusion(x_noisy, t, features, input, trunk, pair_rep)
+            return compute_diffusion_loss(x, x_gt, t, self.data_std_dev, mask)
 
-        return compute_diffusion_loss(x, x_gt, t, self.data_std_dev)
+        losses = {}
+        rng_state = torch.get_rng_state()
+        for start in range(0, self.batch_size, self.micro_batch_size):
+            end = min(start + self.micro_batch_size, self.batch_size)
+            # Every micro batch draws the same fourier embedding as a single full batch call
+            torch.set_rng_state(rng_state)
+            x = torch.utils.checkpoint.checkpoint(
+                self.diffusion,
+                x_noisy[..., start:end, :, :],
+                t[start:end],
+                features,
+                input,
+                trunk,
+                pair_rep,
+                use_reentrant=False,
+            )
+            micro_batch_losses = compute_diffusion_loss(
+                x, x_gt[..., start:end, :, :], t[start:end], self.data_std_dev, mask
+            )
+            for k, v in micro_batch_losses.items():
+                losses[k] = losses.get(k, 0) + v * (end - start) / self.batch_size
+        return losses
 
-    def forward(self, features, input, trunk, pair_rep):
+    def forward(self, features, input, trunk, pair_rep, num_samples=None):
         if self.inference:
-            return self.sample_diffusion(features, input, trunk, pair_rep)
+            return self.sample_diffusion(features, input, trunk, pair_rep, num_samples)
         else:
             return self.train_diffusion(features, input, trunk, pair_rep)
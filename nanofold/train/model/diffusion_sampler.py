@@ -0,0 +1,53 @@
+import torch
+
+from nanofold.train.util import centre
+
+
+def karras_schedule(steps, data_std_dev, s_max, s_min, p):
+    steps = torch.arange(steps) / (steps - 1)
+    return data_std_dev * (s_max ** (1 / p) + steps * (s_min ** (1 / p) - s_max ** (1 / p))) ** p
+
+
+def log_schedule(steps, data_std_dev, s_max, s_min, p):
+    return data_std_dev * torch.logspace(
+        torch.log10(torch.tensor(s_max)), torch.log10(torch.tensor(s_min)), steps
+    )
+
+
+def get_schedule(name, steps, data_std_dev, s_max, s_min, p):
+    schedule = SCHEDULES[name](steps, data_std_dev, s_max, s_min, p)
+    return torch.cat([schedule, torch.zeros_like(schedule[:1])])
+
+
+def edm_sampler(model, denoise, x, schedule, mask=None):
+    for c_prev, c in zip(schedule[:-1], schedule[1:]):
+        x = model.centre_random_augmentation(x, mask)
+        gamma = model.gamma_0 if c > model.gamma_min else 0
+        t = c_prev * (gamma + 1)
+        noise = (
+            model.noise_scale
+            * ((t**2 - c_prev**2) ** 0.5)
+            * model.normal.sample(x.shape[:-1]).to(x.device)
+        )
+        x_noisy = x + noise
+        x_denoised = denoise(x_noisy, t)
+        delta = (x - x_denoised) / t
+        dt = c - t
+        x = x_noisy + model.step_scale * delta * dt
+    return x
+
+
+def heun_sampler(model, denoise, x, schedule, mask=None):
+    for t, t_next in zip(schedule[:-1], schedule[1:]):
+        x = centre(x, mask)
+        delta = (x - denoise(x, t)) / t
+        x_next = x + (t_next - t) * delta
+        if t_next > 0:
+            delta_next = (x_next - denoise(x_next, t_next)) / t_next
+            x_next = x + (t_next - t) * (delta + delta_next) / 2
+        x = x_next
+    return x
+
+
+SAMPLERS = {"edm": edm_sampler, "heun": heun_sampler}
+SCHEDULES = {"karras": karras_schedule, "log": log_schedule}
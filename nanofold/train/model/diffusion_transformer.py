@@ -15,8 +15,11 @@ class DiffusionTransformerBlock(nn.Module):
             a_embedding_size, s_embedding_size
         )
 
-    def forward(self, a, s, pair_rep, beta):
-        b = self.attention_pair_bias(a, s, pair_rep, beta)
+    def pair_bias(self, pair_rep, beta, mask=None, key_index=None):
+        return self.attention_pair_bias.pair_bias(pair_rep, beta, mask, key_index)
+
+    def forward(self, a, s, pair_rep, beta, mask=None, key_index=None, bias=None):
+        b = self.attention_pair_bias(a, s, pair_rep, beta, mask, key_index, bias)
         a = b + self.conditioned_transition_block(a, s)
         return a
 
@@ -35,7 +38,11 @@ class DiffusionTransformer(nn.Module):
             ]
         )
 
-    def forward(self, a, s, pair_rep, beta):
-        for block in self.blocks:
-            a = block(a, s, pair_rep, beta)
+    def pair_biases(self, pair_rep, beta, mask=None, key_index=None):
+        return [block.pair_bias(pair_rep, beta, mask, key_index) for block in self.blocks]
+
+    def forward(self, a, s, pair_rep, beta, mask=None, key_index=None, biases=None):
+        biases = biases or [None] * len(self.blocks)
+        for block, bias in zip(self.blocks, biases):
+            a = block(a, s, pair_rep, beta, mask, key_index, bias)
         return a
@@ -36,7 +36,9 @@ class InputEmbedding(nn.Module):
     def forward(self, batch):
         ref_pos = batch["ref_pos"]
         ref_space_uid = batch["ref_space_uid"]
-        a, _, _, _ = self.atom_attention_encoder(ref_pos, ref_space_uid, None, None, None)
+        a, _, _, _ = self.atom_attention_encoder(
+            ref_pos, ref_space_uid, None, None, None, batch.get("atom_mask")
+        )
         return torch.concat(
             [a, batch["restype"], batch["profile"], batch["deletion_mean"].unsqueeze(-1)], dim=-1
         )
@@ -3,13 +3,20 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from nanofold.train.model.util import LinearWithView
+from nanofold.train.model.util import mask_bias
 
 
 class MSAPairWeightedAveraging(nn.Module):
     def __init__(
-        self, msa_embedding_size, msa_averaging_embedding_size, pair_embedding_size, num_heads
+        self,
+        msa_embedding_size,
+        msa_averaging_embedding_size,
+        pair_embedding_size,
+        num_heads,
+        chunk_size=None,
     ):
         super().__init__()
+        self.chunk_size = chunk_size
         self.layer_norm_msa = nn.LayerNorm(msa_embedding_size)
         self.value = LinearWithView(msa_embedding_size, (num_heads, msa_averaging_embedding_size))
         self.bias = nn.Sequential(
@@ -23,12 +30,19 @@ class MSAPairWeightedAveraging(nn.Module):
             num_heads * msa_averaging_embedding_size, msa_embedding_size, bias=False
         )
 
-    def forward(self, msa_rep, pair_rep):
+    def average(self, msa_rep, w):
         msa_rep = self.layer_norm_msa(msa_rep)
         v = self.value(msa_rep)
-        b = self.bias(pair_rep)
         g = self.gate(msa_rep)
+        o = g * torch.einsum("...ijh,...sjhc->...sihc", w, v)
+        return self.proj(o.flatten(start_dim=-2))
+
+    def forward(self, msa_rep, pair_rep, mask=None):
+        b = self.bias(pair_rep)
+        if mask is not None:
+            b = b + mask_bias(mask)[..., None, :, None]
         w = F.softmax(b, dim=-2)
-        o = torch.einsum("...sihc,...ijh,...sjhc->...sihc", g, w, v)
-        msa_rep = self.proj(o.flatten(start_dim=-2))
-        return msa_rep
+        if self.chunk_size is None:
+            return self.average(msa_rep, w)
+        chunks = msa_rep.split(self.chunk_size, dim=-3)
+        return torch.cat([self.average(chunk, w) for chunk in chunks], dim=-3)
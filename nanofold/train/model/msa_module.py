@@ -1,5 +1,7 @@
+import math
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from nanofold.common.residue_definitions import RESIDUE_INDEX_MSA
 from nanofold.train.model.msa_averaging import MSAPairWeightedAveraging
@@ -12,6 +14,13 @@ from nanofold.train.model.triangular_update import TriangleMultiplicationIncomin
 from nanofold.train.model.util import DropoutByDimension
 
 
+def expand_compact_msa(msa_index, deletion_count):
+    msa = F.one_hot(msa_index.long(), num_classes=len(RESIDUE_INDEX_MSA))
+    deletion_count = deletion_count.unsqueeze(-1).float()
+    deletion_value = 2 / math.pi * torch.arctan(deletion_count / 3)
+    return torch.concat([msa, deletion_count > 0, deletion_value], dim=-1)
+
+
 class MSAModuleBlock(nn.Module):
     def __init__(
         self,
@@ -26,43 +35,63 @@ class MSAModuleBlock(nn.Module):
         transition_multiplier,
         p_msa_dropout=0.15,
         p_pair_dropout=0.25,
+        triangle_chunk_size=None,
+        msa_chunk_size=None,
     ):
         super().__init__()
         self.msa_dropout = DropoutByDimension(p_msa_dropout)
         self.pair_dropout = DropoutByDimension(p_pair_dropout)
         self.msa_pair_weighted_averaging = MSAPairWeightedAveraging(
-            msa_embedding_size, msa_averaging_embedding_size, pair_embedding_size, num_msa_heads
+            msa_embedding_size,
+            msa_averaging_embedding_size,
+            pair_embedding_size,
+            num_msa_heads,
+            msa_chunk_size,
         )
         self.msa_transition = Transition(msa_embedding_size, transition_multiplier)
         self.outer_product_mean = OuterProductMean(
-            pair_embedding_size, msa_embedding_size, product_embedding_size
+            pair_embedding_size, msa_embedding_size, product_embedding_size, msa_chunk_size
         )
         self.triangle_update_outgoing = TriangleMultiplicationOutgoing(
-            pair_embedding_size, num_triangular_update_channels
+            pair_embedding_size, num_triangular_update_channels, triangle_chunk_size
         )
         self.triangle_update_incoming = TriangleMultiplicationIncoming(
-            pair_embedding_size, num_triangular_update_channels
+            pair_embedding_size, num_triangular_update_channels, triangle_chunk_size
         )
         self.triangle_attention_starting = TriangleAttentionStartingNode(
-            pair_embedding_size, num_pair_heads, num_triangular_attention_channels
+            pair_embedding_size,
+            num_pair_heads,
+            num_triangular_attention_channels,
+            triangle_chunk_size,
         )
         self.triangle_attention_ending = TriangleAttentionEndingNode(
-            pair_embedding_size, num_pair_heads, num_triangular_attention_channels
+            pair_embedding_size,
+            num_pair_heads,
+            num_triangular_attention_channels,
+            triangle_chunk_size,
         )
         self.pair_transition = Transition(pair_embedding_size, transition_multiplier)
 
-    def forward(self, msa_rep, pair_rep):
-        pair_rep = pair_rep + self.outer_product_mean(msa_rep)
+    def forward(self, msa_rep, pair_rep, msa_mask=None, mask=None):
+        pair_rep = pair_rep + self.outer_product_mean(msa_rep, msa_mask)
 
         msa_rep = msa_rep + self.msa_dropout(
-            self.msa_pair_weighted_averaging(msa_rep, pair_rep), dim=-3
+            self.msa_pair_weighted_averaging(msa_rep, pair_rep, mask), dim=-3
         )
         msa_rep = msa_rep + self.msa_transition(msa_rep)
 
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_update_outgoing(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_update_incoming(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_attention_starting(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_attention_ending(pair_rep), dim=-2)
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_update_outgoing(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_update_incoming(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_attention_starting(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_attention_ending(pair_rep, mask), dim=-2
+        )
         pair_rep = pair_rep + self.pair_transition(pair_rep)
         return msa_rep, pair_rep
 
@@ -82,6 +111,8 @@ class MSAModule(nn.Module):
         num_msa_heads,
         num_pair_heads,
         transition_multiplier,
+        triangle_chunk_size=None,
+        msa_chunk_size=None,
     ):
         super().__init__()
         self.num_msa_samples = num_msa_samples
@@ -99,20 +130,35 @@ class MSAModule(nn.Module):
                     num_msa_heads,
                     num_pair_heads,
                     transition_multiplier,
+                    triangle_chunk_size=triangle_chunk_size,
+                    msa_chunk_size=msa_chunk_size,
                 )
                 for _ in range(num_block)
             ]
         )
 
     def forward(self, features, pair_rep, input):
-        msa = features["msa"]
-        has_deletion = features["has_deletion"]
-        deletion_value = features["deletion_value"]
-        msa = torch.concat([msa, has_deletion, deletion_value], dim=-1)
-        index = torch.randperm(msa.size(-3))[: self.num_msa_samples]
-        msa_rep = self.linear_msa(msa[index].to(input.device))
-        msa_rep = msa_rep + self.linear_input(input)
+        if "msa_index" in features:
+            index = torch.randperm(features["msa_index"].size(-2))[: self.num_msa_samples]
+            msa = expand_compact_msa(
+                features["msa_index"][..., index, :].to(input.device),
+                features["deletion_count"][..., index, :].to(input.device),
+            )
+        else:
+            msa = features["msa"]
+            has_deletion = features["has_deletion"]
+            deletion_value = features["deletion_value"]
+            msa = torch.concat([msa, has_deletion, deletion_value], dim=-1)
+            index = torch.randperm(msa.size(-3))[: self.num_msa_samples]
+            msa = msa[..., index, :, :].to(input.device)
+        msa_rep = self.linear_msa(msa)
+        msa_rep = msa_rep + self.linear_input(input).unsqueeze(-3)
 
+        mask = features.get("residue_mask")
+        msa_mask = None
+        if mask is not None:
+            msa_mask = features["msa_mask"][..., index].to(mask.device)
+            msa_mask = msa_mask.unsqueeze(-1) & mask.unsqueeze(-2)
         for block in self.blocks:
-            msa_rep, pair_rep = block(msa_rep, pair_rep)
+            msa_rep, pair_rep = block(msa_rep, pair_rep, msa_mask, mask)
         return pair_rep
@@ -48,11 +48,19 @@ class Nanofold(nn.Module):
         num_diffusion_transformer_heads,
         fourier_embedding_size,
         num_distogram_bins,
+        detach_recycling=False,
+        triangle_chunk_size=None,
+        msa_chunk_size=None,
+        diffusion_sampler="edm",
+        diffusion_schedule="karras",
+        diffusion_micro_batch_size=None,
+        inference=False,
     ):
         super().__init__()
 
         self.use_grad_checkpoint = use_grad_checkpoint
         self.num_recycle = num_recycle
+        self.detach_recycling = detach_recycling
         self.nanofold_input = torch.compile(
             NanofoldInput(
                 single_embedding_size,
@@ -90,6 +98,8 @@ class Nanofold(nn.Module):
                 num_pairformer_blocks,
                 num_pair_heads,
                 pairformer_transition_multiplier,
+                triangle_chunk_size,
+                msa_chunk_size,
             ),
             disable=not compile_model,
             dynamic=True,
@@ -112,6 +122,10 @@ class Nanofold(nn.Module):
                 num_diffusion_transformer_blocks,
                 num_diffusion_transformer_heads,
                 position_bins,
+                inference=inference,
+                sampler=diffusion_sampler,
+                schedule=diffusion_schedule,
+                micro_batch_size=diffusion_micro_batch_size,
             ),
             disable=not compile_model,
             dynamic=True,
@@ -163,6 +177,12 @@ class Nanofold(nn.Module):
             "num_diffusion_transformer_heads": config["num_diffusion_transformer_heads"],
             "fourier_embedding_size": config["fourier_embedding_size"],
             "num_distogram_bins": config["num_distogram_bins"],
+            "detach_recycling": config.get("detach_recycling", False),
+            "triangle_chunk_size": config.get("triangle_chunk_size"),
+            "msa_chunk_size": config.get("msa_chunk_size"),
+            "diffusion_sampler": config.get("diffusion_sampler", "edm"),
+            "diffusion_schedule": config.get("diffusion_schedule", "karras"),
+            "diffusion_micro_batch_size": config.get("diffusion_micro_batch_size"),
         }
 
     @classmethod
@@ -179,7 +199,7 @@ class Nanofold(nn.Module):
     def get_total_loss(self, diffusion_loss, dist_loss):
         return 4 * diffusion_loss + 0.03 * dist_loss
 
-    def forward(self, features):
+    def run_trunk(self, features):
         num_recycle = (
             torch.randint(self.num_recycle, (1,)) + 1 if self.training else self.num_recycle
         )
@@ -188,22 +208,24 @@ class Nanofold(nn.Module):
         single_rep_prev = torch.zeros_like(single_rep_init)
         pair_rep_prev = torch.zeros_like(pair_rep_init)
 
-        for _ in range(num_recycle):
-            single_rep, pair_rep = self.checkpoint(
-                self.nanofold_trunk,
-                features,
-                input,
-                pair_rep_init,
-                single_rep_init,
-                pair_rep_prev,
-                single_rep_prev,
-            )
+        for i in range(num_recycle):
+            args = (features, input, pair_rep_init, single_rep_init, pair_rep_prev, single_rep_prev)
+            if self.detach_recycling and i < num_recycle - 1:
+                with torch.no_grad():
+                    single_rep, pair_rep = self.nanofold_trunk(*args)
+            else:
+                single_rep, pair_rep = self.checkpoint(self.nanofold_trunk, *args)
             single_rep_prev, pair_rep_prev = single_rep, pair_rep
+        return input, single_rep, pair_rep
 
+    def forward(self, features):
+        input, single_rep, pair_rep = self.run_trunk(features)
         diffusion_losses = self.checkpoint(
             self.diffusion_model, features, input, single_rep, pair_rep
         )
-        dist_loss = self.distogram_loss(pair_rep, features["translations"])
+        dist_loss = self.distogram_loss(
+            pair_rep, features["translations"], features.get("residue_mask")
+        )
         return {
             **diffusion_losses,
             "dist_loss": dist_loss,
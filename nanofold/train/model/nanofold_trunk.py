@@ -26,6 +26,8 @@ class NanofoldTrunk(nn.Module):
         num_pairformer_blocks,
         num_pair_heads,
         pairformer_transition_multiplier,
+        triangle_chunk_size=None,
+        msa_chunk_size=None,
     ):
         super().__init__()
         self.transition_pair = nn.Sequential(
@@ -41,6 +43,7 @@ class NanofoldTrunk(nn.Module):
             num_pair_heads,
             pairformer_transition_multiplier,
             num_template_blocks,
+            triangle_chunk_size,
         )
         self.msa_module = MSAModule(
             num_msa_blocks,
@@ -55,6 +58,8 @@ class NanofoldTrunk(nn.Module):
             num_msa_heads,
             num_pair_heads,
             msa_transition_multiplier,
+            triangle_chunk_size,
+            msa_chunk_size,
         )
         self.transition_single = nn.Sequential(
             nn.LayerNorm(single_embedding_size),
@@ -69,6 +74,7 @@ class NanofoldTrunk(nn.Module):
             num_pair_heads,
             pairformer_transition_multiplier,
             num_pairformer_blocks,
+            triangle_chunk_size,
         )
 
     def forward(self, features, input, pair_rep_init, single_rep_init, pair_rep, single_rep):
@@ -76,5 +82,5 @@ class NanofoldTrunk(nn.Module):
         pair_rep = pair_rep + self.template_embedder(features, pair_rep)
         pair_rep = pair_rep + self.msa_module(features, pair_rep, input)
         single_rep = single_rep_init + self.transition_single(single_rep)
-        single_rep, pair_rep = self.pairformer(single_rep, pair_rep)
+        single_rep, pair_rep = self.pairformer(single_rep, pair_rep, features.get("residue_mask"))
         return single_rep, pair_rep
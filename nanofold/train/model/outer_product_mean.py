@@ -3,8 +3,11 @@ import torch
 
 
 class OuterProductMean(nn.Module):
-    def __init__(self, pair_embedding_size, msa_embedding_size, product_embedding_size):
+    def __init__(
+        self, pair_embedding_size, msa_embedding_size, product_embedding_size, chunk_size=None
+    ):
         super().__init__()
+        self.chunk_size = chunk_size
         self.layer_norm = nn.LayerNorm(msa_embedding_size)
         self.linear_a = nn.Linear(msa_embedding_size, product_embedding_size, bias=False)
         self.linear_b = nn.Linear(msa_embedding_size, product_embedding_size, bias=False)
@@ -12,10 +15,26 @@ class OuterProductMean(nn.Module):
             product_embedding_size * product_embedding_size, pair_embedding_size
         )
 
-    def forward(self, msa_rep):
+    def forward(self, msa_rep, mask=None):
         msa_rep = self.layer_norm(msa_rep)
         a = self.linear_a(msa_rep)
         b = self.linear_b(msa_rep)
-        norm = 1 / msa_rep.size(-3)
+        if mask is None:
+            norm = 1 / msa_rep.size(-3)
+        else:
+            mask = mask.to(a.dtype)
+            a = a * mask.unsqueeze(-1)
+            b = b * mask.unsqueeze(-1)
+            count = torch.einsum("...si,...sj->...ij", mask, mask).unsqueeze(-1)
+            norm = 1 / count.clamp(min=1)
+        if self.chunk_size is None:
+            return self.outer(a, norm, b)
+        a_chunks = a.split(self.chunk_size, dim=-2)
+        norm_chunks = [norm] * len(a_chunks)
+        if mask is not None:
+            norm_chunks = norm.split(self.chunk_size, dim=-3)
+        return torch.cat([self.outer(*chunk, b) for chunk in zip(a_chunks, norm_chunks)], dim=-3)
+
+    def outer(self, a, norm, b):
         outer = norm * torch.einsum("...sic,...sjd->...ijcd", a, b).flatten(start_dim=-2)
         return self.projection(outer)
@@ -21,20 +21,27 @@ class PairformerBlock(nn.Module):
         num_pair_heads,
         transition_multiplier,
         p_dropout=0.25,
+        triangle_chunk_size=None,
     ):
         super().__init__()
         self.pair_dropout = DropoutByDimension(p_dropout)
         self.triangle_update_outgoing = TriangleMultiplicationOutgoing(
-            pair_embedding_size, num_triangular_update_channels
+            pair_embedding_size, num_triangular_update_channels, triangle_chunk_size
         )
         self.triangle_update_incoming = TriangleMultiplicationIncoming(
-            pair_embedding_size, num_triangular_update_channels
+            pair_embedding_size, num_triangular_update_channels, triangle_chunk_size
         )
         self.triangle_attention_starting = TriangleAttentionStartingNode(
-            pair_embedding_size, num_triangular_attention_heads, num_triangular_attention_channels
+            pair_embedding_size,
+            num_triangular_attention_heads,
+            num_triangular_attention_channels,
+            triangle_chunk_size,
         )
         self.triangle_attention_ending = TriangleAttentionEndingNode(
-            pair_embedding_size, num_triangular_attention_heads, num_triangular_attention_channels
+            pair_embedding_size,
+            num_triangular_attention_heads,
+            num_triangular_attention_channels,
+            triangle_chunk_size,
         )
         self.pair_transition = Transition(pair_embedding_size, transition_multiplier)
         self.single_transition = Transition(single_embedding_size, transition_multiplier)
@@ -42,15 +49,25 @@ class PairformerBlock(nn.Module):
             num_pair_heads, single_embedding_size, 0, pair_embedding_size
         )
 
-    def forward(self, single_rep, pair_rep):
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_update_outgoing(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_update_incoming(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_attention_starting(pair_rep), dim=-3)
-        pair_rep = pair_rep + self.pair_dropout(self.triangle_attention_ending(pair_rep), dim=-2)
+    def forward(self, single_rep, pair_rep, mask=None):
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_update_outgoing(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_update_incoming(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_attention_starting(pair_rep, mask), dim=-3
+        )
+        pair_rep = pair_rep + self.pair_dropout(
+            self.triangle_attention_ending(pair_rep, mask), dim=-2
+        )
         pair_rep = pair_rep + self.pair_transition(pair_rep)
 
         if single_rep is not None:
-            single_rep = single_rep + self.attention_pair_bias(single_rep, None, pair_rep, None)
+            single_rep = single_rep + self.attention_pair_bias(
+                single_rep, None, pair_rep, None, mask
+            )
             single_rep = single_rep + self.single_transition(single_rep)
         return single_rep, pair_rep
 
@@ -66,6 +83,7 @@ class Pairformer(nn.Module):
         num_pair_heads,
         transition_multiplier,
         num_blocks,
+        triangle_chunk_size=None,
     ):
         super().__init__()
         self.blocks = nn.ModuleList(
@@ -78,12 +96,13 @@ class Pairformer(nn.Module):
                     num_triangular_attention_heads,
                     num_pair_heads,
                     transition_multiplier,
+                    triangle_chunk_size=triangle_chunk_size,
                 )
                 for _ in range(num_blocks)
             ]
         )
 
-    def forward(self, single_rep, pair_rep):
+    def forward(self, single_rep, pair_rep, mask=None):
         for block in self.blocks:
-            single_rep, pair_rep = block(single_rep, pair_rep)
+            single_rep, pair_rep = block(single_rep, pair_rep, mask)
         return single_rep, pair_rep
@@ -16,6 +16,7 @@ class TemplateEmbedder(nn.Module):
         num_pair_heads,
         transition_multiplier,
         num_blocks,
+        triangle_chunk_size=None,
     ):
         super().__init__()
         self.template_embedding_size = template_embedding_size
@@ -38,6 +39,7 @@ class TemplateEmbedder(nn.Module):
             num_pair_heads,
             transition_multiplier,
             num_blocks,
+            triangle_chunk_size,
         )
 
     def forward(self, features, pair_rep):
@@ -68,6 +70,13 @@ class TemplateEmbedder(nn.Module):
         )
 
         v = self.pair_embedder(pair_rep.unsqueeze(-4)) + self.linear(a)
-        _, v = self.pairformer_stack(None, v)
-        u = self.layer_norm(v).mean(dim=-4)
+        mask = features.get("residue_mask")
+        if mask is None:
+            _, v = self.pairformer_stack(None, v)
+            u = self.layer_norm(v).mean(dim=-4)
+        else:
+            _, v = self.pairformer_stack(None, v, mask.unsqueeze(-2))
+            template_mask = features["template_mask"][..., None, None, None]
+            u = (self.layer_norm(v) * template_mask).sum(dim=-4)
+            u = u / template_mask.sum(dim=-4).clamp(min=1)
         return self.transition(u)
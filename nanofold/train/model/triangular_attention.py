@@ -1,14 +1,24 @@
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
 from nanofold.train.model.util import LinearWithView
+from nanofold.train.model.util import mask_bias
+
+
+def key_bias(b, mask):
+    if mask is None:
+        return b
+    return b + mask_bias(mask)[..., None, None, None, :]
 
 
 class TriangleAttentionStartingNode(nn.Module):
-    def __init__(self, pair_embedding_size, num_heads, num_channels):
+    def __init__(self, pair_embedding_size, num_heads, num_channels, chunk_size=None):
         super().__init__()
         self.num_heads = num_heads
         self.num_channels = num_channels
+        self.chunk_size = chunk_size
+        self.chunk_dim = -3
         self.layer_norm = nn.LayerNorm(pair_embedding_size)
         self.query = LinearWithView(pair_embedding_size, (num_heads, num_channels), bias=False)
         self.key = LinearWithView(pair_embedding_size, (num_heads, num_channels), bias=False)
@@ -17,37 +27,43 @@ class TriangleAttentionStartingNode(nn.Module):
         self.gate = LinearWithView(pair_embedding_size, (num_heads, num_channels), bias=False)
         self.out_proj = nn.Linear(num_channels * num_heads, pair_embedding_size, bias=False)
 
-    def attention(self, q, k, v, b):
+    def attention(self, q, k, v, b, mask):
         return F.scaled_dot_product_attention(
             q.transpose(-3, -2),
             k.transpose(-3, -2),
             v.transpose(-3, -2),
-            b.movedim(-1, -3).unsqueeze(-4),
+            key_bias(b.movedim(-1, -3).unsqueeze(-4), mask),
         ).movedim(-3, -2)
 
-    def forward(self, pair_rep):
-        pair_rep = self.layer_norm(pair_rep)
+    def attend(self, pair_rep, b, mask):
         q = self.query(pair_rep)
         k = self.key(pair_rep)
         v = self.value(pair_rep)
-        b = self.bias(pair_rep)
         g = self.gate(pair_rep)
-
-        out = g * self.attention(q, k, v, b)
+        out = g * self.attention(q, k, v, b, mask)
         return self.out_proj(out.flatten(start_dim=-2))
 
+    def forward(self, pair_rep, mask=None):
+        pair_rep = self.layer_norm(pair_rep)
+        b = self.bias(pair_rep)
+        if self.chunk_size is None:
+            return self.attend(pair_rep, b, mask)
+        chunks = pair_rep.split(self.chunk_size, dim=self.chunk_dim)
+        return torch.cat([self.attend(chunk, b, mask) for chunk in chunks], dim=self.chunk_dim)
+
 
 class TriangleAttentionEndingNode(TriangleAttentionStartingNode):
-    def __init__(self, pair_embedding_size, num_heads, num_channels):
-        super().__init__(pair_embedding_size, num_heads, num_channels)
+    def __init__(self, pair_embedding_size, num_heads, num_channels, chunk_size=None):
+        super().__init__(pair_embedding_size, num_heads, num_channels, chunk_size)
+        self.chunk_dim = -2
 
-    def attention(self, q, k, v, b):
+    def attention(self, q, k, v, b, mask):
         return F.scaled_dot_product_attention(
             q.movedim(-4, -2),
             k.movedim(-4, -2),
             v.movedim(-4, -2),
-            b.movedim(-1, -3).transpose(-1, -2).unsqueeze(-4),
+            key_bias(b.movedim(-1, -3).transpose(-1, -2).unsqueeze(-4), mask),
         ).movedim(-2, -4)
 
-    def forward(self, pair_rep):
-        return super().forward(pair_rep)
+    def forward(self, pair_rep, mask=None):
+        return super().forward(pair_rep, mask)
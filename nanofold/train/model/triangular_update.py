@@ -3,8 +3,10 @@ import torch.nn as nn
 
 
 class TriangleMultiplicationOutgoing(nn.Module):
-    def __init__(self, pair_embedding_size, num_channels):
+    def __init__(self, pair_embedding_size, num_channels, chunk_size=None):
         super().__init__()
+        self.chunk_size = chunk_size
+        self.chunk_dim = -3
         self.layer_norm_pair = nn.LayerNorm(pair_embedding_size)
         self.gate_a = nn.Sequential(
             nn.Linear(pair_embedding_size, num_channels, bias=False),
@@ -27,22 +29,40 @@ class TriangleMultiplicationOutgoing(nn.Module):
     def update(self, a, b):
         return torch.einsum("...ikc,...jkc->...ijc", a, b)
 
-    def forward(self, pair_rep):
+    def project(self, pair_rep, pair_mask, gate, linear):
+        x = gate(pair_rep) * linear(pair_rep)
+        return x if pair_mask is None else x * pair_mask
+
+    def forward(self, pair_rep, mask=None):
         pair_rep = self.layer_norm_pair(pair_rep)
-        a = self.gate_a(pair_rep) * self.linear_a(pair_rep)
-        b = self.gate_b(pair_rep) * self.linear_b(pair_rep)
-        g = self.gate(pair_rep)
-        update = self.update(a, b)
-        pair_rep = g * self.update_transition(update)
-        return pair_rep
+        pair_mask = None
+        if mask is not None:
+            pair_mask = (mask.unsqueeze(-1) & mask.unsqueeze(-2)).unsqueeze(-1)
+        b = self.project(pair_rep, pair_mask, self.gate_b, self.linear_b)
+        if self.chunk_size is None:
+            a = self.project(pair_rep, pair_mask, self.gate_a, self.linear_a)
+            return self.gate(pair_rep) * self.update_transition(self.update(a, b))
+        out = []
+        for start in range(0, pair_rep.size(-3), self.chunk_size):
+            length = min(self.chunk_size, pair_rep.size(-3) - start)
+            a = self.project(
+                pair_rep.narrow(self.chunk_dim, start, length),
+                None if pair_mask is None else pair_mask.narrow(self.chunk_dim, start, length),
+                self.gate_a,
+                self.linear_a,
+            )
+            g = self.gate(pair_rep.narrow(-3, start, length))
+            out.append(g * self.update_transition(self.update(a, b)))
+        return torch.cat(out, dim=-3)
 
 
 class TriangleMultiplicationIncoming(TriangleMultiplicationOutgoing):
-    def __init__(self, pair_embedding_size, num_channels):
-        super().__init__(pair_embedding_size, num_channels)
+    def __init__(self, pair_embedding_size, num_channels, chunk_size=None):
+        super().__init__(pair_embedding_size, num_channels, chunk_size)
+        self.chunk_dim = -2
 
     def update(self, a, b):
         return torch.einsum("...kic,...kjc->...ijc", a, b)
 
-    def forward(self, pair_rep):
-        return super().forward(pair_rep)
+    def forward(self, pair_rep, mask=None):
+        return super().forward(pair_rep, mask)
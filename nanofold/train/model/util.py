@@ -14,6 +14,10 @@ class LinearWithView(nn.Module):
         return out.view(*out.shape[:-1], *self.out_features)
 
 
+def mask_bias(mask):
+    return -(10**10) * ~mask
+
+
 class DropoutByDimension(nn.Module):
     def __init__(self, p):
         super().__init__()
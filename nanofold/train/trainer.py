@@ -1,8 +1,26 @@
+import contextlib
 import torch
+from torch.nn.parallel import DistributedDataParallel
 
+from nanofold.train.distributed import broadcast_object
+from nanofold.train.distributed import is_distributed
+from nanofold.train.distributed import reduce_metrics
 from nanofold.train.model import Nanofold
 
 
+def cycle(loader):
+    while True:
+        yield from loader
+
+
+def load_batch(batch, device):
+    cpu_features = ["msa", "has_deletion", "deletion_value"]
+    return {
+        k: v.to(device) if isinstance(v, torch.Tensor) and k not in cpu_features else v
+        for k, v in batch.items()
+    }
+
+
 class Trainer:
     def __init__(
         self,
@@ -18,6 +36,8 @@ class Trainer:
         self.params = params
         self.loggers = loggers
         self.checkpoint_save_freq = checkpoint_save_freq
+        self.grad_accumulation_steps = params.get("grad_accumulation_steps", 1)
+        self.log_every_n_epoch = broadcast_object([l.log_every_n_epoch for l in loggers])
         self.setup_model(checkpoint)
         [l.log_params(params) for l in self.loggers]
         [l.log_config(params) for l in self.loggers]
@@ -48,34 +68,37 @@ class Trainer:
             self.optimizer.load_state_dict(checkpoint["optimizer"])
             self.scaler.load_state_dict(checkpoint["scaler"])
             self.scheduler.load_state_dict(checkpoint["scheduler"])
+        self.train_model = self.model
+        if is_distributed():
+            device_ids = [torch.cuda.current_device()] if self.params["device"] == "cuda" else None
+            self.train_model = DistributedDataParallel(
+                self.model, device_ids=device_ids, find_unused_parameters=True
+            )
 
     def load_batch(self, batch):
-        cpu_features = ["msa", "has_deletion", "deletion_value"]
-        return {
-            k: (
-                v.to(self.params["device"])
-                if isinstance(v, torch.Tensor) and k not in cpu_features
-                else v
-            )
-            for k, v in batch.items()
-        }
+        return load_batch(batch, self.params["device"])
 
-    def training_loop(self, batch):
+    def training_loop(self, batches):
         self.optimizer.zero_grad(set_to_none=True)
-        with torch.autocast(
-            self.params["device"],
-            enabled=self.params["use_amp"] and self.params["device"] == "cuda",
-            dtype=torch.bfloat16,
-        ):
-            out = self.model(batch)
-        self.scaler.scale(out["total_loss"]).backward()
+        metrics = []
+        for i, batch in enumerate(batches):
+            sync = i == len(batches) - 1 or not is_distributed()
+            with contextlib.nullcontext() if sync else self.train_model.no_sync():
+                with torch.autocast(
+                    self.params["device"],
+                    enabled=self.params["use_amp"] and self.params["device"] == "cuda",
+                    dtype=torch.bfloat16,
+                ):
+                    out = self.train_model(self.load_batch(batch))
+                self.scaler.scale(out["total_loss"] / len(batches)).backward()
+            metrics.append({k: v.detach() for k, v in out.items()})
         torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.params["clip_norm"])
         self.scaler.step(self.optimizer)
         current_scale = self.scaler.get_scale()
         self.scaler.update()
         if current_scale <= self.scaler.get_scale():
             self.scheduler.step()
-        return {k: v.item() for k, v in out.items()}
+        return {k: torch.stack([m[k] for m in metrics]).mean().item() for k in metrics[0].keys()}
 
     @torch.no_grad()
     def evaluate(self, batch):
@@ -102,15 +125,21 @@ class Trainer:
             ]
 
     def fit(self, train_loader, test_loader, max_epoch):
+        train_batches = cycle(train_loader)
+        test_batches = cycle(test_loader) if test_loader is not None else None
         while True:
             if self.epoch >= max_epoch:
                 break
-            train_metrics = self.training_loop(self.load_batch(next(iter(train_loader))))
+            train_metrics = self.training_loop(
+                [next(train_batches) for _ in range(self.grad_accumulation_steps)]
+            )
             if (
-                any([self.epoch % l.log_every_n_epoch == 0 for l in self.loggers])
-                and test_loader is not None
+                any([self.epoch % n == 0 for n in self.log_every_n_epoch])
+                and test_batches is not None
             ):
-                test_metrics = self.evaluate(self.load_batch(next(iter(test_loader))))
+                test_metrics = self.evaluate(self.load_batch(next(test_batches)))
+                train_metrics = reduce_metrics(train_metrics, self.params["device"])
+                test_metrics = reduce_metrics(test_metrics, self.params["device"])
                 [l.log_epoch(self.epoch, train_metrics, test_metrics) for l in self.loggers]
             self.epoch += 1
             self.save_checkpoint()
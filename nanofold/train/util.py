@@ -2,7 +2,7 @@ import torch
 
 
 def quaternion_to_rotation_matrix(quaternion):
-    quaternion = torch.concat([torch.ones(quaternion.size(0), 1), quaternion], dim=-1)
+    quaternion = torch.concat([quaternion.new_ones(*quaternion.shape[:-1], 1), quaternion], dim=-1)
     quaternion = quaternion / torch.linalg.vector_norm(quaternion, dim=-1, keepdim=True)
 
     a, b, c, d = (quaternion[..., 0], quaternion[..., 1], quaternion[..., 2], quaternion[..., 3])
@@ -19,9 +19,22 @@ def uniform_random_rotation(*batch_size):
     return rotation if batch_size else rotation[0]
 
 
-def rigid_align(x, x_truth):
-    x = x - x.mean(dim=-2, keepdim=True)
-    x_truth_mean = x_truth.mean(dim=-2, keepdim=True)
+def masked_mean(x, mask):
+    mask = mask.unsqueeze(-1)
+    return (x * mask).sum(dim=-2, keepdim=True) / mask.sum(dim=-2, keepdim=True).clamp(min=1)
+
+
+def centre(x, mask=None):
+    return x - (x.mean(dim=-2, keepdim=True) if mask is None else masked_mean(x, mask))
+
+
+def rigid_align(x, x_truth, mask=None):
+    if mask is None:
+        x = x - x.mean(dim=-2, keepdim=True)
+        x_truth_mean = x_truth.mean(dim=-2, keepdim=True)
+    else:
+        x = (x - masked_mean(x, mask)) * mask.unsqueeze(-1)
+        x_truth_mean = masked_mean(x_truth, mask)
     x_truth = x_truth - x_truth_mean
     product = torch.einsum("...la,...lb->...ab", x_truth, x)
     U, _, V = torch.linalg.svd(product.float())
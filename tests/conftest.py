@@ -0,0 +1,99 @@
+import json
+import numpy as np
+import pyarrow as pa
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from nanofold.common.residue_definitions import MSA_GAP
+from nanofold.common.residue_definitions import RESIDUE_LIST
+from nanofold.preprocess.ipc import get_record_batch
+from nanofold.preprocess.ipc import SCHEMA
+from nanofold.preprocess.msa_builder import parse_msa_features
+from nanofold.preprocess.msa_builder import to_sparse_features
+from nanofold.preprocess.residue import compute_residue_frames
+from nanofold.train.chain_dataset import ChainDataset
+
+DEV_CONFIG = Path(__file__).parents[1] / "config" / "config.dev.json"
+
+RESIDUES = [r[0] for r in RESIDUE_LIST]
+
+
+def random_sequence(length, alphabet):
+    return "".join(np.random.choice(alphabet, length))
+
+
+def make_chain(index, length, num_templates, num_seq):
+    rotations, translations = compute_residue_frames(np.random.normal(size=(length, 3, 3)))
+    sequence = random_sequence(length, RESIDUES)
+    templates = [
+        compute_residue_frames(np.random.normal(size=(length, 3, 3))) for _ in range(num_templates)
+    ]
+    chain = {
+        "_id": {"structure_id": f"{index:04d}", "chain_id": "A"},
+        "rotations": rotations.tolist(),
+        "translations": (10 * translations).tolist(),
+        "sequence": sequence,
+        "positions": list(range(5, 5 + length)),
+        "templates": {
+            "mask": [(np.random.rand(length) < 0.8).tolist() for _ in range(num_templates)],
+            "sequence": [
+                random_sequence(length, RESIDUES + [MSA_GAP]) for _ in range(num_templates)
+            ],
+            "translations": [(10 * t).tolist() for _, t in templates],
+            "rotations": [r.tolist() for r, _ in templates],
+        },
+    }
+    alignments = [sequence] + [
+        random_sequence(length, RESIDUES + [MSA_GAP] * 10) for _ in range(num_seq - 1)
+    ]
+    deletion_matrix = np.random.randint(0, 3, (num_seq, length)).tolist()
+    msa_features, profile_features = parse_msa_features(alignments, deletion_matrix, num_seq)
+    return chain, {**to_sparse_features(msa_features), **profile_features}
+
+
+def write_features_file(path, num_chains, min_length, max_length, num_seq, batch_size=3):
+    chains = [
+        make_chain(
+            i, np.random.randint(min_length, max_length + 1), np.random.randint(0, 3), num_seq
+        )
+        for i in range(num_chains)
+    ]
+    return write_chains(path, chains, batch_size)
+
+
+def write_chains(path, chains, batch_size=3):
+    num_chains = len(chains)
+    features = dict((c["_id"]["structure_id"], m) for c, m in chains)
+    get_features = lambda c: features[c["_id"]["structure_id"]]
+    with ThreadPoolExecutor() as executor:
+        with pa.OSFile(str(path), mode="w") as f:
+            with pa.ipc.new_file(f, SCHEMA) as writer:
+                for i in range(0, num_chains, batch_size):
+                    chain_batch = [c for c, _ in chains[i : i + batch_size]]
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(
+                            get_record_batch(executor, get_features, chain_batch), schema=SCHEMA
+                        )
+                    )
+    return path
+
+
+@pytest.fixture
+def features_file(tmp_path):
+    np.random.seed(0)
+    return write_features_file(
+        tmp_path / "features.arrow", num_chains=8, min_length=20, max_length=40, num_seq=12
+    )
+
+
+@pytest.fixture
+def params():
+    return json.loads(DEV_CONFIG.read_text()) | {"device": "cpu"}
+
+
+@pytest.fixture
+def batch(features_file):
+    np.random.seed(0)
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, 16, 8)
+    return next(iter(dataset))
@@ -0,0 +1,86 @@
+import json
+import numpy as np
+import torch
+from Bio.PDB import MMCIFParser
+from Bio.PDB import PDBParser
+from pathlib import Path
+
+from nanofold.common.residue_definitions import RESIDUE_INDEX
+from nanofold.common.residue_definitions import RESIDUE_INDEX_MSA
+from nanofold.predict.features import featurize
+from nanofold.predict.features import get_single_sequence_msa_features
+from nanofold.predict.features import read_fasta
+from nanofold.predict.structure import build_structure
+from nanofold.predict.structure import write_structure
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.model import Nanofold
+from tests.conftest import make_chain
+from tests.conftest import write_chains
+
+CONFIG = Path(__file__).parents[2] / "config" / "config.dev.json"
+
+
+def test_read_fasta(tmp_path):
+    fasta = tmp_path / "chains.fasta"
+    fasta.write_text(">1abc_A description\nMKT\nayi\n\n>2xyz_B\nGGUB\n")
+    assert read_fasta(fasta) == [("1abc_A", "MKTAYI"), ("2xyz_B", "GGXX")]
+
+
+def test_featurize_matches_chain_dataset(tmp_path):
+    np.random.seed(0)
+    chain, msa_features = make_chain(0, 24, 0, 12)
+    dataset, _ = ChainDataset.construct_datasets(
+        write_chains(tmp_path / "features.arrow", [(chain, msa_features)]), 1.0, 32, 8
+    )
+    torch.manual_seed(0)
+    expected = next(iter(dataset))
+    torch.manual_seed(0)
+    result = featurize(chain["sequence"], msa_features, 8)
+    assert result.keys() == expected.keys() - {"coords_truth", "translations"}
+    for k in result.keys() - {"residue_index", "ref_space_uid"}:
+        assert result[k].dtype == expected[k].dtype, k
+        assert torch.allclose(result[k], expected[k]), k
+
+
+def test_featurize_single_sequence():
+    sequence = "MKTAYIAKQRX"
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), 8)
+    assert features["msa"].shape == (1, len(sequence), len(RESIDUE_INDEX_MSA))
+    assert torch.equal(features["msa"][0].float(), features["profile"])
+    assert features["template_restype"].shape[0] == 0
+
+
+def test_featurize_nonstandard_residues():
+    sequence = "MKTUAYB"
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), 8)
+    expected = torch.tensor([RESIDUE_INDEX[r] for r in "MKTXAYX"])
+    assert torch.equal(features["restype"].argmax(dim=-1), expected)
+    assert torch.equal(features["msa"][0, :, : len(RESIDUE_INDEX)].float(), features["restype"])
+
+
+def test_write_structure(tmp_path):
+    sequence = "MKTAX"
+    coords = np.random.rand(3 * len(sequence), 3).astype(np.float32) * 10
+    structure = build_structure("test", sequence, coords)
+    for suffix, parser in [(".cif", MMCIFParser), (".pdb", PDBParser)]:
+        write_structure(structure, tmp_path / f"test{suffix}")
+        result = parser(QUIET=True).get_structure("test", tmp_path / f"test{suffix}")
+        residues = list(result.get_residues())
+        assert [r.get_resname() for r in residues] == ["MET", "LYS", "THR", "ALA", "UNK"]
+        result_coords = np.stack([a.coord for r in residues for a in r])
+        assert np.allclose(result_coords, coords, atol=1e-3)
+
+
+def test_inference_model_loads_training_checkpoint():
+    params = json.loads(CONFIG.read_text()) | {"device": "cpu"}
+    state_dict = Nanofold.from_config(params).state_dict()
+    model = Nanofold(**Nanofold.get_args(params), inference=True)
+    model.load_state_dict(state_dict)
+    model.eval()
+    sequence = "MKTAYIAKQRQISFVKSHFSRQ"
+    features = featurize(sequence, get_single_sequence_msa_features(sequence), 8)
+    with torch.no_grad():
+        input, single_rep, pair_rep = model.run_trunk(features)
+        coords = model.diffusion_model(features, input, single_rep, pair_rep)
+    assert coords.shape == (3 * len(sequence), 3)
+    assert torch.all(torch.isfinite(coords))
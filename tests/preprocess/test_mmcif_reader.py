@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from nanofold.preprocess import mmcif_parser
+from nanofold.preprocess import mmcif_reader
+
+
+@pytest.mark.parametrize("identifier", ["115L", "1A00", "1ENX", "1GSG", "1RNL"])
+def test_parse_mmcif_file_matches_biopython(data_dir, identifier):
+    filepath = data_dir / f"{identifier}.cif"
+    expected = mmcif_parser.parse_mmcif_file(filepath, capture_errors=False)
+    chains = mmcif_reader.parse_mmcif_file(filepath, capture_errors=False)
+    assert len(chains) == len(expected)
+    for chain, expected_chain in zip(chains, expected):
+        assert chain.keys() == expected_chain.keys()
+        for key in ["structure_id", "chain_id", "sequence", "positions", "label_positions"]:
+            assert chain[key] == expected_chain[key]
+        assert np.allclose(chain["rotations"], expected_chain["rotations"])
+        assert np.allclose(chain["translations"], expected_chain["translations"])
+
+
+def test_tokenize():
+    line = "HETATM 1 O \"O5'\" . 'A B' A 1 ? 1.0 2.0 3.0"
+    assert mmcif_reader.tokenize(line) == [
+        "HETATM",
+        "1",
+        "O",
+        "O5'",
+        ".",
+        "A B",
+        "A",
+        "1",
+        "?",
+        "1.0",
+        "2.0",
+        "3.0",
+    ]
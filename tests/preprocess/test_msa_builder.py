@@ -0,0 +1,24 @@
+import numpy as np
+
+from nanofold.preprocess.msa_builder import add_row_pointers
+from nanofold.preprocess.msa_builder import parse_msa_features
+from nanofold.preprocess.msa_builder import to_sparse_features
+
+
+def test_add_row_pointers():
+    alignments = ["ACDE", "A-DE", "--KW"]
+    deletion_matrix = [[0, 0, 0, 0], [1, 0, 0, 2], [0, 3, 0, 0]]
+    msa_feat, _ = parse_msa_features(alignments, deletion_matrix, 3)
+    sparse_feat = to_sparse_features(msa_feat)
+    order = np.random.permutation(len(sparse_feat["msa_data"]))
+    shuffled = {k: v for k, v in sparse_feat.items() if k != "msa_indptr"}
+    shuffled["msa_data"] = np.array(sparse_feat["msa_data"])[order].tolist()
+    shuffled["msa_coords"] = [np.array(c)[order].tolist() for c in sparse_feat["msa_coords"]]
+    shuffled = add_row_pointers(shuffled)
+    assert shuffled["msa_coords"] == sparse_feat["msa_coords"]
+    assert shuffled["msa_indptr"] == sparse_feat["msa_indptr"]
+    rows = np.array(sparse_feat["msa_coords"][0])
+    indptr = sparse_feat["msa_indptr"]
+    assert len(indptr) == len(alignments[0]) + 1
+    for i in range(len(alignments[0])):
+        assert np.all(rows[indptr[i] : indptr[i + 1]] == i)
@@ -0,0 +1,63 @@
+import fcntl
+import pytest
+import subprocess
+import sys
+
+from nanofold.preprocess.msa_runner import MSARunner
+
+FAKE_JACKHMMER = """#!{python}
+import sys
+if "fail" in open(sys.argv[-2]).read():
+    sys.exit(1)
+with open(sys.argv[sys.argv.index("-A") + 1], "w") as f:
+    f.write("# STOCKHOLM 1.0\\n")
+    for i in range(100):
+        f.write(f"#=GS hit_{{i}} DE hit {{i}}\\n")
+    for block in range(3):
+        f.write("\\n")
+        for i in range(100):
+            f.write(f"hit_{{i}} MKTAYIAKQR\\n")
+            f.write(f"#=GR hit_{{i}} PP 9999999999\\n")
+    f.write("//\\n")
+"""
+
+
+@pytest.fixture
+def jackhmmer_bin(tmp_path):
+    path = tmp_path / "jackhmmer"
+    path.write_text(FAKE_JACKHMMER.format(python=sys.executable))
+    path.chmod(0o755)
+    return path
+
+
+def run_search(jackhmmer_bin, cache_dir, sequence, stream_output):
+    cache_dir.mkdir()
+    runner = MSARunner(jackhmmer_bin, "small_bfd", cache_dir, 1, 10, stream_output)
+    fasta = cache_dir / "query.fasta"
+    fasta.write_text(f">query\n{sequence}\n")
+    return "".join(runner.run(fasta, "1abc_A")())
+
+
+def test_stream_output_matches_file_output(tmp_path, jackhmmer_bin):
+    expected = run_search(jackhmmer_bin, tmp_path / "file", "MKTAYIAKQR", False)
+    result = run_search(jackhmmer_bin, tmp_path / "stream", "MKTAYIAKQR", True)
+    assert result == expected
+    assert result.count("hit_") == 10 * 4
+    assert sorted(f.name for f in (tmp_path / "stream").iterdir()) == [
+        "1abc_A.sto.gz",
+        "query.fasta",
+        "shared",
+        "timings.jsonl",
+    ]
+
+
+def test_stream_output_without_pipe_size(tmp_path, jackhmmer_bin, monkeypatch):
+    monkeypatch.delattr(fcntl, "F_SETPIPE_SZ", raising=False)
+    expected = run_search(jackhmmer_bin, tmp_path / "file", "MKTAYIAKQR", False)
+    assert run_search(jackhmmer_bin, tmp_path / "stream", "MKTAYIAKQR", True) == expected
+
+
+def test_stream_output_failure(tmp_path, jackhmmer_bin):
+    with pytest.raises(subprocess.CalledProcessError):
+        run_search(jackhmmer_bin, tmp_path / "stream", "fail", True)
+    assert sorted(f.name for f in (tmp_path / "stream").iterdir()) == ["query.fasta", "shared"]
@@ -0,0 +1,161 @@
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from nanofold.preprocess import pipeline
+from nanofold.preprocess.pipeline import Stage
+from nanofold.preprocess.pipeline import allocate_workers
+from nanofold.preprocess.pipeline import run_pipeline
+from nanofold.preprocess.template import update_template_features
+
+
+def run_stages(stages, items):
+    for stage in stages:
+        stage.start()
+    for i in items:
+        stages[0].put(i)
+    for stage in stages:
+        stage.close()
+        stage.join()
+
+
+def test_stages_stream_items():
+    results = []
+    received_first = threading.Event()
+
+    def square(x):
+        if x == 3:
+            raise ValueError("failed item")
+        if x == 1:
+            assert received_first.wait(timeout=5)
+        return [x * x]
+
+    def collect(x):
+        results.append(x)
+        received_first.set()
+        return []
+
+    collector = Stage("collect", collect, 2, 2)
+    squarer = Stage("square", square, 3, 2, collector)
+    run_stages([squarer, collector], range(10))
+
+    assert sorted(results) == [i * i for i in range(10) if i != 3]
+    assert squarer.num_processed == 9
+    assert squarer.num_failed == 1
+    assert collector.num_processed == 9
+
+
+def test_allocate_workers():
+    workers = allocate_workers(32, {"small_bfd": 1, "uniclust30": 8})
+    assert workers == {"mmcif": 3, "small_bfd": 12, "uniclust30": 1, "msa": 3, "templates": 3}
+    assert all(w == 1 for w in allocate_workers(1, {"uniclust30": 8}).values())
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+
+    def insert_one(self, document):
+        self.documents.append(document)
+
+    def insert_many(self, documents):
+        self.documents.extend(documents)
+
+    def find(self, query={}, projection=None):
+        return [
+            d
+            for d in list(self.documents)
+            if all((k in d) == bool(v["$exists"]) for k, v in query.items())
+        ]
+
+    def find_one(self, query, projection=None):
+        return next((d for d in self.documents if d["_id"] == query["_id"]), None)
+
+    def update_one(self, query, update):
+        self.find_one(query).update(update["$set"])
+
+
+class StubRunner:
+    def __init__(self, log_dir, output=""):
+        self.log_dir = log_dir
+        self.output = output
+        self.num_cpus = 1
+        self.num_cpu = 1
+        log_dir.mkdir()
+
+    def run(self, input, id):
+        return self.search(Path(input).read_text().split()[-1])
+
+    def search(self, sequence):
+        active = self.log_dir / sequence
+        try:
+            os.close(os.open(active, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            (self.log_dir / "overlapping").touch()
+        time.sleep(0.01)
+        active.unlink(missing_ok=True)
+        with open(self.log_dir / "searches", "a") as f:
+            f.write(f"{sequence}\n")
+        return lambda: iter(self.output.splitlines(keepends=True))
+
+
+def get_msa(uniclust30_msa_search, small_bfd_msa_search, chain):
+    return {"sequence": chain["sequence"]}
+
+
+def get_hhr(hhblits_runner, reformat_bin, msa_runner, chain):
+    return hhblits_runner.search(chain["sequence"])
+
+
+def test_run_pipeline(tmp_path, data_dir, monkeypatch):
+    mmcif_dir = tmp_path / "mmcif"
+    mmcif_dir.mkdir()
+    for name in ["115L", "1A00", "1ENX"]:
+        shutil.copy(data_dir / f"{name}.cif", mmcif_dir)
+    msa_output_dir = tmp_path / "msa"
+    msa_output_dir.mkdir()
+    seed = {"_id": {"structure_id": "9xyz", "chain_id": "A"}, "sequence": "MKTAYIAKQR" * 4}
+    done = {"_id": {"structure_id": "9xyz", "chain_id": "B"}, "sequence": "GSHM" * 10}
+    done["templates"] = {}
+    short = {"_id": {"structure_id": "9xyz", "chain_id": "C"}, "sequence": "GSHM"}
+    chains = FakeCollection([seed, done, short])
+    processed = FakeCollection([{"_id": "115l"}])
+    db_manager = SimpleNamespace(chains=lambda: chains, processed_mmcif_files=lambda: processed)
+
+    processed_at_update = []
+
+    def update(db_manager, chain, hhr_output, max_templates):
+        processed_at_update.append(len(processed.documents))
+        update_template_features(db_manager, chain, hhr_output, max_templates)
+
+    monkeypatch.setattr(pipeline, "get_msa", get_msa)
+    monkeypatch.setattr(pipeline, "get_hhr", get_hhr)
+    monkeypatch.setattr(pipeline, "update_template_features", update)
+    small_bfd = StubRunner(tmp_path / "small_bfd")
+    uniclust30 = StubRunner(tmp_path / "uniclust30")
+    pdb70 = StubRunner(tmp_path / "pdb70", (data_dir / "1vh2_A.hhr").read_text())
+    run_pipeline(db_manager, mmcif_dir, small_bfd, uniclust30, pdb70, None, msa_output_dir, 8)
+
+    searched = [c for c in chains.documents if len(c["sequence"]) >= 32 and c is not done]
+    assert sorted((c["_id"]["structure_id"], c["_id"]["chain_id"]) for c in searched) == [
+        ("1a00", "A"),
+        ("1a00", "B"),
+        ("1a00", "C"),
+        ("1a00", "D"),
+        ("1enx", "A"),
+        ("1enx", "B"),
+        ("9xyz", "A"),
+    ]
+    assert all("templates" in c for c in searched)
+    assert "templates" not in short and done["templates"] == {}
+    assert sorted(f.name for f in msa_output_dir.iterdir()) == sorted(
+        f"{c['_id']['structure_id']}_{c['_id']['chain_id']}.pkl.gz" for c in searched
+    )
+    assert processed_at_update == [3] * len(searched)
+    for runner in [small_bfd, uniclust30, pdb70]:
+        searches = (runner.log_dir / "searches").read_text().splitlines()
+        assert sorted(searches) == sorted(c["sequence"] for c in searched)
+        assert not (runner.log_dir / "overlapping").exists()
@@ -0,0 +1,86 @@
+import numpy as np
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+from nanofold.preprocess.scheduler import RuntimeModel
+from nanofold.preprocess.scheduler import call_with_usage
+from nanofold.preprocess.scheduler import get_query_length
+from nanofold.preprocess.scheduler import run_with_usage
+from nanofold.preprocess.scheduler import schedule
+
+
+def make_chains(lengths):
+    return [{"_id": i, "sequence": "A" * length} for i, length in enumerate(lengths)]
+
+
+def test_runtime_model(tmp_path):
+    model = RuntimeModel(tmp_path / "timings.jsonl")
+    assert model.predict(100) == (100.0, None)
+    for length in [50, 100, 200, 400, 800]:
+        model.record(length, 2 * length**1.5, 10 * length * (1.1 if length == 200 else 1))
+    model.fit()
+    seconds, memory = model.predict(300)
+    assert abs(seconds - 2 * 300**1.5) / seconds < 1e-6
+    assert memory >= 10 * 300
+    assert all(model.predict(length)[1] >= 10 * length for length in [50, 100, 200, 400, 800])
+
+
+def test_schedule_longest_first(tmp_path):
+    lengths = [30, 500, 120, 80, 300]
+    with ThreadPoolExecutor(1) as executor:
+        scheduled = list(
+            schedule(executor, len, make_chains(lengths), RuntimeModel(tmp_path / "t.jsonl"), 1)
+        )
+    assert [len(c["sequence"]) for c, _ in scheduled] == sorted(lengths, reverse=True)
+    assert all(f.result() == 2 for _, f in scheduled)
+
+
+def test_schedule_memory_admission(tmp_path):
+    model = RuntimeModel(tmp_path / "timings.jsonl")
+    for length in [10, 20, 40, 80, 160]:
+        model.record(length, length, 100)
+    running = []
+    max_running = [0]
+    lock = threading.Lock()
+
+    def job(chain):
+        with lock:
+            running.append(chain["_id"])
+            max_running[0] = max(max_running[0], len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(chain["_id"])
+
+    chains = make_chains([10, 20, 30, 40, 50, 60])
+    with ThreadPoolExecutor(4) as executor:
+        assert len(list(schedule(executor, job, chains, model, 4, memory_limit=250))) == 6
+    assert max_running[0] == 2
+
+
+def test_run_with_usage():
+    returncode, seconds, memory = run_with_usage([sys.executable, "-c", "pass"])
+    assert returncode == 0
+    assert seconds > 0
+    assert memory > 0
+    assert run_with_usage([sys.executable, "-c", "exit(3)"])[0] == 3
+
+
+def allocate(megabytes):
+    return np.ones(megabytes * 1024**2 // 8).sum() > 0
+
+
+def test_call_with_usage_reused_worker():
+    with ProcessPoolExecutor(1) as executor:
+        usage = [executor.submit(call_with_usage, allocate, m).result() for m in [200, 100]]
+    assert all(result for result, _, _ in usage)
+    assert usage[0][2] > 150
+    assert usage[1][2] > 75
+
+
+def test_get_query_length(tmp_path):
+    a2m = tmp_path / "query.a2m"
+    a2m.write_text(">query\nMKTA-YIAK\nQRQ\n>hit\nMK--YIAKQRQ\n")
+    assert get_query_length(a2m) == 11
@@ -0,0 +1,77 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from nanofold.preprocess import msa_runner
+from nanofold.preprocess import template
+from nanofold.preprocess.msa_builder import execute_msa_search
+from nanofold.preprocess.search_cache import count_avoided_searches
+from nanofold.preprocess.search_cache import split_by_sequence
+
+
+def make_chain(structure_id, chain_id, sequence):
+    return {"_id": {"structure_id": structure_id, "chain_id": chain_id}, "sequence": sequence}
+
+
+def test_msa_runner_shares_identical_sequences(tmp_path, monkeypatch):
+    searched = []
+
+    def jackhmmer(cmd, **kwargs):
+        sequence = Path(cmd[-2]).read_text().split()[-1]
+        Path(cmd[cmd.index("-A") + 1]).write_text(f"# STOCKHOLM 1.0\nquery {sequence}\n//\n")
+        searched.append(cmd[-2])
+        return 0, 1.0, 64.0
+
+    monkeypatch.setattr(msa_runner, "run_with_usage", jackhmmer)
+    runner = msa_runner.MSARunner("jackhmmer", "small_bfd", tmp_path, 1, None)
+    chains = [
+        make_chain("1abc", "A", "MKTAYIAK"),
+        make_chain("1abc", "B", "MKTAYIAK"),
+        make_chain("2xyz", "A", "MKTAYIAK"),
+        make_chain("1abc", "C", "GSHMLEDP"),
+    ]
+    results = [list(execute_msa_search(runner, c)()) for c in chains]
+
+    assert len(searched) == 2
+    assert results[0] == results[1] == results[2]
+    assert results[0] != results[3]
+    assert sorted(f.name for f in tmp_path.glob("*.gz")) == [
+        "1abc_A.sto.gz",
+        "1abc_B.sto.gz",
+        "1abc_C.sto.gz",
+        "2xyz_A.sto.gz",
+    ]
+    assert count_avoided_searches(tmp_path) == 2
+    assert list(execute_msa_search(runner, chains[1])()) == results[1]
+    assert len(searched) == 2
+
+
+def test_split_by_sequence():
+    chains = [
+        make_chain("1abc", "A", "MKTAYIAK"),
+        make_chain("1abc", "B", "MKTAYIAK"),
+        make_chain("1abc", "C", "GSHMLEDP"),
+    ]
+    unique, duplicates = split_by_sequence(chains)
+    assert unique == [chains[0], chains[2]]
+    assert duplicates == [chains[1]]
+
+
+def test_get_hhr_contents_failed_search(monkeypatch):
+    def get_hhr(hhblits_runner, reformat_bin, msa_runner, chain):
+        if chain["sequence"] == "MKTAYIAK":
+            raise RuntimeError("search failed")
+        return f"{chain['_id']['structure_id']}_{chain['_id']['chain_id']}"
+
+    monkeypatch.setattr(template, "get_hhr", get_hhr)
+    chains = [
+        make_chain("1abc", "A", "MKTAYIAK"),
+        make_chain("1abc", "B", "GSHMLEDP"),
+        make_chain("2xyz", "A", "MKTAYIAK"),
+        make_chain("1abc", "C", "QRQWERTY"),
+    ]
+    with ThreadPoolExecutor(2) as executor:
+        results = list(template.get_hhr_contents(None, None, None, executor, chains))
+    assert [(c["_id"], hhr) for c, hhr in results] == [
+        (chains[1]["_id"], "1abc_B"),
+        (chains[3]["_id"], "1abc_C"),
+    ]
@@ -1,6 +1,8 @@
 from io import StringIO
 
 from nanofold.preprocess.sto_parser import extract_alignments
+from nanofold.preprocess.sto_parser import stream_truncate_sto
+from nanofold.preprocess.sto_parser import truncate_sto
 
 
 def test_parse_msa():
@@ -31,3 +33,32 @@ Q8QVG3_ADEBA/907-1142              -----LALALGSGLAVN---------S-NN
         "-----LALALGSGLAVN--NN",
     ]
     assert deletion_matrix == expected_deletion_matrix
+
+
+def test_stream_truncate_sto():
+    sto = """# STOCKHOLM 1.0
+#=GF ID query
+#=GS hit_1/1-8   DE first hit
+#=GS hit_2/3-9   DE second hit
+#=GS hit_3/2-7   DE third hit
+
+query            MKTA
+hit_1/1-8        MK-A
+#=GR hit_1/1-8 PP 99*9
+hit_2/3-9        -KTA
+hit_3/2-7        M--A
+#=GC RF          xxxx
+#=GC PP_cons     9999
+
+query            YIAK
+hit_1/1-8        YI-K
+#=GR hit_1/1-8 PP 9*99
+hit_2/3-9        YIA-
+hit_3/2-7        -IAK
+#=GC RF          xxxx
+//
+"""
+    for max_sequences in [1, 2, 3, 4, 10]:
+        output = StringIO()
+        stream_truncate_sto(StringIO(sto), output, max_sequences)
+        assert output.getvalue() == truncate_sto(StringIO(sto), max_sequences)
@@ -0,0 +1,26 @@
+import torch
+
+from nanofold.train.model.atom_attention_encoder import AtomAttentionEncoder
+
+
+def test_atom_attention_encoder_pair_blocks():
+    num_atoms = 30
+    model = AtomAttentionEncoder(8, 4, 6, 5, 7, 1, 2, 8, 16)
+    ref_pos = torch.rand(num_atoms, 3)
+    ref_space_uid = torch.arange(num_atoms) // 3
+    _, _, c, pair_rep = model(ref_pos, ref_space_uid, None, None, None)
+    query_index, key_index, _ = model.atom_transformer.windows(num_atoms, ref_pos.device)
+    assert pair_rep.shape == (*key_index.shape[:1], 8, 16, 4)
+
+    for block, (queries, keys) in enumerate(zip(query_index, key_index)):
+        for x, i in enumerate(queries):
+            for y, j in enumerate(keys):
+                distance = ref_pos[i] - ref_pos[j]
+                mask = (ref_space_uid[i] == ref_space_uid[j]).float().unsqueeze(-1)
+                p = model.linear_pos_offset(distance) * mask
+                p = p + model.linear_inv_sq_dist(1 / (1 + distance @ distance).unsqueeze(-1)) * mask
+                p = p + model.linear_mask(mask) * mask
+                p = p + model.conditioning_transition_a(c[i])
+                p = p + model.conditioning_transition_b(c[j])
+                p = p + model.pair_mlp(p)
+                assert torch.allclose(pair_rep[block, x, y], p, atol=1e-5)
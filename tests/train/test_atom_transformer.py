@@ -0,0 +1,28 @@
+import pytest
+import torch
+
+from nanofold.train.model.atom_transformer import AtomTransformer
+
+
+def dense_atom_transformer(model, q, c, pair_rep, atom_mask=None):
+    centres = torch.arange((model.num_queries - 1) / 2, q.size(-2), model.num_queries)
+    row_mask = torch.abs(torch.arange(q.size(-2)).unsqueeze(-1) - centres) < model.num_queries / 2
+    col_mask = torch.abs(torch.arange(q.size(-2)).unsqueeze(-1) - centres) < model.num_keys / 2
+    mask = torch.any(row_mask.unsqueeze(-2) & col_mask.unsqueeze(-3), dim=-1)
+    beta = -(10**10) * ~mask
+    return model.diffusion_transformer(q, c, pair_rep, beta, atom_mask)
+
+
+@pytest.mark.parametrize("num_atoms", [24, 64, 92])
+def test_atom_transformer_matches_dense(num_atoms):
+    model = AtomTransformer(8, 6, 4, 2, 2, 8, 32)
+    q = torch.rand(3, num_atoms, 8)
+    c = torch.rand(1, num_atoms, 6)
+    pair_rep = torch.rand(1, num_atoms, num_atoms, 4)
+    atom_mask = torch.arange(num_atoms) < num_atoms - 5
+    query_index, key_index, _ = model.windows(num_atoms, q.device)
+    blocks = pair_rep[..., query_index.unsqueeze(-1), key_index.unsqueeze(-2), :]
+    result = model(q, c, blocks, atom_mask)
+    expected = dense_atom_transformer(model, q, c, pair_rep, atom_mask)
+    assert result.shape == q.shape
+    assert torch.allclose(result, expected, atol=1e-5)
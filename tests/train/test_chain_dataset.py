@@ -0,0 +1,231 @@
+import numpy as np
+import pickle
+import pyarrow as pa
+import pytest
+import torch
+
+from nanofold.common.msa_metadata import COMPRESSED_MSA_FIELDS
+from nanofold.preprocess.ipc import convert_to_tensor_layout
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.chain_dataset import collate_features
+from nanofold.train.chain_dataset import decode_sparse_crop
+from nanofold.train.model.msa_module import expand_compact_msa
+
+
+def parse_row(dataset, row, index, start, length):
+    row = row | {
+        msa_field: dataset.extract_and_slice_msa(msa_field, start, index, length)
+        for msa_field in COMPRESSED_MSA_FIELDS.keys()
+    }
+    torch.manual_seed(0)
+    return dataset.parse_features(row, length)
+
+
+def assert_features_equal(expected, result):
+    assert expected.keys() == result.keys()
+    for k in expected.keys():
+        assert expected[k].dtype == result[k].dtype, k
+        assert torch.equal(expected[k], result[k]), k
+
+
+@pytest.mark.parametrize("crop_size", [16, 64])
+def test_zero_copy_matches_list_slicing(features_file, crop_size):
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, crop_size, 8)
+    for index in range(len(dataset.lengths)):
+        length = int(dataset.lengths[index])
+        for start in {0, max(0, length - crop_size)}:
+            crop_length = min(length, crop_size)
+            expected = parse_row(
+                dataset, dataset.slice_row(index, start, crop_length), index, start, crop_length
+            )
+            result = parse_row(
+                dataset,
+                dataset.slice_row_zero_copy(index, start, crop_length),
+                index,
+                start,
+                crop_length,
+            )
+            assert_features_equal(expected, result)
+
+
+def test_iter_zero_copy(features_file):
+    _, dataset = ChainDataset.construct_datasets(features_file, 0.5, 16, 8, zero_copy=True)
+    np.random.seed(0)
+    features = next(iter(dataset))
+    assert features["restype"].shape == (16, 21)
+    assert features["coords_truth"].shape == (48, 3)
+    assert features["msa"].shape[-2:] == (16, 22)
+
+
+@pytest.mark.parametrize("train_split", [0.125, 0.875])
+def test_construct_datasets_too_small_for_world_size(features_file, train_split):
+    with pytest.raises(ValueError):
+        ChainDataset.construct_datasets(features_file, train_split, 16, 8, rank=0, world_size=2)
+
+
+def test_tensor_layout_matches_list_layout(features_file, tmp_path):
+    tensor_file = tmp_path / "features.tensor.arrow"
+    convert_to_tensor_layout(features_file, tensor_file)
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, 16, 8)
+    tensor_dataset, _ = ChainDataset.construct_datasets(tensor_file, 1.0, 16, 8)
+    assert tensor_dataset.zero_copy
+    for index in range(len(dataset.lengths)):
+        length = int(dataset.lengths[index])
+        assert tensor_dataset.lengths[index] == length
+        start = length // 3
+        crop_length = min(length - start, 16)
+        expected = parse_row(
+            dataset, dataset.slice_row(index, start, crop_length), index, start, crop_length
+        )
+        result = parse_row(
+            tensor_dataset,
+            tensor_dataset.slice_row_zero_copy(index, start, crop_length),
+            index,
+            start,
+            crop_length,
+        )
+        assert_features_equal(expected, result)
+
+
+def test_tensor_layout_of_legacy_features_file(features_file, tmp_path):
+    with pa.memory_map(str(features_file)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    table = table.drop_columns([n for n in table.column_names if n.endswith("_indptr")])
+    legacy_file = tmp_path / "features.legacy.arrow"
+    with pa.OSFile(str(legacy_file), mode="w") as f:
+        with pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table, max_chunksize=3)
+    tensor_file = tmp_path / "features.tensor.arrow"
+    legacy_tensor_file = tmp_path / "features.legacy.tensor.arrow"
+    convert_to_tensor_layout(features_file, tensor_file)
+    convert_to_tensor_layout(legacy_file, legacy_tensor_file)
+    with pa.memory_map(str(tensor_file)) as source, pa.memory_map(
+        str(legacy_tensor_file)
+    ) as legacy_source:
+        expected = pa.ipc.open_file(source).read_all()
+        assert pa.ipc.open_file(legacy_source).read_all().equals(expected)
+
+
+def test_lazy_table_matches_in_memory_table(features_file):
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, 16, 8, zero_copy=True)
+    lazy_dataset, _ = ChainDataset.construct_datasets(
+        features_file, 1.0, 16, 8, zero_copy=True, lazy=True
+    )
+    assert lazy_dataset.table.reader.num_record_batches > 1
+    assert np.array_equal(dataset.lengths, lazy_dataset.lengths)
+    worker_dataset = pickle.loads(pickle.dumps(lazy_dataset))
+    assert pickle.loads(pickle.dumps(lazy_dataset.table)).schema == lazy_dataset.table.schema
+    for index in range(len(dataset.lengths)):
+        length = int(dataset.lengths[index])
+        expected = parse_row(
+            dataset, dataset.slice_row_zero_copy(index, 0, length), index, 0, length
+        )
+        result = parse_row(
+            worker_dataset,
+            worker_dataset.slice_row_zero_copy(index, 0, length),
+            index,
+            0,
+            length,
+        )
+        assert_features_equal(expected, result)
+
+
+def sparse_crop_reference(dataset, col_name, start, index, length):
+    sparse_matrix = torch.sparse_coo_tensor(
+        dataset.get_row(f"{col_name}_coords", index)[0].as_py(),
+        dataset.get_row(f"{col_name}_data", index)[0].as_py(),
+        dataset.get_row(f"{col_name}_shape", index)[0].as_py(),
+    )
+    return (
+        torch.stack([sparse_matrix[i] for i in range(start, start + length)])
+        .to_dense()
+        .reshape(length, -1, COMPRESSED_MSA_FIELDS[col_name].feat_size)
+        .transpose(0, 1)
+    )
+
+
+@pytest.mark.parametrize("crop_size", [1, 16, 64])
+def test_decode_sparse_crop_matches_sparse_tensor(features_file, crop_size):
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, crop_size, 8)
+    assert dataset.row_sorted_msa
+    for index in range(len(dataset.lengths)):
+        length = int(dataset.lengths[index])
+        crop_length = min(length, crop_size)
+        for start in {0, length // 2 - crop_length // 2, length - crop_length}:
+            for col_name in COMPRESSED_MSA_FIELDS.keys():
+                expected = sparse_crop_reference(dataset, col_name, start, index, crop_length)
+                row_sorted = dataset.extract_and_slice_msa(col_name, start, index, crop_length)
+                unsorted = decode_sparse_crop(
+                    dataset.get_row(f"{col_name}_coords", index),
+                    dataset.get_row(f"{col_name}_data", index),
+                    dataset.get_row(f"{col_name}_shape", index),
+                    start,
+                    crop_length,
+                    COMPRESSED_MSA_FIELDS[col_name].feat_size,
+                )
+                for result in [row_sorted, unsorted]:
+                    assert expected.dtype == result.dtype
+                    assert torch.equal(expected, result)
+
+
+def test_compact_msa_matches_sparse_msa(features_file, tmp_path):
+    compact_file = tmp_path / "features.compact.arrow"
+    convert_to_tensor_layout(features_file, compact_file, compact_msa=True)
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, 16, 8)
+    compact_dataset, _ = ChainDataset.construct_datasets(compact_file, 1.0, 16, 8)
+    assert compact_dataset.compact_msa
+    for index in range(len(dataset.lengths)):
+        length = int(dataset.lengths[index])
+        start = length // 3
+        crop_length = min(length - start, 16)
+        expected = parse_row(
+            dataset, dataset.slice_row(index, start, crop_length), index, start, crop_length
+        )
+        row = compact_dataset.slice_row_zero_copy(index, start, crop_length)
+        row = row | compact_dataset.slice_compact_msa(index, start, crop_length)
+        torch.manual_seed(0)
+        result = compact_dataset.parse_features(row, crop_length)
+        assert result["msa_index"].dtype == torch.uint8
+        msa = torch.concat(
+            [expected.pop(k) for k in ["msa", "has_deletion", "deletion_value"]], dim=-1
+        )
+        expanded = expand_compact_msa(result.pop("msa_index"), result.pop("deletion_count"))
+        assert torch.allclose(msa, expanded)
+        assert_features_equal(expected, result)
+
+
+@pytest.mark.parametrize("num_length_buckets", [0, 2])
+def test_sample_index_matches_acceptance_weights(num_length_buckets):
+    lengths = np.array([100, 300, 400, 600, 100, 300])
+    dataset = ChainDataset(
+        pa.table({"length": lengths}),
+        np.arange(len(lengths)),
+        lengths,
+        384,
+        8,
+        num_length_buckets=num_length_buckets,
+        bucket_run_length=5,
+    )
+    np.random.seed(0)
+    samples = np.array([dataset.sample_index() for _ in range(30000)])
+    weights = np.clip(lengths, 256, 512) / 512
+    frequencies = np.bincount(samples, minlength=len(lengths)) / len(samples)
+    assert np.allclose(frequencies, weights / weights.sum(), atol=0.01)
+    if num_length_buckets > 0:
+        short_bucket = np.isin(samples, [0, 4, 1]).reshape(-1, 5)
+        assert np.all(short_bucket.all(axis=-1) | ~short_bucket.any(axis=-1))
+
+
+def test_collate_features_pads_and_masks(features_file):
+    dataset, _ = ChainDataset.construct_datasets(features_file, 1.0, 64, 8)
+    samples = [
+        parse_row(dataset, dataset.slice_row(index, 0, length), index, 0, length)
+        for index, length in [(0, 12), (1, 18)]
+    ]
+    batch = collate_features(samples)
+    assert batch["residue_index"].shape == (2, 18)
+    assert batch["residue_mask"].sum(dim=-1).tolist() == [12, 18]
+    assert batch["atom_mask"].sum(dim=-1).tolist() == [s["ref_pos"].size(-2) for s in samples]
+    for i, sample in enumerate(samples):
+        for k, v in sample.items():
+            assert torch.equal(batch[k][i][tuple(slice(0, size) for size in v.shape)], v), k
@@ -0,0 +1,41 @@
+import math
+import pytest
+import torch
+from types import SimpleNamespace
+
+from nanofold.train.model.diffusion_sampler import SAMPLERS
+from nanofold.train.model.diffusion_sampler import SCHEDULES
+from nanofold.train.model.diffusion_sampler import get_schedule
+from nanofold.train.util import centre
+
+
+@pytest.mark.parametrize("name", SCHEDULES.keys())
+def test_schedule(name):
+    schedule = get_schedule(name, 20, 16, 160, 4e-4, 7)
+    assert schedule.shape == (21,)
+    assert torch.isclose(schedule[0], torch.tensor(16 * 160.0))
+    assert torch.isclose(schedule[-2], torch.tensor(16 * 4e-4))
+    assert schedule[-1] == 0
+    assert torch.all(schedule[1:] < schedule[:-1])
+
+
+def test_heun_sampler_gaussian_data():
+    data_std_dev = 16
+    denoise = lambda x, t: x * data_std_dev**2 / (data_std_dev**2 + t**2)
+    schedule = get_schedule("karras", 50, data_std_dev, 160, 4e-4, 7)
+    x = schedule[0] * torch.randn(10, 3)
+    expected = centre(x) * data_std_dev / math.sqrt(data_std_dev**2 + schedule[0] ** 2)
+    x = SAMPLERS["heun"](SimpleNamespace(), denoise, x, schedule)
+    assert torch.allclose(x, expected, rtol=1e-2, atol=1e-4)
+
+
+def test_heun_sampler_deterministic():
+    denoise = lambda x, t: torch.tanh(x + torch.arange(3.0)) * 16
+    schedule = get_schedule("karras", 10, 16, 160, 4e-4, 7)
+    x = schedule[0] * torch.randn(10, 3)
+    mask = torch.arange(10) < 8
+    samples = []
+    for seed in [0, 1]:
+        torch.manual_seed(seed)
+        samples.append(SAMPLERS["heun"](SimpleNamespace(), denoise, x, schedule, mask))
+    assert torch.equal(samples[0], samples[1])
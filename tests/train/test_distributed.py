@@ -0,0 +1,53 @@
+import numpy as np
+import os
+import socket
+import torch.multiprocessing as mp
+
+from nanofold.train.chain_dataset import ChainDataset
+from nanofold.train.distributed import broadcast_object
+from nanofold.train.distributed import destroy_distributed
+from nanofold.train.distributed import get_rank
+from nanofold.train.distributed import get_world_size
+from nanofold.train.distributed import init_distributed
+from nanofold.train.distributed import reduce_metrics
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def run_rank(rank, world_size, port, features_file, results):
+    os.environ |= {
+        "MASTER_ADDR": "localhost",
+        "MASTER_PORT": str(port),
+        "RANK": str(rank),
+        "LOCAL_RANK": str(rank),
+        "WORLD_SIZE": str(world_size),
+    }
+    init_distributed("cpu")
+    np.random.seed(broadcast_object(rank + 1))
+    train_data, test_data = ChainDataset.construct_datasets(
+        features_file, 0.75, 16, 8, rank=get_rank(), world_size=get_world_size()
+    )
+    metrics = reduce_metrics({"loss": float(rank), "other": 2.0 * rank}, "cpu")
+    results[rank] = (train_data.indices.tolist(), test_data.indices.tolist(), metrics)
+    destroy_distributed()
+
+
+def test_ranks_shard_indices_and_reduce_metrics(features_file):
+    world_size = 2
+    results = mp.Manager().dict()
+    mp.spawn(
+        run_rank,
+        args=(world_size, get_free_port(), features_file, results),
+        nprocs=world_size,
+    )
+    train_indices = [results[rank][0] for rank in range(world_size)]
+    test_indices = [results[rank][1] for rank in range(world_size)]
+    assert not set(train_indices[0]) & set(train_indices[1])
+    assert sorted(sum(train_indices + test_indices, [])) == list(range(8))
+    assert len(sum(train_indices, [])) == 6
+    for rank in range(world_size):
+        assert results[rank][2] == {"loss": 0.5, "other": 1.0}
@@ -10,3 +10,17 @@ def test_diffusion_loss():
     assert torch.isclose(loss["mse_loss"], torch.zeros(1))
     assert torch.isclose(loss["lddt_loss"], torch.zeros(1))
     assert torch.isclose(loss["diffusion_loss"], torch.zeros(1))
+
+
+def test_diffusion_loss_ignores_padding():
+    x = torch.rand([2, 8, 3])
+    x_truth = torch.rand([2, 8, 3])
+    mask = torch.tensor([[True] * 8, [True] * 5 + [False] * 3])
+    x[1, 5:] = 100.0
+    loss = compute_diffusion_loss(x, x_truth, t=1.0, data_std_dev=16, mask=mask)
+    expected = [
+        compute_diffusion_loss(x[0], x_truth[0], t=1.0, data_std_dev=16),
+        compute_diffusion_loss(x[1, :5], x_truth[1, :5], t=1.0, data_std_dev=16),
+    ]
+    for k in loss.keys():
+        assert torch.isclose(loss[k], (expected[0][k] + expected[1][k]) / 2)
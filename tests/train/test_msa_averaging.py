@@ -0,0 +1,26 @@
+import torch
+import torch.nn.functional as F
+
+from nanofold.train.model.msa_averaging import MSAPairWeightedAveraging
+
+
+def test_msa_pair_weighted_averaging():
+    model = MSAPairWeightedAveraging(4, 5, 3, 2)
+    msa_rep = torch.rand([2, 6, 13, 4])
+    pair_rep = torch.rand([2, 13, 13, 3])
+    result = model(msa_rep, pair_rep)
+
+    normed = model.layer_norm_msa(msa_rep)
+    w = F.softmax(model.bias(pair_rep), dim=-2)
+    o = torch.einsum("...sihc,...ijh,...sjhc->...sihc", model.gate(normed), w, model.value(normed))
+    assert torch.allclose(result, model.proj(o.flatten(start_dim=-2)), atol=1e-6)
+
+
+def test_msa_pair_weighted_averaging_chunked_matches_unchunked():
+    model = MSAPairWeightedAveraging(4, 5, 3, 2)
+    msa_rep = torch.rand([2, 6, 13, 4])
+    pair_rep = torch.rand([2, 13, 13, 3])
+    mask = torch.arange(13) < 11
+    expected = model(msa_rep, pair_rep, mask)
+    model.chunk_size = 4
+    assert torch.allclose(model(msa_rep, pair_rep, mask), expected, atol=1e-6)
@@ -0,0 +1,106 @@
+import pytest
+import torch
+
+from nanofold.train.model import Nanofold
+
+
+def test_detach_recycling_matches_forward(params, batch):
+    params = params | {"num_recycle": 3}
+    out = {}
+    for detach_recycling in [False, True]:
+        torch.manual_seed(0)
+        model = Nanofold.from_config(params | {"detach_recycling": detach_recycling})
+        torch.manual_seed(1)
+        out[detach_recycling] = model(batch)
+        out[detach_recycling]["total_loss"].backward()
+    for k in out[False].keys():
+        assert torch.allclose(out[False][k], out[True][k], rtol=1e-3), k
+
+
+def get_trunk_gradients(params, batch, detach_calls=None):
+    torch.manual_seed(0)
+    model = Nanofold.from_config(params)
+    outputs = []
+
+    def hook(module, args, output):
+        outputs.append(output)
+        if detach_calls is not None and len(outputs) <= detach_calls:
+            return tuple(o.detach() for o in output)
+
+    model.nanofold_trunk.register_forward_hook(hook)
+    torch.manual_seed(1)
+    model(batch)["total_loss"].backward()
+    gradients = [p.grad for p in model.nanofold_trunk.parameters() if p.grad is not None]
+    return outputs, gradients
+
+
+def test_detach_recycling_gradients(params, batch):
+    params = params | {"num_recycle": 3, "use_grad_checkpoint": False}
+    outputs, gradients = get_trunk_gradients(params | {"detach_recycling": True}, batch)
+    assert len(outputs) > 1
+    assert not any(o.requires_grad for output in outputs[:-1] for o in output)
+    assert all(o.requires_grad for o in outputs[-1])
+
+    _, expected = get_trunk_gradients(params, batch, detach_calls=len(outputs) - 1)
+    _, full = get_trunk_gradients(params, batch)
+    assert len(gradients) == len(expected) == len(full)
+    gradients, expected, full = [
+        torch.cat([g.flatten() for g in gs]) for gs in [gradients, expected, full]
+    ]
+    assert (gradients - expected).norm() < 1e-2 * gradients.norm()
+    assert (gradients - full).norm() > 0.5 * gradients.norm()
+
+
+@pytest.mark.parametrize("sampler", ["edm", "heun"])
+def test_step_invariant_cache_matches_sampling(params, batch, sampler):
+    torch.manual_seed(0)
+    model = Nanofold(**Nanofold.get_args(params | {"diffusion_sampler": sampler}), inference=True)
+    model.eval()
+    with torch.no_grad():
+        input, single_rep, pair_rep = model.run_trunk(batch)
+    out = {}
+    for cache_step_invariant in [False, True]:
+        model.diffusion_model.cache_step_invariant = cache_step_invariant
+        torch.manual_seed(1)
+        out[cache_step_invariant] = model.diffusion_model(batch, input, single_rep, pair_rep)
+    assert torch.allclose(out[False], out[True], atol=1e-4)
+
+
+def test_sample_diffusion_num_samples(params, batch):
+    torch.manual_seed(0)
+    model = Nanofold(**Nanofold.get_args(params), inference=True)
+    model.eval()
+    with torch.no_grad():
+        input, single_rep, pair_rep = model.run_trunk(batch)
+        diffusion_model = model.diffusion_model
+        samples = diffusion_model(batch, input, single_rep, pair_rep, num_samples=3)
+        assert samples.shape == (3, *batch["coords_truth"].shape)
+        assert not torch.allclose(samples[0], samples[1])
+
+        x_noisy = 10 * torch.randn(3, *batch["coords_truth"].shape)
+        t = diffusion_model.schedule[2]
+        torch.manual_seed(1)
+        denoised = diffusion_model.diffusion(x_noisy, t, batch, input, single_rep, pair_rep)
+        for i in range(3):
+            torch.manual_seed(1)
+            x = diffusion_model.diffusion(x_noisy[i : i + 1], t, batch, input, single_rep, pair_rep)
+            assert torch.allclose(denoised[i], x[0], atol=1e-4)
+
+
+@pytest.mark.parametrize("micro_batch_size", [1, 2])
+def test_diffusion_micro_batch_matches_full_batch(params, batch, micro_batch_size):
+    out = {}
+    grads = {}
+    for size in [None, micro_batch_size]:
+        torch.manual_seed(0)
+        model = Nanofold.from_config(params | {"diffusion_micro_batch_size": size})
+        torch.manual_seed(1)
+        out[size] = model(batch)
+        out[size]["total_loss"].backward()
+        grads[size] = {n: p.grad for n, p in model.named_parameters() if p.grad is not None}
+    for k in out[None].keys():
+        assert torch.allclose(out[None][k], out[micro_batch_size][k], rtol=1e-4), k
+    assert grads[None].keys() == grads[micro_batch_size].keys()
+    for n, grad in grads[None].items():
+        atol = 1e-3 * grad.abs().max().item() + 1e-6
+        assert torch.allclose(grad, grads[micro_batch_size][n], atol=atol), n
@@ -31,3 +31,26 @@ def test_outer_product_mean():
                         o.append(torch.stack(prod).mean())
                 o = torch.stack(o)
                 assert torch.allclose(result[x, i, j], model.projection(o), atol=1e-3)
+
+
+def test_outer_product_mean_ignores_padding():
+    num_msa = 4
+    num_res = 12
+    model = outer_product_mean.OuterProductMean(3, 4, 5)
+    msa_rep = torch.rand([num_msa + 2, num_res + 4, 4])
+    msa_mask = (torch.arange(num_msa + 2) < num_msa).unsqueeze(-1)
+    residue_mask = torch.arange(num_res + 4) < num_res
+    result = model(msa_rep, msa_mask & residue_mask)[:num_res, :num_res]
+    expected = model(msa_rep[:num_msa, :num_res])
+    assert torch.allclose(result, expected, atol=1e-5)
+
+
+def test_outer_product_mean_chunked_matches_unchunked():
+    model = outer_product_mean.OuterProductMean(3, 4, 5)
+    msa_rep = torch.rand([2, 6, 13, 4])
+    mask = (torch.arange(6) < 5).unsqueeze(-1) & (torch.arange(13) < 11)
+    for m in [None, mask]:
+        model.chunk_size = None
+        expected = model(msa_rep, m)
+        model.chunk_size = 4
+        assert torch.allclose(model(msa_rep, m), expected, atol=1e-6)
@@ -72,3 +72,32 @@ def test_triangle_attention_ending_node():
                     out.append(gate * sum)
                 out = torch.stack(out).reshape(-1)
                 torch.allclose(result[x, i, j], model.out_proj(out), atol=1e-3)
+
+
+def test_triangle_attention_ignores_padding():
+    num_res = 12
+    num_padded = 16
+    for cls in [
+        triangular_attention.TriangleAttentionStartingNode,
+        triangular_attention.TriangleAttentionEndingNode,
+    ]:
+        model = cls(3, 2, 4)
+        pair_rep = torch.rand([num_padded, num_padded, 3])
+        mask = torch.arange(num_padded) < num_res
+        result = model(pair_rep, mask)[:num_res, :num_res]
+        expected = model(pair_rep[:num_res, :num_res])
+        assert torch.allclose(result, expected, atol=1e-5)
+
+
+def test_triangle_attention_chunked_matches_unchunked():
+    num_res = 13
+    mask = torch.arange(num_res) < 11
+    for cls in [
+        triangular_attention.TriangleAttentionStartingNode,
+        triangular_attention.TriangleAttentionEndingNode,
+    ]:
+        model = cls(3, 2, 4)
+        pair_rep = torch.rand([2, num_res, num_res, 3])
+        expected = model(pair_rep, mask)
+        model.chunk_size = 4
+        assert torch.allclose(model(pair_rep, mask), expected, atol=1e-6)
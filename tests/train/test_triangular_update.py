@@ -48,3 +48,32 @@ def test_triangle_multiplication_incoming():
                 update = model.update_transition(sum)
                 gate = model.gate(pair_rep[x, i, j])
                 assert torch.allclose(result[x, i, j], gate * update, atol=1e-3)
+
+
+def test_triangle_multiplication_ignores_padding():
+    num_res = 12
+    num_padded = 16
+    for cls in [
+        triangular_update.TriangleMultiplicationOutgoing,
+        triangular_update.TriangleMultiplicationIncoming,
+    ]:
+        model = cls(3, 4)
+        pair_rep = torch.rand([num_padded, num_padded, 3])
+        mask = torch.arange(num_padded) < num_res
+        result = model(pair_rep, mask)[:num_res, :num_res]
+        expected = model(pair_rep[:num_res, :num_res])
+        assert torch.allclose(result, expected, atol=1e-5)
+
+
+def test_triangle_multiplication_chunked_matches_unchunked():
+    num_res = 13
+    mask = torch.arange(num_res) < 11
+    for cls in [
+        triangular_update.TriangleMultiplicationOutgoing,
+        triangular_update.TriangleMultiplicationIncoming,
+    ]:
+        model = cls(3, 4)
+        pair_rep = torch.rand([2, num_res, num_res, 3])
+        expected = model(pair_rep, mask)
+        model.chunk_size = 4
+        assert torch.allclose(model(pair_rep, mask), expected, atol=1e-6)